@@ -0,0 +1,1239 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the No-Smoking Detection System
+Run on the target device with the same model files the service uses, e.g.:
+    python benchmark.py multicam --cameras 3 --workers 2 --weights 2,1,1 --duration 30
+    python benchmark.py cascade --frames 300
+    python benchmark.py models --dataset samples/ --threads 4
+    python benchmark.py tiles --model cigarette-yolov8n-int8 --budget 150
+    python benchmark.py soak --duration 14400 --speed 10
+    python benchmark.py jpeg --frames 50
+    python benchmark.py forward --events 1000 --batch-sizes 1,20,100
+    python benchmark.py fleet --nodes 300 --duration 120
+    python benchmark.py offload --server 192.168.1.20:7071 --cameras 2
+"""
+
+import argparse
+import contextlib
+import heapq
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import socketserver
+import struct
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+import event_forwarding as fwd
+import fleet_aggregator as fa
+import inference_server as srv
+import smoking_detector_with_sh1106 as sd
+from framing import recv_exactly
+
+
+# ==================== HELPERS ====================
+
+def synthetic_frames(count=8, size=sd.CAMERA_RESOLUTION, seed=0):
+    """Noisy frames with moving orange tips and white bodies so every detector does real work"""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    background = rng.integers(0, 60, (height, width, 3), dtype=np.uint8)
+    frames = []
+    for i in range(count):
+        frame = background.copy()
+        for j in range(4):
+            x = int(20 + (j * 97 + i * 11) % (width - 80))
+            y = int(20 + (j * 53 + i * 7) % (height - 40))
+            cv2.circle(frame, (x, y), 5, (0, 100, 255), -1)
+            cv2.rectangle(frame, (x + 6, y - 3), (x + 46, y + 3), (230, 230, 230), -1)
+        frames.append(frame)
+    return frames
+
+def rss_mb(pid=None):
+    """Resident set size of a process in MB (Linux /proc)"""
+    try:
+        with open(f"/proc/{pid or 'self'}/status") as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+def percentile(values, pct):
+    """Percentile of a list of numbers (0 for an empty list)"""
+    return float(np.percentile(values, pct)) if values else 0.0
+
+
+# ==================== MULTI-CAMERA ====================
+
+class BenchCamera:
+    """Stand-in camera pipeline: runs detection only, no annotation/alerts/disk"""
+
+    def __init__(self, engine, name, weight):
+        self.engine = engine
+        self.name = name
+        self.weight = weight
+        self.processed = 0
+        self.latencies = []
+
+    def process_frame(self, frame, stamp=None):
+        start = time.time()
+        self.engine.detect_all(frame, camera=self.name)
+        self.latencies.append((time.time() - start) * 1000)
+        self.processed += 1
+
+    def release_frame(self, frame):
+        pass  # Synthetic frames are shared, nothing to return
+
+def _feed_camera(pool, camera, frames, stop_event, interval):
+    """Submit frames to the pool like a capture thread would"""
+    i = 0
+    while not stop_event.is_set():
+        pool.submit(camera, frames[i % len(frames)])
+        i += 1
+        time.sleep(interval or 0.005)  # Never spin: a saturated pool just drops frames
+
+def bench_shared_pool(num_cameras, workers, weights, duration, interval, engine=None):
+    """One process, one model, a shared worker pool"""
+    engine = engine or sd.DetectionEngine()
+    pool = sd.DetectionWorkerPool(workers)
+    cameras = [BenchCamera(engine, f"cam{i}", weights[i]) for i in range(num_cameras)]
+    frames = synthetic_frames()
+
+    stop_event = threading.Event()
+    pool.start()
+    feeders = [threading.Thread(target=_feed_camera,
+                                args=(pool, cam, frames, stop_event, interval), daemon=True)
+               for cam in cameras]
+    for t in feeders:
+        t.start()
+    time.sleep(duration)
+    stop_event.set()
+    pool.stop()
+
+    stats = pool.get_stats()['cameras']
+    return {
+        'fps': sum(cam.processed for cam in cameras) / duration,
+        'per_camera': {cam.name: {'fps': cam.processed / duration,
+                                  'weight': cam.weight,
+                                  'share': stats.get(cam.name, {}).get('worker_share', 0.0),
+                                  'dropped': stats.get(cam.name, {}).get('dropped', 0)}
+                       for cam in cameras},
+        'latencies': [ms for cam in cameras for ms in cam.latencies],
+        'rss_mb': rss_mb()
+    }
+
+def _separate_process(name, duration, interval, queue):
+    """One camera per process, each with its own model (the pre-multi-camera setup)"""
+    engine = sd.DetectionEngine()
+    frames = synthetic_frames()
+    processed = 0
+    end = time.time() + duration
+    while time.time() < end:
+        engine.detect_all(frames[processed % len(frames)], camera=name)
+        processed += 1
+        if interval:
+            time.sleep(interval)
+    queue.put((name, processed, rss_mb()))
+
+def bench_separate_processes(num_cameras, duration, interval):
+    """N processes, N models"""
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    procs = [ctx.Process(target=_separate_process,
+                         args=(f"cam{i}", duration, interval, queue))
+             for i in range(num_cameras)]
+    for p in procs:
+        p.start()
+    results = [queue.get() for _ in procs]
+    for p in procs:
+        p.join()
+
+    return {
+        'fps': sum(r[1] for r in results) / duration,
+        'per_camera': {r[0]: {'fps': r[1] / duration} for r in sorted(results)},
+        'rss_mb': sum(r[2] for r in results)
+    }
+
+def run_multicam(args):
+    weights = [float(w) for w in args.weights.split(',')] if args.weights else []
+    weights += [1.0] * (args.cameras - len(weights))
+
+    print(f"\n📊 Multi-camera benchmark: {args.cameras} cameras, {args.duration}s each run")
+    print(f"   Shared pool: {args.workers} workers, weights {weights[:args.cameras]}")
+
+    shared = bench_shared_pool(args.cameras, args.workers, weights, args.duration, args.interval)
+    separate = bench_separate_processes(args.cameras, args.duration, args.interval)
+
+    print("\n" + "="*60)
+    print(f"{'Mode':<24}{'Total fps':>12}{'RSS (MB)':>12}")
+    print("-"*60)
+    print(f"{'Shared pool (1 proc)':<24}{shared['fps']:>12.2f}{shared['rss_mb']:>12.1f}")
+    print(f"{'Separate processes':<24}{separate['fps']:>12.2f}{separate['rss_mb']:>12.1f}")
+    print("="*60)
+
+    print("\nShared pool per camera:")
+    total_weight = sum(weights[:args.cameras])
+    for name, s in shared['per_camera'].items():
+        print(f"  {name}: {s['fps']:.2f} fps, worker share {s['share']:.2f} "
+              f"(target {s['weight'] / total_weight:.2f}), dropped {s['dropped']}")
+    print("Separate processes per camera:")
+    for name, s in separate['per_camera'].items():
+        print(f"  {name}: {s['fps']:.2f} fps")
+
+
+# ==================== PROCESS POOL ====================
+
+def run_procpool(args):
+    counts = [int(c) for c in args.processes.split(',')]
+    frame_shape = (sd.CAMERA_RESOLUTION[1], sd.CAMERA_RESOLUTION[0], 3)
+    weights = [1.0] * args.cameras
+
+    print(f"\n📊 Detection process-pool benchmark: {args.cameras} cameras, "
+          f"{args.duration}s per run, {os.cpu_count()} CPUs")
+    rows = []
+
+    # Baseline: detectors on threads inside this process
+    r = bench_shared_pool(args.cameras, sd.DETECTION_WORKERS, weights, args.duration, 0)
+    rows.append((f"threads ({sd.DETECTION_WORKERS})", r))
+
+    for n in counts:
+        engine = sd.ProcessDetectionEngine(processes=n, slots=args.cameras + n + 1,
+                                           max_frame_shape=frame_shape)
+        time.sleep(args.warmup)  # Let the workers load their models
+        try:
+            r = bench_shared_pool(args.cameras, n, weights, args.duration, 0, engine=engine)
+        finally:
+            engine.stop()
+        rows.append((f"processes ({n})", r))
+
+    print("\n" + "="*64)
+    print(f"{'Mode':<18}{'fps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'speedup':>8}")
+    print("-"*64)
+    base = rows[0][1]['fps'] or 1.0
+    for label, r in rows:
+        lat = r['latencies']
+        print(f"{label:<18}{r['fps']:>10.2f}{percentile(lat, 50):>10.1f}"
+              f"{percentile(lat, 95):>10.1f}{percentile(lat, 99):>10.1f}{r['fps'] / base:>7.2f}x")
+    print("="*64)
+
+
+# ==================== CASCADE ====================
+
+def bench_cascade(frames, repeats, enabled):
+    """Average detect_all time and per-stage skip rates over a frame sequence"""
+    engine = sd.DetectionEngine()
+    engine.cascade = sd.DetectionCascade(enabled=enabled)
+    latencies = []
+    for i in range(repeats):
+        start = time.time()
+        engine.detect_all(frames[i % len(frames)], camera="bench")
+        latencies.append((time.time() - start) * 1000)
+    return latencies, engine.cascade.get_stats()
+
+def run_cascade(args):
+    moving = synthetic_frames()
+    static = [moving[0]] * len(moving)
+
+    print(f"\n📊 Detection cascade benchmark: {args.frames} frames per run")
+    print("\n" + "="*72)
+    print(f"{'Scene':<10}{'Cascade':<10}{'avg ms':>9}{'p95 ms':>9}{'gated':>8}  stage skip rates")
+    print("-"*72)
+    for scene, frames in (("static", static), ("moving", moving)):
+        for enabled in (False, True):
+            lat, stats = bench_cascade(frames, args.frames, enabled)
+            rates = ", ".join(f"{k} {v['skip_rate']:.0%}" for k, v in stats['stages'].items()
+                              if v['runs'] or v['skipped'])
+            gated = stats['gated_frames'] / max(stats['frames'], 1)
+            print(f"{scene:<10}{'on' if enabled else 'off':<10}{np.mean(lat):>9.1f}"
+                  f"{percentile(lat, 95):>9.1f}{gated:>8.0%}  {rates}")
+    print("="*72)
+
+
+# ==================== MODELS ====================
+
+class HsvVisualModel:
+    """The built-in HSV cigarette detector, benchmarked like a registry model"""
+
+    name = "hsv-visual"
+    task = "cigarette"
+    backend = "opencv"
+    input_size = sd.CAMERA_RESOLUTION
+    threads = 1
+
+    def __init__(self):
+        settings = dict(sd.detector_settings(sd.default_config()),
+                        person_model=None, cigarette_model=None)  # No models needed
+        self.engine = sd.DetectionEngine(settings=settings)
+
+    def score(self, frame):
+        return self.engine.score_cigarette_visual(frame)
+
+def load_dataset(path):
+    """Labelled images: <path>/labels.json maps file name -> list of tasks present,
+    e.g. {"img001.jpg": ["person", "cigarette"], "img002.jpg": []}"""
+    with open(os.path.join(path, 'labels.json')) as f:
+        labels = json.load(f)
+    samples = []
+    for filename, tasks in sorted(labels.items()):
+        frame = cv2.imread(os.path.join(path, filename))
+        if frame is not None:
+            samples.append((frame, set(tasks)))
+    return samples
+
+def bench_model(model, samples, frames, threshold):
+    """ms per frame over the timing frames, image-level accuracy over the samples"""
+    timing = [s[0] for s in samples] or synthetic_frames()
+    for frame in timing[:3]:
+        model.score(frame)  # Warm-up (lazy allocations, first-run graph setup)
+    latencies = []
+    for i in range(frames):
+        start = time.time()
+        model.score(timing[i % len(timing)])
+        latencies.append((time.time() - start) * 1000)
+
+    tp = fp = tn = fn = 0
+    for frame, tasks in samples:
+        predicted = model.score(frame)[0] >= threshold
+        actual = model.task in tasks
+        tp += predicted and actual
+        fp += predicted and not actual
+        tn += not predicted and not actual
+        fn += not predicted and actual
+    accuracy = {}
+    if samples:
+        accuracy = {
+            'accuracy': (tp + tn) / len(samples),
+            'precision': tp / (tp + fp) if tp + fp else 0.0,
+            'recall': tp / (tp + fn) if tp + fn else 0.0
+        }
+    return latencies, accuracy
+
+def run_models(args):
+    names = args.models.split(',') if args.models else list(sd.MODELS) + [HsvVisualModel.name]
+    samples = load_dataset(args.dataset) if args.dataset else []
+
+    print(f"\n📊 Model benchmark: {args.frames} timed frames, "
+          f"{len(samples) or 'no'} labelled images, {os.cpu_count()} CPUs")
+    rows = []
+    for name in names:
+        try:
+            if name == HsvVisualModel.name:
+                model = HsvVisualModel()
+            else:
+                spec = dict(sd.MODELS[name], **({'threads': args.threads} if args.threads else {}))
+                model = sd.load_detector_model(name, {name: spec})
+        except Exception as e:
+            print(f"⚠ {name}: {e}")
+            continue
+        threshold = getattr(model, 'threshold', sd.DETECTION_CONFIDENCE)
+        latencies, accuracy = bench_model(model, samples, args.frames, threshold)
+        rows.append((model, latencies, accuracy))
+
+    print("\n" + "="*96)
+    print(f"{'Model':<28}{'Task':<11}{'Backend':<13}{'Input':<9}{'Thr':>4}"
+          f"{'p50 ms':>9}{'p95 ms':>9}{'Acc':>7}{'Prec':>7}{'Rec':>7}")
+    print("-"*96)
+    for model, lat, acc in rows:
+        size = f"{model.input_size[0]}x{model.input_size[1]}"
+        scores = "".join(f"{acc[k]:>7.2f}" if acc else f"{'-':>7}"
+                         for k in ('accuracy', 'precision', 'recall'))
+        print(f"{model.name:<28}{model.task:<11}{model.backend:<13}{size:<9}{model.threads:>4}"
+              f"{percentile(lat, 50):>9.1f}{percentile(lat, 95):>9.1f}{scores}")
+    print("="*96)
+
+
+# ==================== TILING ====================
+
+def run_tiles(args):
+    name = args.model or sd.CIGARETTE_MODEL or sd.PERSON_MODEL
+    try:
+        model = sd.load_detector_model(name)
+    except Exception as e:
+        print(f"⚠ {name}: {e}")
+        return
+
+    frame = synthetic_frames(1)[0]
+    height, width = frame.shape[:2]
+    # Small regions spread over the frame, so every requested tile is distinct
+    rois = [[int(x), int(y), 12, 12] for y in np.linspace(10, height - 30, 3)
+            for x in np.linspace(10, width - 30, 4)]
+
+    print(f"\n📊 Tiling benchmark: {name} ({model.backend}, input "
+          f"{model.input_size[0]}x{model.input_size[1]}, zoom {sd.TILE_ZOOM}x), "
+          f"budget {args.budget} ms")
+    print("\n" + "="*62)
+    print(f"{'Tiles':>6}{'batched p50':>14}{'p95':>8}{'looped p50':>13}{'p95':>8}{'fits':>8}")
+    print("-"*62)
+    best = 0
+    for count in range(args.max_tiles + 1):
+        tiles = model.plan_tiles(rois, width, height, limit=count)
+        timings = {}
+        for mode in ('batched', 'looped'):
+            if mode == 'looped':
+                model.batching = False
+            latencies = []
+            for i in range(args.frames + 2):
+                start = time.time()
+                model.detect(frame, tiles=tiles)
+                if i >= 2:  # Skip warm-up runs
+                    latencies.append((time.time() - start) * 1000)
+            timings[mode] = latencies
+            model.batching = True
+        p95 = percentile(timings['batched'], 95)
+        fits = p95 <= args.budget
+        if fits:
+            best = len(tiles)
+        print(f"{len(tiles):>6}{percentile(timings['batched'], 50):>14.1f}{p95:>8.1f}"
+              f"{percentile(timings['looped'], 50):>13.1f}"
+              f"{percentile(timings['looped'], 95):>8.1f}{'yes' if fits else 'no':>8}")
+    print("="*62)
+    print(f"Largest tile count within {args.budget} ms (p95): {best} "
+          f"-> set TILE_MAX = {best}, TILE_BUDGET_MS = {args.budget}")
+
+# ==================== SOAK TEST ====================
+
+class FakeGPIO:
+    """RPi.GPIO stand-in: remembers pin levels, the smoke input reads LOW"""
+
+    BCM = 'BCM'
+    IN = 'in'
+    OUT = 'out'
+    LOW = 0
+    HIGH = 1
+
+    def __init__(self):
+        self.pins = {}
+        self.writes = 0
+
+    def setmode(self, mode):
+        pass
+
+    def setup(self, pin, direction):
+        self.pins[pin] = self.LOW
+
+    def output(self, pin, value):
+        self.pins[pin] = value
+        self.writes += 1
+
+    def input(self, pin):
+        return self.pins.get(pin, self.LOW)
+
+    def cleanup(self):
+        self.pins.clear()
+
+class FakeOLEDDevice:
+    """luma sh1106 stand-in: keeps the last image it was sent"""
+
+    def __init__(self, serial=None):
+        self.image = None
+        self.frames = 0
+
+    def clear(self):
+        self.image = None
+
+    def display(self, image):
+        self.image = image
+        self.frames += 1
+
+# Metric -> (label, noise floor). A metric only fails when it rises faster than its
+# limit AND by more than the floor over the measured window, so short runs do not
+# fail on allocator noise or a thread that happened to be alive at the last sample.
+SOAK_METRICS = {
+    'heap_mb': ("tracemalloc (MB)", 1.0),
+    'rss_mb': ("RSS (MB)", 4.0),
+    'threads': ("Threads", 2),
+    'fds': ("Open fds", 2),
+    'detect_ms': ("Detect (ms)", 5.0),
+    'wait_ms': ("Pool wait (ms)", 10.0),
+}
+
+def open_fds():
+    """Open file descriptors of this process (Linux /proc)"""
+    try:
+        return len(os.listdir('/proc/self/fd'))
+    except OSError:
+        return 0
+
+def _pool_totals(system):
+    """(frames, detect seconds, wait seconds) summed over cameras"""
+    frames = detect = wait = 0.0
+    for s in system.pool.get_stats()['cameras'].values():
+        frames += s['processed']
+        detect += s['avg_detect_ms'] * s['processed'] / 1000
+        wait += s['avg_wait_ms'] * s['processed'] / 1000
+    return frames, detect, wait
+
+def _soak_viewer(system, stop_event, frames_per_visit):
+    """A browser that keeps opening a camera stream, watching a few frames and leaving"""
+    client = sd.app.test_client()
+    names = list(system.cameras)
+    visit = 0
+    while not stop_event.is_set():
+        response = client.get(f"/video_feed/{names[visit % len(names)]}", buffered=False)
+        parts = iter(response.response)
+        for _ in range(frames_per_visit):
+            if stop_event.is_set() or next(parts, None) is None:
+                break
+        response.close()  # Closes the generate_frames() generator, like a disconnect
+        client.get('/api/stats')
+        visit += 1
+
+def soak_trend(samples, key, start):
+    """Least-squares slope of a metric per device hour, and its rise over the window"""
+    window = [s for s in samples if s['t'] >= start]
+    if len(window) < 3:
+        return 0.0, 0.0
+    t = np.array([s['device_h'] for s in window])
+    values = np.array([s[key] for s in window], dtype=float)
+    slope = float(np.polyfit(t, values, 1)[0]) if np.ptp(t) > 0 else 0.0
+    return slope, slope * float(np.ptp(t))
+
+def run_soak(args):
+    limits = {'heap_mb': args.max_heap_mb, 'rss_mb': args.max_rss_mb,
+              'threads': args.max_threads, 'fds': args.max_fds,
+              'detect_ms': args.max_latency_ms, 'wait_ms': args.max_latency_ms}
+    workdir = tempfile.mkdtemp(prefix="soak-")
+
+    # Fake hardware and a sandbox for everything the system writes
+    sd.GPIO = FakeGPIO()
+    sd.i2c = lambda port=1, address=sd.OLED_ADDRESS: None
+    sd.sh1106 = FakeOLEDDevice
+    sd.ENABLE_OLED = True
+    sd.CONFIG_FILE = os.path.join(workdir, "config.json")
+    sd.EVENT_LOG_DIR = os.path.join(workdir, "events")
+    # Accelerated time: the capture and stream loops sleep speed times less
+    sd.CAPTURE_INTERVAL /= args.speed
+    sd.SKIP_INTERVAL /= args.speed
+    sd.STREAM_INTERVAL /= args.speed
+
+    tracemalloc.start()
+    system = sd.SmokingDetectionSystem(
+        save_dir=os.path.join(workdir, "violations"),
+        alert_cooldown=max(30 / args.speed, 0.1),
+        max_storage_mb=20, max_images=50,
+        cameras=[{"name": f"soak{i}", "source": "synthetic"} for i in range(args.cameras)]
+    )
+    sd.detector = system
+    detection = threading.Thread(target=system.run_detection, daemon=True)
+    detection.start()
+    stop_event = threading.Event()
+    viewers = [threading.Thread(target=_soak_viewer, args=(system, stop_event, args.stream_frames),
+                                daemon=True)
+               for _ in range(args.viewers)]
+    for t in viewers:
+        t.start()
+
+    print(f"\n📊 Soak test: {args.cameras} synthetic cameras, {args.viewers} stream viewers, "
+          f"{args.duration:.0f}s at {args.speed}x ({args.duration * args.speed / 3600:.1f} device hours)")
+    samples = []
+    baseline = None
+    start = time.time()
+    last = (start, 0.0, 0.0, 0.0)
+    try:
+        while time.time() - start < args.duration:
+            time.sleep(args.interval)
+            now = time.time()
+            frames, detect, wait = _pool_totals(system)
+            done = frames - last[1]
+            sample = {
+                't': now - start,
+                'device_h': (now - start) * args.speed / 3600,
+                'heap_mb': tracemalloc.get_traced_memory()[0] / 1048576,
+                'rss_mb': rss_mb(),
+                'threads': threading.active_count(),
+                'fds': open_fds(),
+                'detect_ms': (detect - last[2]) / done * 1000 if done else 0.0,
+                'wait_ms': (wait - last[3]) / done * 1000 if done else 0.0,
+                'fps': done / (now - last[0]),
+                'streams': system.stream_clients,
+            }
+            sample.update({f"{stage}_ms": s['avg_ms'] for stage, s in
+                           system.engine.get_stats()['cascade']['stages'].items()})
+            samples.append(sample)
+            last = (now, frames, detect, wait)
+            if baseline is None and sample['t'] >= args.warmup:
+                baseline = tracemalloc.take_snapshot()
+            if args.verbose:
+                print(f"  {sample['t']:7.0f}s  heap {sample['heap_mb']:6.1f} MB  "
+                      f"rss {sample['rss_mb']:6.1f} MB  threads {sample['threads']:3d}  "
+                      f"fds {sample['fds']:3d}  detect {sample['detect_ms']:6.1f} ms  "
+                      f"{sample['fps']:5.1f} fps")
+    finally:
+        stop_event.set()
+        for t in viewers:
+            t.join(timeout=5)
+        final = tracemalloc.take_snapshot()
+        system.stop()
+        detection.join(timeout=10)
+        tracemalloc.stop()
+
+    if args.csv:
+        keys = sorted({k for s in samples for k in s})
+        with open(args.csv, 'w') as f:
+            f.write(','.join(keys) + '\n')
+            for s in samples:
+                f.write(','.join(f"{s.get(k, '')}" for k in keys) + '\n')
+
+    failures = []
+    print("\n" + "="*78)
+    print(f"{'Metric':<18}{'first':>9}{'last':>9}{'slope/dev-h':>13}{'limit':>9}"
+          f"{'rise':>9}{'floor':>7}  result")
+    print("-"*78)
+    for key, (label, floor) in SOAK_METRICS.items():
+        slope, rise = soak_trend(samples, key, args.warmup)
+        window = [s[key] for s in samples if s['t'] >= args.warmup] or [0.0]
+        failed = slope > limits[key] and rise > floor
+        if failed:
+            failures.append(label)
+        print(f"{label:<18}{window[0]:>9.1f}{window[-1]:>9.1f}{slope:>13.2f}{limits[key]:>9.2f}"
+              f"{rise:>9.1f}{floor:>7}  {'FAIL' if failed else 'ok'}")
+    print("="*78)
+
+    # Every viewer has left and the system is stopped: no stream may still be open
+    if system.stream_clients:
+        failures.append("stream generators")
+        print(f"❌ {system.stream_clients} generate_frames() stream(s) still open after shutdown")
+    fps = [s['fps'] for s in samples if s['t'] >= args.warmup]
+    print(f"Frames detected: {int(_pool_totals(system)[0])} "
+          f"({np.mean(fps) if fps else 0:.1f} fps), violations: {system.total_violations}, "
+          f"OLED frames: {getattr(system.oled.device, 'frames', 0)}, "
+          f"GPIO writes: {sd.GPIO.writes}")
+
+    if failures and baseline is not None:
+        print("\nLargest allocation growth since warm-up (tracemalloc):")
+        for stat in final.compare_to(baseline, 'lineno')[:10]:
+            print(f"  {stat}")
+
+    if args.keep:
+        print(f"Output kept in {workdir}")
+    else:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if failures:
+        print(f"\n❌ Soak test failed: {', '.join(failures)} trending upward")
+        sys.exit(1)
+    print("\n✓ Soak test passed: no upward trends")
+
+
+# ==================== JPEG ENCODERS ====================
+
+def run_jpeg(args):
+    size = tuple(int(v) for v in args.size.split('x')) if args.size else sd.CAMERA_RESOLUTION
+    frame = synthetic_frames(1, size)[0]
+    qualities = [int(q) for q in args.quality.split(',')]
+
+    print(f"\n📊 JPEG encoder benchmark: {size[0]}x{size[1]}, {args.frames} encodes per row")
+    print("\n" + "="*66)
+    print(f"{'Backend':<12}{'Sampling':>10}{'Fast DCT':>10}{'Quality':>9}{'p50 ms':>9}{'p95 ms':>9}{'KB':>7}")
+    print("-"*66)
+    best = {}
+    for subsampling in ("444", "422", "420"):
+        for fast_dct in (False, True):
+            encoders = sd.available_jpeg_encoders(subsampling, fast_dct)
+            for name, encoder in encoders.items():
+                if fast_dct and not encoder.supports_fast_dct:
+                    continue
+                for quality in qualities:
+                    data = encoder.encode(frame, quality)
+                    timings = []
+                    for _ in range(args.frames):
+                        start = time.time()
+                        encoder.encode(frame, quality)
+                        timings.append((time.time() - start) * 1000)
+                    p50 = percentile(timings, 50)
+                    key = (subsampling, fast_dct, quality)
+                    if key not in best or p50 < best[key][1]:
+                        best[key] = (name, p50)
+                    print(f"{name:<12}{subsampling:>10}{'on' if fast_dct else 'off':>10}{quality:>9}"
+                          f"{p50:>9.2f}{percentile(timings, 95):>9.2f}{len(data) / 1024:>7.1f}")
+    print("="*66)
+    key = (sd.JPEG_SUBSAMPLING, sd.JPEG_FAST_DCT, sd.STREAM_JPEG_QUALITY)
+    if key not in best:
+        key = (sd.JPEG_SUBSAMPLING, False, sd.STREAM_JPEG_QUALITY)  # No fast-DCT backend installed
+    if key in best:
+        print(f"Fastest with the current settings ({sd.JPEG_SUBSAMPLING}, fast DCT "
+              f"{'on' if sd.JPEG_FAST_DCT else 'off'}, quality {sd.STREAM_JPEG_QUALITY}): "
+              f"{best[key][0]} -> JPEG_ENCODER = \"{best[key][0]}\" skips the startup benchmark")
+
+
+# ==================== EVENT FORWARDING ====================
+
+class StandInReceiver:
+    """Event ids received by a stand-in server; down=True simulates an outage"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ids = []
+        self.requests = 0
+        self.down = False
+
+    def record(self, events):
+        with self.lock:
+            self.ids.extend(e['id'] for e in events)
+            self.requests += 1
+
+    def received(self):
+        with self.lock:
+            return list(self.ids)
+
+class StandInWebhook(BaseHTTPRequestHandler):
+    """Webhook receiver: 200 with the events recorded, 503 while down"""
+    protocol_version = "HTTP/1.1"  # Keep-alive, like a real receiver
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        receiver = self.server.receiver
+        status = 503 if receiver.down else 200
+        if status == 200:
+            receiver.record(json.loads(body)['events'])
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+class StandInBroker(socketserver.BaseRequestHandler):
+    """MQTT 3.1.1 broker subset: CONNACK, PUBACK for QoS 1, PINGRESP; drops clients while down"""
+
+    def _packet(self):
+        kind = recv_exactly(self.request, 1, "client")[0]
+        length, shift = 0, 0
+        while True:
+            byte = recv_exactly(self.request, 1, "client")[0]
+            length |= (byte & 0x7f) << shift
+            shift += 7
+            if not byte & 0x80:
+                break
+        return kind, recv_exactly(self.request, length, "client")
+
+    def handle(self):
+        receiver = self.server.receiver
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # As real brokers do
+        try:
+            while not receiver.down:
+                kind, body = self._packet()
+                if receiver.down:
+                    break
+                if kind >> 4 == 1:
+                    self.request.sendall(b'\x20\x02\x00\x00')
+                elif kind >> 4 == 3:
+                    topic_len = struct.unpack('>H', body[:2])[0]
+                    packet_id = body[2 + topic_len:4 + topic_len]
+                    receiver.record([json.loads(body[4 + topic_len:])])
+                    self.request.sendall(b'\x40\x02' + packet_id)
+                elif kind >> 4 == 12:
+                    self.request.sendall(b'\xd0\x00')
+                elif kind >> 4 == 14:
+                    break
+        except (ConnectionError, OSError):
+            pass
+
+def start_stand_in(kind):
+    """(server, receiver, sink config) for a stand-in on a free local port"""
+    receiver = StandInReceiver()
+    if kind == 'webhook':
+        server = ThreadingHTTPServer(('127.0.0.1', 0), StandInWebhook)
+    else:
+        server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), StandInBroker)
+    server.daemon_threads = True
+    server.receiver = receiver
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+    config = ({'name': kind, 'type': 'webhook', 'url': f"http://127.0.0.1:{port}/events"}
+              if kind == 'webhook' else
+              {'name': kind, 'type': 'mqtt', 'host': '127.0.0.1', 'port': port})
+    return server, receiver, config
+
+def _forward_events(forwarder, count, thumbnail):
+    """Put a burst of violation-like events; returns microseconds per put()"""
+    start = time.perf_counter()
+    for i in range(count):
+        forwarder.put({'camera': f"cam{i % 2}", 'timestamp': datetime_now_iso(),
+                       'detection_types': ['CIGARETTE'], 'sensor': False, 'motion': True,
+                       'visual': True, 'boxes': [[10, 20, 30, 8]],
+                       'image': f"cam{i % 2}/{i:06d}.jpg"}, thumbnail)
+    return (time.perf_counter() - start) * 1e6 / max(1, count)
+
+def datetime_now_iso(timespec='seconds'):
+    return datetime.now().isoformat(timespec=timespec)
+
+def bench_forward(kind, scenario, batch_size, args, thumbnail):
+    """One scenario against a fresh stand-in; returns a result row"""
+    workdir = tempfile.mkdtemp(prefix="forward-bench-")
+    server, receiver, config = start_stand_in(kind)
+    options = dict(directory=workdir, batch_size=batch_size, batch_latency=args.latency,
+                   backoff_min=args.backoff_min, backoff_max=args.backoff_max, timeout=5.0)
+    try:
+        receiver.down = scenario != 'burst'
+        forwarder = fwd.EventForwarder([config], **options)
+        start = time.time()
+        put_us = _forward_events(forwarder, args.events, thumbnail)
+        if scenario == 'outage':
+            time.sleep(args.outage)  # Events pile up on disk, retries back off
+            receiver.down = False
+        elif scenario == 'restart':
+            time.sleep(0.5)
+            forwarder.close()  # Undelivered events stay in the disk queue
+            receiver.down = False
+            forwarder = fwd.EventForwarder([config], **options)
+        recovered = time.time()
+        drained = forwarder.drain(args.timeout)
+        end = time.time()
+        stats = forwarder.get_stats()['sinks'][0]
+        forwarder.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    ids = receiver.received()
+    return {
+        'sink': kind, 'scenario': scenario, 'batch': batch_size, 'events': args.events,
+        'delivered': len(set(ids)), 'duplicates': len(ids) - len(set(ids)),
+        'put_us': put_us, 'drain_s': end - recovered,
+        'rate': len(set(ids)) / max(1e-6, end - (start if scenario == 'burst' else recovered)),
+        'batch_ms': stats['avg_batch_ms'], 'failed': stats['failed_attempts'],
+        'ok': drained and len(set(ids)) == args.events
+    }
+
+def run_forward(args):
+    frame = synthetic_frames(1)[0]
+    thumb = cv2.resize(frame, (sd.THUMBNAIL_WIDTH, frame.shape[0] * sd.THUMBNAIL_WIDTH // frame.shape[1]))
+    thumbnail = cv2.imencode('.jpg', thumb, [cv2.IMWRITE_JPEG_QUALITY, 70])[1].tobytes()
+    sinks = args.sinks.split(',')
+    batch_sizes = [int(b) for b in args.batch_sizes.split(',')]
+
+    print(f"\n📊 Event forwarding: {args.events} events per run with {len(thumbnail) / 1024:.1f} KB "
+          f"thumbnails, batch latency {args.latency}s, stand-in receivers on 127.0.0.1")
+    print("\n" + "="*94)
+    print(f"{'Sink':<9}{'Scenario':<10}{'Batch':>6}{'Delivered':>11}{'Dups':>6}{'put us':>8}"
+          f"{'Drain s':>9}{'Events/s':>10}{'Batch ms':>10}{'Retries':>9}  Result")
+    print("-"*94)
+    failed = False
+    for kind in sinks:
+        rows = [(kind, 'burst', b) for b in batch_sizes]
+        rows += [(kind, 'outage', fwd.FORWARD_BATCH_SIZE), (kind, 'restart', fwd.FORWARD_BATCH_SIZE)]
+        for row in rows:
+            r = bench_forward(*row, args, thumbnail)
+            failed |= not r['ok']
+            print(f"{r['sink']:<9}{r['scenario']:<10}{r['batch']:>6}{r['delivered']:>11}"
+                  f"{r['duplicates']:>6}{r['put_us']:>8.1f}{r['drain_s']:>9.2f}{r['rate']:>10.0f}"
+                  f"{r['batch_ms']:>10.1f}{r['failed']:>9}  {'✓' if r['ok'] else '❌ lost events'}")
+    print("="*94)
+    print("put us: cost on the detection thread. Outage/restart rows: events/s after the receiver "
+          "came back (includes the pending backoff).")
+    if failed:
+        sys.exit(1)
+
+
+# ==================== FLEET ====================
+
+def _fleet_metrics(rng):
+    """Plausible live values for a simulated node"""
+    start = time.time()
+    violations = [0]
+
+    def metrics():
+        return {'uptime_s': time.time() - start, 'cpu_temp_c': rng.uniform(45, 70),
+                'rss_mb': rng.uniform(150, 260), 'memory_level': 0, 'cameras': 2,
+                'fps': rng.uniform(4, 6), 'detect_ms': rng.uniform(60, 120),
+                'queue_ms': rng.uniform(0, 30), 'violations': violations[0]}
+    return metrics
+
+def _fleet_online(store):
+    return sum(n['online'] for n in store.nodes())
+
+def run_fleet(args):
+    rng = np.random.default_rng(0)
+    workdir = tempfile.mkdtemp(prefix="fleet-bench-")
+    store = fa.FleetStore(os.path.join(workdir, 'fleet.db'))
+    server = fa.start_ingest(store, '127.0.0.1', 0)
+    port = server.server_address[1]
+    out = sys.stdout
+    log = io.StringIO()  # Per-node connect/retry messages (shown with --verbose)
+
+    print(f"\n📊 Fleet load test: {args.nodes} nodes on 127.0.0.1:{port}, "
+          f"{args.rate} violations/node/min, metrics every {args.interval}s, {args.duration:.0f}s "
+          f"with a {args.outage:.0f}s aggregator outage at {args.duration / 3:.0f}s")
+    with contextlib.redirect_stdout(log if not args.verbose else out):
+        nodes = []
+        for i in range(args.nodes):
+            config = {'name': 'fleet', 'type': 'fleet', 'host': '127.0.0.1', 'port': port,
+                      'node': f"node{i:03d}", 'interval': args.interval}
+            nodes.append(fwd.EventForwarder(
+                [config], directory=os.path.join(workdir, f"node{i:03d}"), batch_size=args.batch,
+                batch_latency=args.latency, backoff_min=0.5, backoff_max=args.backoff_max,
+                timeout=10.0, metrics=_fleet_metrics(np.random.default_rng(i))))
+
+        # One driver thread emits every node's violations as Poisson arrivals
+        schedule = [(time.time() + rng.exponential(60.0 / args.rate), i) for i in range(args.nodes)]
+        heapq.heapify(schedule)
+        start = time.time()
+        sent = 0
+        outage_at = start + args.duration / 3
+        outage = None
+        samples = []
+        next_sample = start
+        while time.time() < start + args.duration:
+            now = time.time()
+            if outage is None and now >= outage_at:
+                server.shutdown()
+                server.server_close()
+                server.close_connections()
+                outage = {'start': now, 'online_before': samples[-1][1] if samples else 0}
+            if outage and 'end' not in outage and now >= outage['start'] + args.outage:
+                server = fa.start_ingest(store, '127.0.0.1', port)
+                outage['end'] = now
+            if now >= next_sample:
+                next_sample = now + 1.0
+                samples.append((now - start, _fleet_online(store), store.stats['events']))
+                if outage and 'end' in outage and 'recovered' not in outage \
+                        and samples[-1][1] == args.nodes:
+                    outage['recovered'] = now - outage['end']
+            when, i = schedule[0]
+            if when > now:
+                time.sleep(min(when - now, 0.05))
+                continue
+            heapq.heapreplace(schedule, (when + rng.exponential(60.0 / args.rate), i))
+            nodes[i].put({'camera': f"cam{sent % 2}",
+                          'timestamp': datetime_now_iso(timespec='milliseconds'),
+                          'detection_types': ['CIGARETTE'], 'sensor': False, 'motion': True,
+                          'visual': True, 'confidence': 0.8, 'boxes': [[10, 20, 30, 8]]})
+            sent += 1
+
+        drained = all(node.drain(max(1.0, start + args.duration + args.timeout - time.time()))
+                      for node in nodes)
+        elapsed = time.time() - start
+        sink_stats = [node.get_stats()['sinks'][0] for node in nodes]
+        while 'recovered' not in outage and time.time() < start + elapsed + args.timeout:
+            if _fleet_online(store) == args.nodes:
+                outage['recovered'] = time.time() - outage['end']
+            time.sleep(0.5)
+        time.sleep(fa.COMMIT_INTERVAL * 3)
+
+        app = fa.create_app(store, server).test_client()
+        api_ms = {}
+        for url in ('/api/fleet', '/api/nodes', '/api/events?limit=500', '/api/rates'):
+            timings = []
+            for _ in range(5):
+                t0 = time.time()
+                assert app.get(url).status_code == 200
+                timings.append((time.time() - t0) * 1000)
+            api_ms[url] = percentile(timings, 50)
+        final_online = _fleet_online(store)
+        for node in nodes:
+            node.close()
+    server.shutdown()
+    server.server_close()
+    server.close_connections()
+
+    db = store._reader()
+    stored = db.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+    ingest = [row[0] * 1000 for row in db.execute("SELECT received - t FROM events")]
+    metric_rows = db.execute("SELECT COUNT(*) FROM metrics").fetchone()[0]
+    connects = db.execute("SELECT SUM(connects) FROM nodes").fetchone()[0] or 0
+    db_mb = sum(os.path.getsize(os.path.join(workdir, f)) for f in os.listdir(workdir)
+                if f.startswith('fleet.db')) / 1e6
+    store.close()
+    during = [s[1] for s in samples if outage['start'] + 2 <= start + s[0] < outage.get('end', 0)]
+    batch_ms = [s['avg_batch_ms'] for s in sink_stats if s['batches']]
+    if args.verbose:
+        print(log.getvalue(), file=out)
+
+    print("\n" + "="*60)
+    print(f"{'Events sent / stored':<32}{sent:>12} / {stored}")
+    print(f"{'Duplicates ignored':<32}{store.stats['duplicates']:>12}")
+    print(f"{'Ingest rate (events/s)':<32}{stored / elapsed:>12.1f}")
+    print(f"{'Metric reports stored':<32}{metric_rows:>12} ({metric_rows / elapsed:.0f}/s)")
+    print(f"{'Event ingest latency p50/p95':<32}{percentile(ingest, 50):>9.0f} ms / "
+          f"{percentile(ingest, 95):.0f} ms")
+    print(f"{'Batch ack latency p50/p95':<32}{percentile(batch_ms, 50):>9.1f} ms / "
+          f"{percentile(batch_ms, 95):.1f} ms")
+    print(f"{'DB commits':<32}{store.stats['commits']:>12} ({store.stats['commits'] / elapsed:.1f}/s)")
+    print(f"{'Database size':<32}{db_mb:>9.1f} MB")
+    print("-"*60)
+    print(f"{'Online before outage':<32}{outage['online_before']:>12}")
+    print(f"{'Online during outage (max)':<32}{max(during, default=0):>12}")
+    recovered = outage.get('recovered')
+    print(f"{'All reconnected after':<32}"
+          f"{(f'{recovered:.1f} s' if recovered is not None else 'never'):>12}")
+    print(f"{'Online at end':<32}{final_online:>12} / {args.nodes}")
+    print(f"{'Connections (incl. reconnects)':<32}{connects:>12}")
+    print("-"*60)
+    for url, ms in api_ms.items():
+        print(f"{'GET ' + url:<32}{ms:>9.1f} ms")
+    print("="*60)
+
+    lost = sent - stored
+    ok = drained and lost == 0 and final_online == args.nodes and recovered is not None
+    if args.keep:
+        print(f"Database kept in {workdir}")
+    else:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print("✓ No events lost, every node reconnected" if ok else
+          f"❌ {lost} events lost, {final_online}/{args.nodes} nodes online at the end")
+    if not ok:
+        sys.exit(1)
+
+
+# ==================== EDGE OFFLOAD ====================
+
+def _offload_engine(offload=None):
+    """Detection engine with the configured local models and the cascade off,
+    so every frame runs the expensive stages"""
+    engine = sd.DetectionEngine(settings=sd.detector_settings(sd.default_config()), offload=offload)
+    engine.cascade.enabled = False
+    return engine
+
+def _offload_round_trips(client, frames, count, rois=None):
+    """ms of each answered sequential request"""
+    timings = []
+    for i in range(count):
+        t0 = time.monotonic()
+        if client.detect(frames[i % len(frames)], ('person', 'visual'), rois):
+            timings.append((time.monotonic() - t0) * 1000)
+    return timings
+
+def _offload_load(engine, cameras, duration, events):
+    """detect_all from one thread per camera while events (second, action) run on
+    this thread; returns per-call ms, longest call first"""
+    frames = synthetic_frames(8)
+    stop_at = time.time() + duration
+    timings = []
+
+    def camera(name):
+        i = 0
+        while time.time() < stop_at:
+            t0 = time.monotonic()
+            engine.detect_all(frames[i % len(frames)], name)
+            timings.append((time.monotonic() - t0) * 1000)
+            i += 1
+
+    threads = [threading.Thread(target=camera, args=(f"cam{i}",)) for i in range(cameras)]
+    for t in threads:
+        t.start()
+    for when, action in events:
+        time.sleep(max(0.0, when - (time.time() - (stop_at - duration))))
+        action()
+    for t in threads:
+        t.join()
+    return sorted(timings, reverse=True)
+
+def run_offload(args):
+    frames = synthetic_frames(8)
+    sizes = [int(v) for v in args.sizes.split(',')]
+    server = detectors = None
+    if args.server:
+        target = args.server
+    else:
+        detectors = srv.Detectors(args.person_model, args.cigarette_model)
+        server = srv.start_server(detectors, '127.0.0.1', 0, args.workers)
+        target = f"127.0.0.1:{server.server_address[1]}"
+    print(f"\n📊 Edge offload to {target}, {args.frames} frames per mode, "
+          f"{sd.CAMERA_RESOLUTION[0]}x{sd.CAMERA_RESOLUTION[1]} frames")
+
+    local = _offload_engine()
+    local_ms = []
+    for i in range(args.frames):
+        t0 = time.monotonic()
+        for stage in ('person', 'visual'):
+            local._run_stage(stage, frames[i % len(frames)], 'bench')
+        local_ms.append((time.monotonic() - t0) * 1000)
+
+    print("\n" + "="*72)
+    print(f"{'Mode':<26}{'KB/frame':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'server ms':>11}")
+    print("-"*72)
+    print(f"{'local detectors':<26}{'-':>10}{percentile(local_ms, 50):>9.1f}"
+          f"{percentile(local_ms, 95):>9.1f}{percentile(local_ms, 99):>9.1f}{'-':>11}")
+    width, height = sd.CAMERA_RESOLUTION
+    roi = [[width // 3, height // 3, width // 6, height // 6]]  # A person-sized motion region
+    modes = [(f"full frame, max {size}px", size, None) for size in sizes]
+    modes.append((f"ROI crop, max {sizes[-1]}px", sizes[-1], roi))
+    with contextlib.redirect_stdout(io.StringIO()):
+        for label, size, rois in modes:
+            client = sd.OffloadClient(target, max_side=size, quality=args.quality,
+                                      timeout=args.timeout)
+            _offload_round_trips(client, frames, 5, rois)  # Connect, warm up
+            client.reports.update(bytes_sent=0, requests=0, answered=0, server_ms=0.0)
+            timings = _offload_round_trips(client, frames, args.frames, rois)
+            stats = client.get_stats()
+            client.stop()
+            print(f"{label:<26}{stats['avg_kb_sent']:>10.1f}{percentile(timings, 50):>9.1f}"
+                  f"{percentile(timings, 95):>9.1f}{percentile(timings, 99):>9.1f}"
+                  f"{stats['avg_server_ms']:>11.1f}", file=sys.__stdout__)
+    print("="*72)
+
+    # Throughput with every camera on one pipelined connection, then through an outage
+    runs = [('local only', None), ('offload', sd.OffloadClient(target, quality=args.quality))]
+    print(f"\n{args.cameras} cameras, {args.duration:.0f}s each"
+          + (f", {args.outage:.0f}s server outage at {args.duration / 3:.0f}s" if server else ""))
+    print("="*72)
+    print(f"{'Run':<14}{'frames/s':>10}{'offloaded':>11}{'late':>7}{'local':>8}"
+          f"{'p50 ms':>9}{'max ms':>9}{'reconnect':>12}")
+    print("-"*72)
+    for label, client in runs:
+        events = []
+        outage = {}
+        if client is not None and server is not None:
+            port = server.server_address[1]
+
+            def down():
+                server.close()
+                outage['start'] = time.time()
+
+            def up():
+                outage['server'] = srv.start_server(detectors, '127.0.0.1', port, args.workers)
+                outage['end'] = time.time()
+                connects = client.reports['connects']
+                while client.reports['connects'] == connects and time.time() < outage['end'] + 60:
+                    time.sleep(0.05)
+                if client.reports['connects'] > connects:
+                    outage['reconnect'] = time.time() - outage['end']
+
+            events = [(args.duration / 3, down), (args.duration / 3 + args.outage, up)]
+        with contextlib.redirect_stdout(io.StringIO()):
+            engine = _offload_engine(client)
+            timings = _offload_load(engine, args.cameras, args.duration, events)
+            engine.stop()
+        reconnect = '-'
+        if outage:
+            server = outage['server']
+            reconnect = f"{outage['reconnect']:.1f} s" if 'reconnect' in outage else 'never'
+        r = client.reports if client is not None else {'answered': 0, 'late': 0, 'local': 0}
+        print(f"{label:<14}{len(timings) / args.duration:>10.1f}{r['answered']:>11}{r['late']:>7}"
+              f"{r['local']:>8}{percentile(timings, 50):>9.1f}{timings[0] if timings else 0:>9.1f}"
+              f"{reconnect:>12}")
+    print("="*72)
+    if server is not None:
+        print(f"Server: {server.get_stats()}")
+        server.close()
+    print("Offloaded frames run the server's models; local-only frames run "
+          f"{sd.PERSON_MODEL or 'motion'} / {sd.CIGARETTE_MODEL or 'HSV visual'}")
+
+
+# ==================== MAIN ====================
+
+def main():
+    parser = argparse.ArgumentParser(description="No-Smoking Detection System benchmarks")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('multicam', help="Shared detection pool vs one process per camera")
+    p.add_argument('--cameras', type=int, default=3)
+    p.add_argument('--workers', type=int, default=sd.DETECTION_WORKERS)
+    p.add_argument('--weights', default="", help="Comma-separated fairness weights")
+    p.add_argument('--duration', type=float, default=20.0)
+    p.add_argument('--interval', type=float, default=0.0,
+                   help="Seconds between submitted frames per camera (0 = saturate)")
+    p.set_defaults(func=run_multicam)
+
+    p = sub.add_parser('procpool', help="Detection in worker processes vs threads, by core count")
+    p.add_argument('--processes', default="1,2,3,4", help="Comma-separated process counts")
+    p.add_argument('--cameras', type=int, default=4,
+                   help="Simulated cameras (frames in flight)")
+    p.add_argument('--duration', type=float, default=20.0)
+    p.add_argument('--warmup', type=float, default=1.0)
+    p.set_defaults(func=run_procpool)
+
+    p = sub.add_parser('cascade', help="Detection cascade on static vs moving scenes")
+    p.add_argument('--frames', type=int, default=200)
+    p.set_defaults(func=run_cascade)
+
+    p = sub.add_parser('models', help="Compare registry models on accuracy and ms per frame")
+    p.add_argument('--models', default="",
+                   help="Comma-separated MODELS keys (default: all, plus hsv-visual)")
+    p.add_argument('--dataset', default="", help="Folder with images and labels.json")
+    p.add_argument('--frames', type=int, default=50, help="Timed frames per model")
+    p.add_argument('--threads', type=int, default=0, help="Override each model's thread count")
+    p.set_defaults(func=run_models)
+
+    p = sub.add_parser('tiles', help="Latency of tiled multi-scale detection by tile count")
+    p.add_argument('--model', default="", help="MODELS key (default: the configured cigarette/person model)")
+    p.add_argument('--max-tiles', type=int, default=8)
+    p.add_argument('--frames', type=int, default=20)
+    p.add_argument('--budget', type=float, default=sd.TILE_BUDGET_MS, help="Latency budget (ms)")
+    p.set_defaults(func=run_tiles)
+
+    p = sub.add_parser('soak', help="Run the full system on synthetic cameras and fail on leaks")
+    p.add_argument('--duration', type=float, default=7200.0, help="Wall-clock seconds")
+    p.add_argument('--speed', type=float, default=10.0, help="Time acceleration of the capture/stream loops")
+    p.add_argument('--cameras', type=int, default=2)
+    p.add_argument('--viewers', type=int, default=2, help="Simulated browsers opening/closing streams")
+    p.add_argument('--stream-frames', type=int, default=20, help="Frames a viewer watches per visit")
+    p.add_argument('--interval', type=float, default=10.0, help="Seconds between samples")
+    p.add_argument('--warmup', type=float, default=300.0, help="Seconds left out of the trend fit")
+    p.add_argument('--max-heap-mb', type=float, default=0.5, help="tracemalloc MB per device hour")
+    p.add_argument('--max-rss-mb', type=float, default=1.0, help="RSS MB per device hour")
+    p.add_argument('--max-threads', type=float, default=0.1, help="Threads per device hour")
+    p.add_argument('--max-fds', type=float, default=0.1, help="Open fds per device hour")
+    p.add_argument('--max-latency-ms', type=float, default=1.0, help="Stage latency ms per device hour")
+    p.add_argument('--csv', default="", help="Write every sample to this CSV file")
+    p.add_argument('--keep', action='store_true', help="Keep the violations/events output")
+    p.add_argument('--verbose', action='store_true', help="Print every sample")
+    p.set_defaults(func=run_soak)
+
+    p = sub.add_parser('jpeg', help="JPEG encoder backends by subsampling, DCT and quality")
+    p.add_argument('--frames', type=int, default=30)
+    p.add_argument('--quality', default="60,70,85", help="Comma-separated JPEG qualities")
+    p.add_argument('--size', default="", help="WIDTHxHEIGHT (default: CAMERA_RESOLUTION)")
+    p.set_defaults(func=run_jpeg)
+
+    p = sub.add_parser('forward', help="Webhook/MQTT forwarding throughput, outages and restarts")
+    p.add_argument('--sinks', default="webhook,mqtt")
+    p.add_argument('--events', type=int, default=500, help="Events per run")
+    p.add_argument('--batch-sizes', default="1,20,100", help="Comma-separated batch sizes for the burst runs")
+    p.add_argument('--latency', type=float, default=0.5, help="Batch latency (s)")
+    p.add_argument('--outage', type=float, default=3.0, help="Seconds the receiver is down")
+    p.add_argument('--backoff-min', type=float, default=0.2)
+    p.add_argument('--backoff-max', type=float, default=2.0)
+    p.add_argument('--timeout', type=float, default=60.0, help="Max seconds to deliver a run")
+    p.set_defaults(func=run_forward)
+
+    p = sub.add_parser('fleet', help="Fleet aggregator with hundreds of simulated nodes and an outage")
+    p.add_argument('--nodes', type=int, default=200)
+    p.add_argument('--duration', type=float, default=90.0)
+    p.add_argument('--rate', type=float, default=6.0, help="Violations per node per minute")
+    p.add_argument('--interval', type=float, default=5.0, help="Seconds between metric reports")
+    p.add_argument('--batch', type=int, default=fwd.FORWARD_BATCH_SIZE)
+    p.add_argument('--latency', type=float, default=fwd.FORWARD_BATCH_LATENCY, help="Batch latency (s)")
+    p.add_argument('--outage', type=float, default=10.0, help="Seconds the aggregator is down")
+    p.add_argument('--backoff-max', type=float, default=8.0)
+    p.add_argument('--timeout', type=float, default=60.0, help="Max seconds to drain after the run")
+    p.add_argument('--keep', action='store_true', help="Keep the database")
+    p.add_argument('--verbose', action='store_true', help="Show per-node connection messages")
+    p.set_defaults(func=run_fleet)
+
+    p = sub.add_parser('offload', help="Edge offload round trips, throughput and fallback in an outage")
+    p.add_argument('--server', default="",
+                   help="host:port of a running inference_server.py (default: start one here)")
+    p.add_argument('--person-model', default=srv.PERSON_MODEL, help="Models of the local server")
+    p.add_argument('--cigarette-model', default=srv.CIGARETTE_MODEL)
+    p.add_argument('--workers', type=int, default=srv.WORKERS, help="Local server workers")
+    p.add_argument('--frames', type=int, default=200, help="Sequential requests per mode")
+    p.add_argument('--sizes', default="160,320,416", help="Comma-separated OFFLOAD_MAX_SIDE values")
+    p.add_argument('--quality', type=int, default=sd.OFFLOAD_JPEG_QUALITY)
+    p.add_argument('--timeout', type=float, default=2.0, help="Round-trip timeout of the latency runs (s)")
+    p.add_argument('--cameras', type=int, default=2)
+    p.add_argument('--duration', type=float, default=15.0, help="Seconds per throughput run")
+    p.add_argument('--outage', type=float, default=3.0, help="Seconds the local server is down")
+    p.set_defaults(func=run_offload)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
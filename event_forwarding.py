@@ -0,0 +1,687 @@
+"""
+Event forwarding for the No-Smoking Detection System
+Delivers violation events to webhook, MQTT and fleet aggregator sinks through
+one crash-safe disk queue per sink. Standard library only: it does not need
+the camera, GPIO or web server packages, so it can be imported and tested on
+any machine. The sinks themselves are configured with FORWARD_SINKS in
+smoking_detector_with_sh1106.py.
+"""
+
+import base64
+import http.client
+import json
+import os
+import random
+import re
+import socket
+import struct
+import threading
+import time
+import uuid
+from datetime import datetime
+from urllib.parse import urlsplit
+
+from framing import pack_frame, read_frame, recv_exactly
+
+# ==================== SETTINGS ====================
+FORWARD_DIR = "outbox"            # Disk queues of undelivered events
+FORWARD_BATCH_SIZE = 20           # Most events per webhook request / MQTT round trip
+FORWARD_BATCH_LATENCY = 2.0       # Max seconds an event waits for its batch to fill
+FORWARD_THUMBNAILS = True         # Send the gallery thumbnail (base64 JPEG) with each event
+FORWARD_BACKOFF_MIN = 1.0         # First retry delay after a failed delivery (s)
+FORWARD_BACKOFF_MAX = 300.0       # Retry delay doubles per failure up to this (s)
+FORWARD_TIMEOUT = 10.0            # Connect/response timeout per delivery (s)
+FORWARD_QUEUE_MAX_MB = 20         # Per sink; the oldest undelivered events are dropped beyond this
+
+# ==================== FLEET REPORTING ====================
+# A "fleet" sink reports events and health metrics to fleet_aggregator.py:
+#   {"name": "fleet", "type": "fleet", "host": "192.168.1.5", "node": "lobby-1"}
+FLEET_PORT = 7070                 # Aggregator ingest port
+FLEET_METRICS_INTERVAL = 10.0     # Seconds between health reports
+FLEET_MAX_INTERVAL = 3600         # Longest report interval the aggregator accepts
+
+def write_json_atomic(path, data):
+    """Replace a small JSON file without leaving a half-written one behind"""
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+# ==================== DISK QUEUE ====================
+
+class DiskQueue:
+    """Append-only on-disk FIFO of JSON records with a persistent read cursor
+
+    Records are appended as JSON lines to numbered segment files and fsynced,
+    so they survive a crash or power cut. The consumer peeks a batch and only
+    advances the cursor (cursor.json, replaced atomically) once the batch is
+    delivered; fully consumed segments are deleted. Delivery is therefore
+    at-least-once: a batch sent just before a crash is sent again.
+    """
+
+    SEGMENT_BYTES = 256 * 1024
+
+    def __init__(self, directory, max_bytes=FORWARD_QUEUE_MAX_MB * 1024 * 1024):
+        """Open (or create) the queue and count what is still undelivered"""
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.dropped = 0
+        self.corrupt = 0
+        self.drops = 0  # Segments dropped, to spot an ack() racing with a drop
+        os.makedirs(directory, exist_ok=True)
+
+        self.cursor_path = os.path.join(directory, 'cursor.json')
+        try:
+            with open(self.cursor_path) as f:
+                self.cursor = tuple(json.load(f))
+        except (OSError, ValueError):
+            self.cursor = (0, 0)
+        self.segments = sorted(int(name[:-4]) for name in os.listdir(directory)
+                               if name.endswith('.log') and name[:-4].isdigit())
+        if self.segments:
+            self._repair(self.segments[-1])
+        if self.cursor[0] not in self.segments:
+            self.cursor = (self.segments[0] if self.segments else 0, 0)
+        self.size = sum(os.path.getsize(self._path(seg)) for seg in self.segments)
+        self.pending = self._count()
+
+    def _path(self, segment):
+        return os.path.join(self.directory, f"{segment:012d}.log")
+
+    def _repair(self, segment):
+        """Cut a record that was half-written when the power went"""
+        path = self._path(segment)
+        with open(path, 'rb+') as f:
+            data = f.read()
+            end = data.rfind(b'\n') + 1
+            if end < len(data):
+                f.truncate(end)
+
+    def _count(self):
+        """Undelivered records from the cursor on"""
+        count = 0
+        for seg in self.segments:
+            if seg < self.cursor[0]:
+                continue
+            with open(self._path(seg), 'rb') as f:
+                if seg == self.cursor[0]:
+                    f.seek(self.cursor[1])
+                count += sum(1 for _ in f)
+        return count
+
+    def append(self, records):
+        """Add records at the tail (one write and fsync for the whole list)"""
+        if not records:
+            return
+        data = b''.join(json.dumps(r, separators=(',', ':')).encode() + b'\n' for r in records)
+        with self.lock:
+            if not self.segments or os.path.getsize(self._path(self.segments[-1])) >= self.SEGMENT_BYTES:
+                self.segments.append(self.segments[-1] + 1 if self.segments else max(1, self.cursor[0]))
+            with open(self._path(self.segments[-1]), 'ab') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            self.size += len(data)
+            self.pending += len(records)
+            while self.size > self.max_bytes and len(self.segments) > 1:
+                self._drop_oldest()
+
+    def _drop_oldest(self):
+        """Discard the oldest segment to stay within max_bytes (caller holds lock)"""
+        seg = self.segments.pop(0)
+        path = self._path(seg)
+        with open(path, 'rb') as f:
+            if seg == self.cursor[0]:
+                f.seek(self.cursor[1])
+            lost = sum(1 for _ in f) if seg >= self.cursor[0] else 0
+        self.size -= os.path.getsize(path)
+        os.remove(path)
+        self.dropped += lost
+        self.pending -= lost
+        self.drops += 1
+        if self.cursor < (self.segments[0], 0):
+            self.cursor = (self.segments[0], 0)
+        write_json_atomic(self.cursor_path, list(self.cursor))
+
+    def peek(self, count):
+        """Up to count records from the cursor, and the position to ack() after them"""
+        records = []
+        lines = 0
+        with self.lock:
+            segment, offset = self.cursor
+            for seg in self.segments:
+                if seg < segment:
+                    continue
+                if seg > segment:
+                    segment, offset = seg, 0
+                with open(self._path(seg), 'rb') as f:
+                    f.seek(offset)
+                    while len(records) < count:
+                        line = f.readline()
+                        if not line.endswith(b'\n'):
+                            break
+                        offset += len(line)
+                        lines += 1
+                        try:
+                            records.append(json.loads(line))
+                        except ValueError:
+                            self.corrupt += 1
+                if len(records) >= count:
+                    break
+            drops = self.drops
+        return records, (segment, offset, lines, drops)
+
+    def ack(self, position):
+        """Records up to position are delivered: advance the cursor, delete used segments
+
+        Segments dropped since the peek already took their records off
+        pending, and the cursor never moves back onto them.
+        """
+        segment, offset, lines, drops = position
+        with self.lock:
+            if (segment, offset) <= self.cursor:
+                return
+            self.cursor = (segment, offset)
+            write_json_atomic(self.cursor_path, [segment, offset])
+            if drops == self.drops:
+                self.pending = max(0, self.pending - lines)
+            else:
+                self.pending = self._count()
+            while self.segments and self.segments[0] < segment:
+                path = self._path(self.segments.pop(0))
+                self.size -= os.path.getsize(path)
+                os.remove(path)
+
+# ==================== SINKS ====================
+
+class ForwardError(Exception):
+    """Failed delivery; retry=False means the receiver rejected the batch itself"""
+
+    def __init__(self, message, retry=True):
+        super().__init__(message)
+        self.retry = retry
+
+class ForwardSink:
+    """One delivery target with its own disk queue and sender thread
+
+    Subclasses implement send(device, events), raising on failure, and close().
+    """
+
+    kind = None
+    sends_thumbnails = True
+
+    def __init__(self, config, forwarder):
+        """Open the sink's queue and start its thread"""
+        self.name = config.get('name') or self.kind
+        self.config = config
+        self.forwarder = forwarder
+        self.queue = DiskQueue(os.path.join(forwarder.directory, self.name),
+                               forwarder.max_queue_bytes)
+        self.incoming = []  # Events put() since the thread last spooled to disk
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.failures = 0   # Consecutive failed deliveries
+        self.retry_at = 0.0
+        self.batch_ms = 0.0
+        self.stats = {'sent': 0, 'batches': 0, 'failed_attempts': 0, 'rejected': 0,
+                      'last_error': None, 'last_success': None}
+        self.running = True
+        if self.queue.pending:
+            print(f"📤 {self.name}: {self.queue.pending} queued events from the last run")
+        self.start()
+
+    def start(self):
+        """Start the sender thread (also the supervisor restart if it died)"""
+        self.thread = threading.Thread(target=self._run, name=f"forward-{self.name}", daemon=True)
+        self.thread.start()
+
+    def put(self, event):
+        """Queue an event (returns at once)"""
+        with self.lock:
+            self.incoming.append(event)
+        self.wake.set()
+
+    def _spool(self):
+        """Move put() events into the disk queue"""
+        with self.lock:
+            events, self.incoming = self.incoming, []
+        for event in events:
+            if isinstance(event.get('thumbnail'), bytes):
+                event['thumbnail'] = base64.b64encode(event['thumbnail']).decode('ascii')
+        self.queue.append(events)
+
+    def _wait(self, timeout):
+        self.wake.wait(timeout)
+        self.wake.clear()
+
+    def _run(self):
+        forwarder = self.forwarder
+        while self.running:
+            try:
+                self._spool()
+                delay = self.retry_at - time.time()
+                if delay > 0:
+                    self._wait(delay)
+                    continue
+                events, position = self.queue.peek(forwarder.batch_size)
+                if not events:
+                    if position[2]:
+                        self.queue.ack(position)  # Only unreadable lines left
+                    else:
+                        self._wait(None)
+                    continue
+                age = time.time() - events[0].get('queued_at', 0)
+                if len(events) < forwarder.batch_size and age < forwarder.batch_latency:
+                    self._wait(forwarder.batch_latency - age)
+                    continue
+                self._deliver(events, position)
+            except Exception as e:
+                print(f"⚠ Forwarding to {self.name} stopped working: {e}")
+                self._wait(forwarder.backoff_max)
+        self._spool()
+        self.close()
+
+    def _deliver(self, events, position):
+        """Send one batch; ack it on success, schedule a retry on failure"""
+        forwarder = self.forwarder
+        batch = [{k: v for k, v in e.items() if k != 'queued_at'} for e in events]
+        start = time.time()
+        try:
+            self.send(forwarder.device, batch)
+        except Exception as e:
+            self.stats['last_error'] = str(e)
+            if isinstance(e, ForwardError) and not e.retry:
+                # Retrying cannot help and would block every later event
+                print(f"⚠ {self.name} rejected {len(events)} events: {e} (dropped)")
+                self.stats['rejected'] += len(events)
+                self.queue.ack(position)
+                return
+            self.failures += 1
+            self.stats['failed_attempts'] += 1
+            delay = min(forwarder.backoff_max, forwarder.backoff_min * 2 ** (self.failures - 1))
+            delay *= random.uniform(0.5, 1.0)  # Jitter: many devices do not retry in lockstep
+            self.retry_at = time.time() + delay
+            print(f"⚠ Forwarding to {self.name} failed: {e} "
+                  f"(retry in {delay:.0f}s, {self.queue.pending} queued)")
+            return
+
+        self.queue.ack(position)
+        if self.failures:
+            print(f"✓ Forwarding to {self.name} recovered after {self.failures} failed attempts")
+        self.failures = 0
+        self.retry_at = 0.0
+        elapsed = (time.time() - start) * 1000
+        self.batch_ms = elapsed if not self.stats['batches'] else 0.9 * self.batch_ms + 0.1 * elapsed
+        self.stats['sent'] += len(events)
+        self.stats['batches'] += 1
+        self.stats['last_success'] = datetime.now().isoformat(timespec='seconds')
+
+    def send(self, device, events):
+        raise NotImplementedError
+
+    def close(self):
+        """Release the connection"""
+
+    def stop(self):
+        """Spool what is left to disk and stop the thread"""
+        self.running = False
+        self.wake.set()
+        self.thread.join(timeout=self.forwarder.timeout + 1)
+
+    def get_stats(self):
+        """Delivery counters, queue depth and retry state"""
+        with self.lock:
+            incoming = len(self.incoming)
+        return dict(self.stats, name=self.name, type=self.kind,
+                    queued=self.queue.pending + incoming, dropped=self.queue.dropped,
+                    queue_kb=round(self.queue.size / 1024, 1),
+                    retry_in=round(max(0.0, self.retry_at - time.time()), 1),
+                    avg_batch_ms=round(self.batch_ms, 1))
+
+class WebhookSink(ForwardSink):
+    """POSTs each batch as one JSON document {"device", "events"} over a kept-alive
+    HTTP(S) connection; 2xx is delivered, 408/429/5xx are retried, other codes reject
+    the batch"""
+
+    kind = "webhook"
+
+    def __init__(self, config, forwarder):
+        """Parse the URL; the connection is opened on the first delivery"""
+        url = urlsplit(config['url'])
+        self.connection_class = (http.client.HTTPSConnection if url.scheme == 'https'
+                                 else http.client.HTTPConnection)
+        self.host = url.hostname
+        self.port = url.port
+        self.path = (url.path or '/') + (f"?{url.query}" if url.query else '')
+        self.headers = dict({'Content-Type': 'application/json'}, **config.get('headers', {}))
+        self.conn = None
+        super().__init__(config, forwarder)
+
+    def send(self, device, events):
+        body = json.dumps({'device': device, 'events': events}).encode()
+        for attempt in range(2):
+            reused = self.conn is not None
+            if self.conn is None:
+                self.conn = self.connection_class(self.host, self.port,
+                                                  timeout=self.forwarder.timeout)
+            try:
+                self.conn.request('POST', self.path, body, self.headers)
+                response = self.conn.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                self.close()
+                if reused and attempt == 0:
+                    continue  # The server closed an idle keep-alive connection
+                raise
+            if response.will_close:
+                self.close()
+            if 200 <= response.status < 300:
+                return
+            raise ForwardError(f"HTTP {response.status}",
+                               retry=response.status in (408, 429) or response.status >= 500)
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+class MqttSink(ForwardSink):
+    """Publishes every event as a QoS 1 message on <topic>/<camera>
+
+    A minimal MQTT 3.1.1 client (CONNECT, PUBLISH, PUBACK) keeps the Pi free of
+    another package. A batch is written back to back in one send and counts as
+    delivered once the broker has acknowledged every message in it.
+    """
+
+    kind = "mqtt"
+
+    def __init__(self, config, forwarder):
+        """Connection settings; connects on the first delivery"""
+        self.host = config['host']
+        self.port = int(config.get('port', 1883))
+        self.topic = config.get('topic', 'nosmoking').rstrip('/')
+        self.username = config.get('username')
+        self.password = config.get('password')
+        self.client_id = config.get('client_id') or f"nosmoking-{socket.gethostname()}"
+        self.keepalive = int(config.get('keepalive', 60))
+        self.sock = None
+        self.last_used = 0.0
+        self.packet_id = 0
+        super().__init__(config, forwarder)
+
+    @staticmethod
+    def _packet(kind, body):
+        """Fixed header (type byte, variable-length remaining length) + body"""
+        header = bytearray([kind])
+        length = len(body)
+        while True:
+            byte, length = length % 128, length // 128
+            header.append(byte | 0x80 if length else byte)
+            if not length:
+                break
+        return bytes(header) + body
+
+    @staticmethod
+    def _string(value):
+        data = value.encode()
+        return struct.pack('>H', len(data)) + data
+
+    def _read_packet(self):
+        kind = recv_exactly(self.sock, 1, "broker")[0]
+        length, shift = 0, 0
+        while True:
+            byte = recv_exactly(self.sock, 1, "broker")[0]
+            length |= (byte & 0x7f) << shift
+            shift += 7
+            if not byte & 0x80:
+                break
+        return kind >> 4, recv_exactly(self.sock, length, "broker")
+
+    def _connect(self):
+        self.sock = socket.create_connection((self.host, self.port), timeout=self.forwarder.timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        flags = 0x02 | (0x80 if self.username else 0) | (0x40 if self.password else 0)
+        body = self._string('MQTT') + bytes([4, flags]) + struct.pack('>H', self.keepalive)
+        body += self._string(self.client_id)
+        if self.username:
+            body += self._string(self.username)
+        if self.password:
+            body += self._string(self.password)
+        self.sock.sendall(self._packet(0x10, body))
+        kind, body = self._read_packet()
+        if kind != 2 or len(body) < 2 or body[1] != 0:
+            self.close()
+            raise ForwardError(f"MQTT connection refused (code {body[1] if len(body) > 1 else '?'})")
+
+    def send(self, device, events):
+        if self.sock is not None and time.time() - self.last_used > self.keepalive:
+            self.close()  # The broker drops clients that stay silent past the keepalive
+        for attempt in range(2):
+            reused = self.sock is not None
+            try:
+                if self.sock is None:
+                    self._connect()
+                self._publish(device, events)
+                self.last_used = time.time()
+                return
+            except OSError:
+                self.close()
+                if not (reused and attempt == 0):
+                    raise
+
+    def _publish(self, device, events):
+        packets = []
+        waiting = set()
+        for event in events:
+            self.packet_id = self.packet_id % 65535 + 1
+            topic = f"{self.topic}/{event.get('camera', 'default')}"
+            payload = json.dumps(dict(event, device=device)).encode()
+            packets.append(self._packet(0x32, self._string(topic)
+                                        + struct.pack('>H', self.packet_id) + payload))
+            waiting.add(self.packet_id)
+        self.sock.sendall(b''.join(packets))
+        while waiting:
+            kind, body = self._read_packet()
+            if kind == 4:  # PUBACK
+                waiting.discard(struct.unpack('>H', body[:2])[0])
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.sendall(b'\xe0\x00')  # DISCONNECT
+            except OSError:
+                pass
+            self.sock.close()
+            self.sock = None
+
+# Health values a fleet sink reports; the index is the key id on the wire, so
+# only append (fleet_aggregator.py keeps the same list)
+FLEET_METRIC_KEYS = ('uptime_s', 'cpu_temp_c', 'rss_mb', 'memory_level', 'cameras', 'fps',
+                     'detect_ms', 'queue_ms', 'violations', 'forward_queued')
+
+class FleetSink(ForwardSink):
+    """Reports to a fleet aggregator (fleet_aggregator.py) over one TCP connection
+
+    Frames are a 1-byte type, a 4-byte length and a binary payload:
+      HELLO    JSON {node, protocol, interval}, first frame on every connection
+      METRICS  time, then (key id, float32) pairs, every FLEET_METRICS_INTERVAL s
+      EVENTS   seq and count, then per event the 16-byte id, time, camera,
+               detection flags, confidence and int16 boxes (about 30 bytes)
+      ACK      seq, sent back once the aggregator has committed the batch
+    Events go through the sink's disk queue like any other sink. Metrics are
+    live values, so they are simply skipped while the aggregator is unreachable.
+    """
+
+    kind = "fleet"
+    sends_thumbnails = False
+    HELLO, METRICS, EVENTS, ACK = 1, 2, 3, 4
+    PROTOCOL = 1
+    FLAG_SENSOR, FLAG_MOTION, FLAG_VISUAL = 1, 2, 4  # The event log's flag bits
+    MAX_BOXES = 16
+
+    def __init__(self, config, forwarder):
+        """Connection settings; connects on the first report"""
+        self.host = config['host']
+        self.port = int(config.get('port', FLEET_PORT))
+        self.node = config.get('node') or forwarder.device
+        if not re.fullmatch(r'[A-Za-z0-9._-]{1,64}', self.node):
+            raise ValueError(f"node name {self.node!r} must be 1-64 of A-Z a-z 0-9 . _ -")
+        self.interval = float(config.get('interval', FLEET_METRICS_INTERVAL))
+        if not 0 < self.interval <= FLEET_MAX_INTERVAL:
+            raise ValueError(f"interval must be between 0 and {FLEET_MAX_INTERVAL} seconds")
+        self.sock = None
+        self.seq = 0
+        self.next_metrics = 0.0
+        self.reports = {'metrics_sent': 0, 'metrics_failed': 0, 'connects': 0}
+        super().__init__(config, forwarder)
+
+    def _connect(self):
+        self.sock = socket.create_connection((self.host, self.port), timeout=self.forwarder.timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        hello = json.dumps({'node': self.node, 'protocol': self.PROTOCOL, 'interval': self.interval})
+        self.sock.sendall(pack_frame(self.HELLO, hello.encode()))
+        self.reports['connects'] += 1
+
+    def _events_payload(self, events):
+        self.seq = self.seq % 0xFFFFFFFF + 1
+        parts = [struct.pack('>IH', self.seq, len(events))]
+        for event in events:
+            try:
+                when = datetime.fromisoformat(event['timestamp']).timestamp()
+            except (KeyError, ValueError):
+                when = time.time()
+            camera = str(event.get('camera', 'default')).encode()[:255]
+            flags = ((self.FLAG_SENSOR if event.get('sensor') else 0)
+                     | (self.FLAG_MOTION if event.get('motion') else 0)
+                     | (self.FLAG_VISUAL if event.get('visual') else 0))
+            boxes = event.get('boxes', [])[:self.MAX_BOXES]
+            confidence = int(round(min(max(float(event.get('confidence', 0)), 0.0), 1.0) * 255))
+            parts.append(bytes.fromhex(event['id']) + struct.pack('>dB', when, len(camera)) + camera
+                         + struct.pack('>BBB', flags, confidence, len(boxes)))
+            parts.extend(struct.pack('>4h', *(max(-32768, min(32767, int(v))) for v in box))
+                         for box in boxes)
+        return b''.join(parts)
+
+    def send(self, device, events):
+        payload = self._events_payload(events)
+        for attempt in range(2):
+            reused = self.sock is not None
+            try:
+                if self.sock is None:
+                    self._connect()
+                self.sock.sendall(pack_frame(self.EVENTS, payload))
+                while True:
+                    kind, body = read_frame(self.sock, peer="aggregator")
+                    if kind == self.ACK and struct.unpack('>I', body[:4])[0] == self.seq:
+                        return
+            except OSError:
+                self.close()
+                if not (reused and attempt == 0):
+                    raise
+
+    def _wait(self, timeout):
+        """Wait as the base class does, but wake up for the periodic health report"""
+        due = max(0.0, self.next_metrics - time.time())
+        super()._wait(due if timeout is None else min(timeout, due))
+        if time.time() >= self.next_metrics and self.running:
+            self._send_metrics()
+
+    def _send_metrics(self):
+        now = time.time()
+        self.next_metrics = now + self.interval
+        values = self.forwarder.metrics() if self.forwarder.metrics else {}
+        values['forward_queued'] = self.queue.pending
+        payload = struct.pack('>d', now) + b''.join(
+            struct.pack('>Bf', FLEET_METRIC_KEYS.index(key), float(value))
+            for key, value in values.items() if key in FLEET_METRIC_KEYS and value is not None)
+        try:
+            if self.sock is None:
+                if now < self.retry_at:
+                    raise ConnectionError("aggregator unreachable (backing off)")
+                self._connect()
+            self.sock.sendall(pack_frame(self.METRICS, payload))
+            self.reports['metrics_sent'] += 1
+        except OSError:
+            self.close()
+            self.reports['metrics_failed'] += 1
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def get_stats(self):
+        return dict(super().get_stats(), node=self.node, **self.reports)
+
+FORWARD_SINK_TYPES = {'webhook': WebhookSink, 'mqtt': MqttSink, 'fleet': FleetSink}
+
+# ==================== FORWARDER ====================
+
+class EventForwarder:
+    """Delivers violation events to the configured sinks, off the detection thread
+
+    put() only appends to each sink's in-memory list, so the camera pipeline
+    never waits on disk or network. Each sink thread spools new events into its
+    own DiskQueue and sends a batch once it holds batch_size events or its
+    oldest event has waited batch_latency seconds. Failed deliveries are retried
+    with exponential backoff while new events keep queueing on disk, and the
+    queue is picked up again after a restart.
+    """
+
+    def __init__(self, sinks=None, directory=FORWARD_DIR, batch_size=FORWARD_BATCH_SIZE,
+                 batch_latency=FORWARD_BATCH_LATENCY, thumbnails=FORWARD_THUMBNAILS,
+                 backoff_min=FORWARD_BACKOFF_MIN, backoff_max=FORWARD_BACKOFF_MAX,
+                 timeout=FORWARD_TIMEOUT, max_queue_mb=FORWARD_QUEUE_MAX_MB, metrics=None):
+        """Start one thread per sink; metrics() returns the live values fleet sinks report"""
+        self.directory = directory
+        self.metrics = metrics
+        self.batch_size = max(1, int(batch_size))
+        self.batch_latency = batch_latency
+        self.thumbnails = thumbnails
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.max_queue_bytes = int(max_queue_mb * 1024 * 1024)
+        self.device = socket.gethostname()
+        self.sinks = []
+        for config in sinks or []:
+            try:
+                sink = FORWARD_SINK_TYPES[config['type']](config, self)
+            except Exception as e:
+                print(f"⚠ Event forwarding to {config.get('name') or config.get('type')} "
+                      f"disabled: {e!r}")
+                continue
+            self.sinks.append(sink)
+            print(f"✓ Forwarding events to {sink.name} ({sink.kind})")
+
+    def put(self, event, thumbnail=None):
+        """Queue an event (a JSON-serialisable dict) for every sink"""
+        if not self.sinks:
+            return
+        event = dict(event, id=uuid.uuid4().hex, queued_at=time.time())
+        for sink in self.sinks:
+            if thumbnail is not None and self.thumbnails and sink.sends_thumbnails:
+                sink.put(dict(event, thumbnail=thumbnail))
+            else:
+                sink.put(dict(event))
+
+    def drain(self, timeout):
+        """Wait until every sink has delivered its queue; False on timeout"""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if all(sink.get_stats()['queued'] == 0 for sink in self.sinks):
+                return True
+            time.sleep(0.05)
+        return False
+
+    def get_stats(self):
+        """Per-sink delivery statistics"""
+        return {'device': self.device, 'batch_size': self.batch_size,
+                'batch_latency': self.batch_latency,
+                'sinks': [sink.get_stats() for sink in self.sinks]}
+
+    def close(self):
+        """Stop the sink threads; undelivered events stay queued on disk"""
+        for sink in self.sinks:
+            sink.stop()
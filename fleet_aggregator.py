@@ -0,0 +1,516 @@
+#!/usr/bin/env python3
+"""
+Fleet aggregator for the No-Smoking Detection System
+Collects violation events and health metrics from many detector nodes (a
+"fleet" sink in each node's FORWARD_SINKS), stores them in an indexed SQLite
+database and serves a fleet dashboard and JSON API:
+    python fleet_aggregator.py --port 7070 --web-port 8080 --db fleet.db
+"""
+
+import argparse
+import json
+import queue
+import re
+import socket
+import socketserver
+import sqlite3
+import struct
+import threading
+import time
+from datetime import datetime
+
+from flask import Flask, jsonify, render_template_string, request
+
+from framing import pack_frame, read_frame
+
+# ==================== SETTINGS ====================
+FLEET_PORT = 7070                 # Node ingest port (FLEET_PORT on the nodes)
+WEB_PORT = 8080                   # Fleet dashboard / API
+DB_PATH = "fleet.db"
+NODE_TIMEOUT = 35                 # Seconds without a report before a node counts as offline
+COMMIT_INTERVAL = 0.1             # Group commit window; events are acked after their commit
+RETENTION_DAYS = 90               # Events and metrics older than this are deleted
+RETENTION_CHECK_INTERVAL = 3600   # Seconds between retention sweeps
+
+# ==================== PROTOCOL ====================
+# Must match FleetSink in event_forwarding.py. Frames as in framing.py.
+HELLO, METRICS, EVENTS, ACK = 1, 2, 3, 4
+MAX_FRAME = 4 * 1024 * 1024
+METRIC_KEYS = ('uptime_s', 'cpu_temp_c', 'rss_mb', 'memory_level', 'cameras', 'fps',
+               'detect_ms', 'queue_ms', 'violations', 'forward_queued')
+FLAG_SENSOR, FLAG_MOTION, FLAG_VISUAL = 1, 2, 4
+NODE_NAME = re.compile(r'[A-Za-z0-9._-]{1,64}')  # Node names accepted at HELLO
+MAX_NODE_INTERVAL = 3600          # Longest metrics interval accepted at HELLO (seconds)
+
+def decode_metrics(payload):
+    """(time, {key: value}) from a METRICS payload; unknown key ids are skipped"""
+    when = struct.unpack_from('>d', payload)[0]
+    values = {}
+    for offset in range(8, len(payload) - 4, 5):
+        key, value = struct.unpack_from('>Bf', payload, offset)
+        if key < len(METRIC_KEYS):
+            values[METRIC_KEYS[key]] = round(value, 3)
+    return when, values
+
+def decode_events(payload):
+    """(seq, [(id, time, camera, flags, confidence, boxes)]) from an EVENTS payload"""
+    seq, count = struct.unpack_from('>IH', payload)
+    offset = 6
+    events = []
+    for _ in range(count):
+        event_id = payload[offset:offset + 16]
+        when, camera_len = struct.unpack_from('>dB', payload, offset + 16)
+        offset += 25
+        camera = payload[offset:offset + camera_len].decode(errors='replace')
+        offset += camera_len
+        flags, confidence, box_count = struct.unpack_from('>BBB', payload, offset)
+        offset += 3
+        boxes = [list(struct.unpack_from('>4h', payload, offset + 8 * i)) for i in range(box_count)]
+        offset += 8 * box_count
+        events.append((event_id, when, camera, flags, confidence / 255, boxes))
+    return seq, events
+
+# ==================== STORAGE ====================
+
+class FleetStore:
+    """SQLite database written by one thread with group commits
+
+    Connection handlers hand rows to the writer and, for events, wait for the
+    commit before acknowledging, so an acked event is on disk. Batching all
+    nodes' rows into one transaction per COMMIT_INTERVAL keeps hundreds of
+    nodes to a few fsyncs per second. Readers use their own connections (WAL
+    mode lets them run while the writer commits).
+    """
+
+    def __init__(self, path=DB_PATH, retention_days=RETENTION_DAYS):
+        """Create the schema and start the writer thread"""
+        self.path = path
+        self.retention_days = retention_days
+        self.local = threading.local()
+        self.pending = queue.Queue()
+        self.stats = {'events': 0, 'duplicates': 0, 'metrics': 0, 'commits': 0}
+
+        db = self._connect()
+        db.executescript("""
+            CREATE TABLE IF NOT EXISTS nodes (
+                node TEXT PRIMARY KEY, address TEXT, protocol INTEGER, interval REAL,
+                first_seen REAL, last_seen REAL, connected INTEGER DEFAULT 0,
+                connects INTEGER DEFAULT 0);
+            CREATE TABLE IF NOT EXISTS events (
+                id BLOB PRIMARY KEY, node TEXT, camera TEXT, t REAL, received REAL,
+                flags INTEGER, confidence REAL, boxes TEXT) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS events_node_t ON events (node, t);
+            CREATE INDEX IF NOT EXISTS events_t ON events (t);
+            CREATE TABLE IF NOT EXISTS metrics (node TEXT, t REAL);
+            CREATE INDEX IF NOT EXISTS metrics_node_t ON metrics (node, t);
+        """)
+        # Metric columns follow METRIC_KEYS, so newer keys are added on upgrade
+        columns = {row[1] for row in db.execute("PRAGMA table_info(metrics)")}
+        for key in METRIC_KEYS:
+            if key not in columns:
+                db.execute(f"ALTER TABLE metrics ADD COLUMN {key} REAL")
+        db.execute("UPDATE nodes SET connected = 0")  # Nobody is connected after a restart
+        db.commit()
+
+        self.running = True
+        self.writer = threading.Thread(target=self._write_loop, daemon=True)
+        self.writer.start()
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def _reader(self):
+        """This thread's read connection"""
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = self.local.db = self._connect()
+            db.row_factory = sqlite3.Row
+        return db
+
+    def submit(self, kind, data, wait=False):
+        """Queue a write; with wait=True, returns after it is committed (raises if it was not)"""
+        done = threading.Event() if wait else None
+        if done is not None:
+            done.committed = False
+        self.pending.put((kind, data, done))
+        if done is not None and not (done.wait(30) and done.committed):
+            raise RuntimeError("database commit failed")
+
+    def _write_loop(self):
+        db = self._connect()
+        next_retention = time.time()
+        while self.running or not self.pending.empty():
+            try:
+                batch = [self.pending.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+            deadline = time.time() + COMMIT_INTERVAL
+            while time.time() < deadline:
+                try:
+                    batch.append(self.pending.get(timeout=max(0.0, deadline - time.time())))
+                except queue.Empty:
+                    break
+            committed = False
+            try:
+                for kind, data, done in batch:
+                    self._apply(db, kind, data)
+                db.commit()
+                committed = True
+                self.stats['commits'] += 1
+            except sqlite3.Error as e:
+                print(f"⚠ Fleet database write failed: {e}")
+                db.rollback()
+            for kind, data, done in batch:
+                if done is not None:
+                    done.committed = committed  # Not acked: the node sends the batch again
+                    done.set()
+            if time.time() >= next_retention:
+                next_retention = time.time() + RETENTION_CHECK_INTERVAL
+                self._apply_retention(db)
+        db.close()
+
+    def _apply(self, db, kind, data):
+        if kind == 'events':
+            node, received, events = data
+            before = db.total_changes
+            db.executemany("INSERT OR IGNORE INTO events VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                           [(event_id, node, camera, when, received, flags, confidence,
+                             json.dumps(boxes)) for event_id, when, camera, flags, confidence, boxes
+                            in events])
+            inserted = db.total_changes - before
+            self.stats['events'] += inserted
+            self.stats['duplicates'] += len(events) - inserted  # Re-sent after a lost ack
+            db.execute("UPDATE nodes SET last_seen = ? WHERE node = ?", (received, node))
+        elif kind == 'metrics':
+            node, when, values = data
+            keys = list(values)
+            db.execute(f"INSERT INTO metrics (node, t{''.join(', ' + k for k in keys)}) "
+                       f"VALUES (?, ?{', ?' * len(keys)})", [node, when] + [values[k] for k in keys])
+            db.execute("UPDATE nodes SET last_seen = ? WHERE node = ?", (time.time(), node))
+            self.stats['metrics'] += 1
+        elif kind == 'connect':
+            node, address, hello, now = data
+            db.execute("""INSERT INTO nodes (node, address, protocol, interval, first_seen,
+                                             last_seen, connected, connects)
+                          VALUES (?, ?, ?, ?, ?, ?, 1, 1)
+                          ON CONFLICT (node) DO UPDATE SET address = excluded.address,
+                              protocol = excluded.protocol, interval = excluded.interval,
+                              last_seen = excluded.last_seen, connected = 1,
+                              connects = connects + 1""",
+                       (node, address, hello.get('protocol'), hello.get('interval'), now, now))
+        elif kind == 'disconnect':
+            db.execute("UPDATE nodes SET connected = 0 WHERE node = ?", (data,))
+
+    def _apply_retention(self, db):
+        cutoff = time.time() - self.retention_days * 86400
+        db.execute("DELETE FROM events WHERE t < ?", (cutoff,))
+        db.execute("DELETE FROM metrics WHERE t < ?", (cutoff,))
+        db.commit()
+
+    # ---- Queries ----
+
+    def nodes(self):
+        """Per-node health: status, latest metrics, violation rates and latency"""
+        db = self._reader()
+        now = time.time()
+        latest = {row['node']: dict(row) for row in db.execute(
+            "SELECT m.* FROM metrics m JOIN (SELECT node, MAX(t) AS t FROM metrics GROUP BY node) l "
+            "ON m.node = l.node AND m.t = l.t")}
+        counts = {row['node']: row for row in db.execute(
+            "SELECT node, SUM(t >= ?) AS last_hour, COUNT(*) AS last_day, "
+            "AVG(CASE WHEN t >= ? THEN received - t END) AS ingest_s "
+            "FROM events WHERE t >= ? GROUP BY node", (now - 3600, now - 3600, now - 86400))}
+        nodes = []
+        for row in db.execute("SELECT * FROM nodes ORDER BY node"):
+            node = dict(row)
+            metrics = latest.get(node['node'], {})
+            c = counts.get(node['node'])
+            timeout = max(NODE_TIMEOUT, 3.5 * (node['interval'] or 0))
+            node.update(
+                online=bool(node['connected']) and now - (node['last_seen'] or 0) < timeout,
+                last_seen_s=round(now - node['last_seen'], 1) if node['last_seen'] else None,
+                metrics={k: metrics.get(k) for k in METRIC_KEYS},
+                metrics_age_s=round(now - metrics['t'], 1) if metrics else None,
+                violations_1h=(c['last_hour'] or 0) if c else 0,
+                violations_24h=c['last_day'] if c else 0,
+                ingest_ms=round(c['ingest_s'] * 1000, 1) if c and c['ingest_s'] is not None else None)
+            nodes.append(node)
+        return nodes
+
+    def node_metrics(self, node, since):
+        """Metric history of one node"""
+        rows = self._reader().execute("SELECT * FROM metrics WHERE node = ? AND t >= ? ORDER BY t",
+                                      (node, since))
+        return [dict(row) for row in rows]
+
+    def events(self, node=None, since=0, until=None, limit=500):
+        """Most recent events, newest first"""
+        sql = "SELECT * FROM events WHERE t >= ? AND t < ?"
+        args = [since, until if until is not None else time.time() + 86400]
+        if node:
+            sql += " AND node = ?"
+            args.append(node)
+        sql += " ORDER BY t DESC LIMIT ?"
+        args.append(limit)
+        return [{
+            'id': row['id'].hex(), 'node': row['node'], 'camera': row['camera'],
+            'time': datetime.fromtimestamp(row['t']).isoformat(timespec='seconds'),
+            'ingest_ms': round((row['received'] - row['t']) * 1000, 1),
+            'sensor': bool(row['flags'] & FLAG_SENSOR), 'motion': bool(row['flags'] & FLAG_MOTION),
+            'visual': bool(row['flags'] & FLAG_VISUAL), 'confidence': round(row['confidence'], 3),
+            'boxes': json.loads(row['boxes'])
+        } for row in self._reader().execute(sql, args)]
+
+    def rates(self, bucket='hour', since=None, node=None):
+        """Violations per hour or day across the fleet (or one node)"""
+        size = 86400 if bucket == 'day' else 3600
+        since = since if since is not None else time.time() - 7 * 86400
+        sql = ("SELECT CAST(t / ? AS INTEGER) * ? AS bucket, COUNT(*) AS violations, "
+               "COUNT(DISTINCT node) AS nodes FROM events WHERE t >= ?")
+        args = [size, size, since]
+        if node:
+            sql += " AND node = ?"
+            args.append(node)
+        sql += " GROUP BY bucket ORDER BY bucket"
+        return [{'time': datetime.fromtimestamp(row['bucket']).isoformat(timespec='seconds'),
+                 'violations': row['violations'], 'nodes': row['nodes']}
+                for row in self._reader().execute(sql, args)]
+
+    def close(self):
+        """Commit what is queued and stop the writer"""
+        self.running = False
+        self.writer.join(timeout=10)
+
+# ==================== INGEST SERVER ====================
+
+class NodeConnection(socketserver.BaseRequestHandler):
+    """One node's connection: HELLO first, then METRICS and EVENTS frames"""
+
+    def handle(self):
+        server = self.server
+        store = server.store
+        sock = self.request
+        # A node that disappears without closing (power cut) frees its thread here
+        sock.settimeout(NODE_TIMEOUT * 3)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        node = None
+        server.track(sock, True)
+        try:
+            kind, payload = read_frame(sock, MAX_FRAME, "node")
+            if kind != HELLO:
+                return
+            hello = json.loads(payload)
+            if not isinstance(hello['node'], str) or not NODE_NAME.fullmatch(hello['node']):
+                return  # Names end up in the dashboard and the database
+            interval = hello.get('interval')
+            if (isinstance(interval, bool) or not isinstance(interval, (int, float))
+                    or not 0 < interval <= MAX_NODE_INTERVAL):
+                return  # Drives the online timeout; NaN and infinity fail the range check
+            node = hello['node']
+            session = server.open_session(node)
+            store.submit('connect', (node, self.client_address[0], hello, time.time()))
+            while True:
+                kind, payload = read_frame(sock, MAX_FRAME, "node")
+                if kind == METRICS:
+                    when, values = decode_metrics(payload)
+                    store.submit('metrics', (node, when, values))
+                elif kind == EVENTS:
+                    seq, events = decode_events(payload)
+                    store.submit('events', (node, time.time(), events), wait=True)
+                    sock.sendall(pack_frame(ACK, struct.pack('>I', seq)))
+        except (OSError, ValueError, KeyError, RuntimeError, struct.error):
+            pass
+        finally:
+            server.track(sock, False)
+            if node is not None and server.close_session(node, session):
+                store.submit('disconnect', node)
+
+class FleetServer(socketserver.ThreadingTCPServer):
+    """Threaded ingest server; tracks node sessions so a reconnect is not undone
+    by the old connection closing later"""
+
+    allow_reuse_address = True
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, store):
+        """Listen for nodes"""
+        super().__init__(address, NodeConnection)
+        self.store = store
+        self.lock = threading.Lock()
+        self.sessions = {}   # node -> current session number
+        self.sockets = set()
+
+    def open_session(self, node):
+        with self.lock:
+            self.sessions[node] = self.sessions.get(node, 0) + 1
+            return self.sessions[node]
+
+    def close_session(self, node, session):
+        """True if this was the node's current connection"""
+        with self.lock:
+            return self.sessions.get(node) == session
+
+    def track(self, sock, active):
+        with self.lock:
+            (self.sockets.add if active else self.sockets.discard)(sock)
+
+    def connections(self):
+        with self.lock:
+            return len(self.sockets)
+
+    def close_connections(self):
+        """Drop every node connection (shutdown, or simulating an outage)"""
+        with self.lock:
+            sockets = list(self.sockets)
+        for sock in sockets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+def start_ingest(store, host='0.0.0.0', port=FLEET_PORT):
+    """Run the ingest server in a background thread"""
+    server = FleetServer((host, port), store)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# ==================== WEB ====================
+
+DASHBOARD_HTML = """
+<!DOCTYPE html>
+<html>
+<head>
+    <title>No-Smoking Fleet</title>
+    <meta name="viewport" content="width=device-width, initial-scale=1">
+    <style>
+        body { font-family: Arial, sans-serif; background: #1a1a2e; color: #eee; margin: 20px; }
+        h1 { color: #ff6b6b; }
+        .summary { display: flex; gap: 15px; margin-bottom: 20px; }
+        .card { background: #16213e; padding: 15px 25px; border-radius: 8px; }
+        .card b { display: block; font-size: 1.8em; color: #4ecca3; }
+        table { border-collapse: collapse; width: 100%; background: #16213e; }
+        th, td { padding: 8px 10px; text-align: right; border-bottom: 1px solid #0f3460; }
+        th:first-child, td:first-child { text-align: left; }
+        .online { color: #4ecca3; } .offline { color: #ff6b6b; }
+    </style>
+</head>
+<body>
+    <h1>🚭 No-Smoking Fleet</h1>
+    <div class="summary">
+        <div class="card"><b id="online">-</b>nodes online</div>
+        <div class="card"><b id="hour">-</b>violations (1 h)</div>
+        <div class="card"><b id="day">-</b>violations (24 h)</div>
+    </div>
+    <table>
+        <thead><tr><th>Node</th><th>Status</th><th>Last seen</th><th>Uptime</th><th>FPS</th>
+            <th>Detect ms</th><th>Queue ms</th><th>Ingest ms</th><th>Temp °C</th><th>Memory</th>
+            <th>Queued</th><th>1 h</th><th>24 h</th><th>Connects</th></tr></thead>
+        <tbody id="nodes"></tbody>
+    </table>
+    <script>
+        const fmt = (v, d = 0) => v === null || v === undefined ? '-' : Number(v).toFixed(d);
+        async function refresh() {
+            const data = await (await fetch('/api/fleet')).json();
+            document.getElementById('online').textContent = data.online + ' / ' + data.nodes;
+            document.getElementById('hour').textContent = data.violations_1h;
+            document.getElementById('day').textContent = data.violations_24h;
+            const nodes = await (await fetch('/api/nodes')).json();
+            // Cells are filled with textContent: node data never becomes markup
+            document.getElementById('nodes').replaceChildren(...nodes.nodes.map(n => {
+                const m = n.metrics;
+                const row = document.createElement('tr');
+                const cells = [n.node, n.online ? 'online' : 'offline', fmt(n.last_seen_s) + ' s',
+                    fmt(m.uptime_s / 3600, 1) + ' h', fmt(m.fps, 1), fmt(m.detect_ms, 1),
+                    fmt(m.queue_ms, 1), fmt(n.ingest_ms), fmt(m.cpu_temp_c, 1), fmt(m.memory_level),
+                    fmt(m.forward_queued), fmt(n.violations_1h), fmt(n.violations_24h), fmt(n.connects)];
+                cells.forEach((text, i) => {
+                    const cell = row.insertCell();
+                    cell.textContent = text;
+                    if (i === 1) cell.className = n.online ? 'online' : 'offline';
+                });
+                return row;
+            }));
+        }
+        refresh();
+        setInterval(refresh, 5000);
+    </script>
+</body>
+</html>
+"""
+
+def create_app(store, server=None):
+    """Flask app serving the fleet dashboard and API"""
+    app = Flask(__name__)
+
+    @app.route('/')
+    def index():
+        return render_template_string(DASHBOARD_HTML)
+
+    @app.route('/api/fleet')
+    def api_fleet():
+        """Fleet-wide summary"""
+        nodes = store.nodes()
+        return jsonify({
+            'nodes': len(nodes),
+            'online': sum(n['online'] for n in nodes),
+            'violations_1h': sum(n['violations_1h'] for n in nodes),
+            'violations_24h': sum(n['violations_24h'] for n in nodes),
+            'connections': server.connections() if server else None,
+            'ingest': dict(store.stats, queued_writes=store.pending.qsize())
+        })
+
+    @app.route('/api/nodes')
+    def api_nodes():
+        """Per-node health, violation rates and latency"""
+        return jsonify({'nodes': store.nodes()})
+
+    @app.route('/api/nodes/<node>')
+    def api_node(node):
+        """One node with its metric history (since= seconds ago, default 24 h)"""
+        match = [n for n in store.nodes() if n['node'] == node]
+        if not match:
+            return jsonify({'error': f'Unknown node: {node}'}), 404
+        since = time.time() - request.args.get('since', 86400, type=float)
+        return jsonify(dict(match[0], history=store.node_metrics(node, since)))
+
+    @app.route('/api/events')
+    def api_events():
+        """Recent events (node=, since= seconds ago, limit=)"""
+        since = time.time() - request.args.get('since', 86400, type=float)
+        limit = min(request.args.get('limit', 500, type=int), 5000)
+        return jsonify({'events': store.events(request.args.get('node'), since, limit=limit)})
+
+    @app.route('/api/rates')
+    def api_rates():
+        """Violations per bucket=hour|day (node= to filter), last 7 days"""
+        bucket = request.args.get('bucket', 'hour')
+        if bucket not in ('hour', 'day'):
+            return jsonify({'error': 'bucket must be hour or day'}), 400
+        return jsonify({'bucket': bucket, 'rates': store.rates(bucket, node=request.args.get('node'))})
+
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="No-Smoking Detection System fleet aggregator")
+    parser.add_argument('--port', type=int, default=FLEET_PORT, help="Node ingest port")
+    parser.add_argument('--web-port', type=int, default=WEB_PORT, help="Dashboard/API port")
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--retention-days', type=float, default=RETENTION_DAYS)
+    args = parser.parse_args()
+
+    store = FleetStore(args.db, args.retention_days)
+    server = start_ingest(store, port=args.port)
+    print(f"✓ Fleet aggregator: nodes on port {args.port}, dashboard on http://0.0.0.0:{args.web_port}")
+    try:
+        create_app(store, server).run(host='0.0.0.0', port=args.web_port, threaded=True, debug=False)
+    finally:
+        server.shutdown()
+        server.close_connections()
+        store.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""
+Socket framing shared by the detector, inference_server.py and fleet_aggregator.py
+Frames are a 1-byte type and a 4-byte big-endian length followed by the payload.
+Standard library only, so the fleet aggregator runs without the detector's
+dependencies.
+"""
+
+import socket
+import struct
+
+HEADER = struct.Struct('>BI')
+
+def pack_frame(kind, payload):
+    """One frame, ready for sendall()"""
+    return HEADER.pack(kind, len(payload)) + payload
+
+def recv_exactly(sock, size, peer="peer", idle=None):
+    """Exactly size bytes from a socket; ConnectionError if the peer closes first
+
+    A socket timeout is raised unless idle() returns True, in which case the
+    read keeps waiting (a reader thread that idles while its connection lives).
+    """
+    data = bytearray()
+    while len(data) < size:
+        try:
+            chunk = sock.recv(size - len(data))
+        except socket.timeout:
+            if idle is not None and idle():
+                continue
+            raise
+        if not chunk:
+            raise ConnectionError(f"connection closed by {peer}")
+        data += chunk
+    return bytes(data)
+
+def read_frame(sock, max_size=None, peer="peer", idle=None):
+    """(type, payload) of the next frame; ValueError for a frame over max_size"""
+    kind, length = HEADER.unpack(recv_exactly(sock, HEADER.size, peer, idle))
+    if max_size is not None and length > max_size:
+        raise ValueError(f"frame of {length} bytes")
+    return kind, recv_exactly(sock, length, peer, idle)
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Inference server for the No-Smoking Detection System
+Runs the expensive detection stages (person, cigarette) for detector nodes that
+set OFFLOAD_SERVER, on a machine on the same LAN with models too slow for a
+Pi Zero 2 W. The nodes keep their local detectors as fallback:
+    python inference_server.py --port 7071 --person-model yolov8n-person \\
+        --cigarette-model cigarette-yolov8n-int8
+"""
+
+import argparse
+import json
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+import cv2
+import numpy as np
+
+import smoking_detector_with_sh1106 as sd
+from framing import pack_frame, read_frame
+
+# ==================== SETTINGS ====================
+PORT = sd.OFFLOAD_PORT            # OFFLOAD_PORT on the nodes
+WORKERS = 4                       # Images decoded and detected in parallel (all nodes)
+PERSON_MODEL = "yolov8n-person"   # MODELS keys; a model that cannot be loaded is not served,
+CIGARETTE_MODEL = "cigarette-yolov8n-int8"  # except cigarettes: the HSV detector stands in
+MAX_CANDIDATES = 32               # Most detections returned per stage
+STATS_INTERVAL = 60               # Seconds between throughput lines in the log
+
+# ==================== PROTOCOL ====================
+# Frame types, protocol version and stage flags are OffloadClient's in
+# smoking_detector_with_sh1106.py; frames as in framing.py.
+MAX_FRAME = 8 * 1024 * 1024
+
+def encode_result(request_id, server_ms, results):
+    """RESULT payload from {stage flag: (threshold, [(confidence, [x, y, w, h])])}"""
+    parts = [struct.pack('>IfB', request_id, server_ms, len(results))]
+    for flag, (threshold, candidates) in results.items():
+        parts.append(struct.pack('>BfB', flag, threshold, len(candidates)))
+        parts.extend(struct.pack('>f4h', confidence, *(max(-32768, min(32767, int(v))) for v in box))
+                     for confidence, box in candidates)
+    return b''.join(parts)
+
+# ==================== DETECTORS ====================
+
+class Detectors:
+    """The models this server runs, shared by every connection"""
+
+    def __init__(self, person_model=PERSON_MODEL, cigarette_model=CIGARETTE_MODEL):
+        """Load the models; the HSV detector serves cigarettes if there is no model"""
+        self.person = self._load(person_model)
+        self.cigarette = self._load(cigarette_model)
+        settings = dict(sd.detector_settings(sd.default_config()), enable_visual=True,
+                        person_model=None, cigarette_model=None)
+        self.hsv = sd.DetectionEngine(settings=settings)
+        self.stages = {'visual': self.cigarette.name if self.cigarette else "hsv-visual"}
+        if self.person is not None:
+            self.stages['person'] = self.person.name
+
+    @staticmethod
+    def _load(name):
+        if not name:
+            return None
+        try:
+            model = sd.load_detector_model(name)
+            print(f"✓ {name} loaded ({model.backend}, {model.input_size[0]}x{model.input_size[1]}, "
+                  f"{model.threads} threads)")
+            return model
+        except Exception as e:
+            print(f"⚠ {name} not available: {e}")
+            return None
+
+    @staticmethod
+    def _candidates(model, image):
+        """(threshold, strongest detections of the model's classes)"""
+        found = sorted(((score, box) for class_id, score, box in model.detect(image)
+                        if class_id in model.classes), key=lambda d: -d[0])
+        return model.threshold, found[:MAX_CANDIDATES]
+
+    def detect(self, image, flags):
+        """{stage flag: (threshold, candidates)}; a stage that fails is left out"""
+        person, visual = (sd.OffloadClient.STAGE_FLAGS[s] for s in ('person', 'visual'))
+        results = {}
+        try:
+            if flags & person and self.person is not None:
+                results[person] = self._candidates(self.person, image)
+        except Exception as e:
+            print(f"Person model error: {e}")
+        try:
+            if flags & visual:
+                if self.cigarette is not None:
+                    results[visual] = self._candidates(self.cigarette, image)
+                else:
+                    score, boxes = self.hsv.score_cigarette_visual(image)
+                    results[visual] = (0.5, [(score, box) for box in boxes[:MAX_CANDIDATES]])
+        except Exception as e:
+            print(f"Cigarette detection error: {e}")
+        return results
+
+# ==================== SERVER ====================
+
+class NodeConnection(socketserver.BaseRequestHandler):
+    """One node's connection: HELLO both ways, then DETECT frames in and RESULT frames out"""
+
+    def send(self, kind, payload):
+        """Send one frame (workers answer on this connection concurrently)"""
+        with self.send_lock:
+            self.request.sendall(pack_frame(kind, payload))
+
+    def handle(self):
+        server = self.server
+        sock = self.request
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        # A node that disappears without closing (power cut) frees its thread eventually
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        self.send_lock = threading.Lock()
+        node = None
+        try:
+            kind, payload = read_frame(sock, MAX_FRAME, "node")
+            if kind != sd.OffloadClient.HELLO:
+                return
+            hello = json.loads(payload)
+            # Requests queued longer than the node waits are not worth running
+            deadline = float(hello.get('timeout') or 0)
+            self.send(sd.OffloadClient.HELLO, json.dumps({
+                'protocol': sd.OffloadClient.PROTOCOL, 'stages': server.detectors.stages}).encode())
+            node = str(hello.get('node') or self.client_address[0])[:64]
+            server.track(node, sock, True)
+            while True:
+                kind, payload = read_frame(sock, MAX_FRAME, "node")
+                if kind == sd.OffloadClient.DETECT:
+                    server.jobs.put((self, payload, time.monotonic(), deadline))
+        except (OSError, ValueError, KeyError, struct.error):
+            pass
+        finally:
+            if node is not None:
+                server.track(node, sock, False)
+
+class InferenceServer(socketserver.ThreadingTCPServer):
+    """Threaded server; every connection's requests go through one worker pool"""
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, detectors, workers=WORKERS):
+        """Listen for nodes and start the workers"""
+        super().__init__(address, NodeConnection)
+        self.detectors = detectors
+        self.jobs = queue.Queue()
+        self.lock = threading.Lock()
+        self.nodes = {}   # node -> open connections
+        self.sockets = set()
+        self.stats = {'images': 0, 'stale': 0, 'bytes': 0, 'total_ms': 0.0, 'connects': 0}
+        self.workers = [threading.Thread(target=self._work, daemon=True)
+                        for _ in range(max(1, int(workers)))]
+        for worker in self.workers:
+            worker.start()
+
+    def track(self, node, sock, connected):
+        with self.lock:
+            self.nodes[node] = self.nodes.get(node, 0) + (1 if connected else -1)
+            if connected:
+                self.sockets.add(sock)
+                self.stats['connects'] += 1
+            else:
+                self.sockets.discard(sock)
+                if self.nodes[node] <= 0:
+                    del self.nodes[node]
+        print(f"{'✓' if connected else '⚠'} {node} {'connected' if connected else 'disconnected'}")
+
+    def _work(self):
+        """Decode, detect and answer queued requests"""
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            conn, payload, received, deadline = job
+            start = time.monotonic()
+            request_id, flags = struct.unpack_from('>IB', payload)
+            if deadline and start - received > deadline:
+                with self.lock:
+                    self.stats['stale'] += 1
+                continue  # The node has already detected this frame locally
+            image = cv2.imdecode(np.frombuffer(payload, np.uint8, offset=5), cv2.IMREAD_COLOR)
+            results = self.detectors.detect(image, flags) if image is not None else {}
+            ms = (time.monotonic() - start) * 1000
+            try:
+                conn.send(sd.OffloadClient.RESULT, encode_result(request_id, ms, results))
+            except OSError:
+                pass
+            with self.lock:
+                self.stats['images'] += 1
+                self.stats['bytes'] += len(payload)
+                self.stats['total_ms'] += ms
+
+    def get_stats(self):
+        """Images served, their average cost and the connected nodes"""
+        with self.lock:
+            images = self.stats['images']
+            return {
+                'nodes': dict(self.nodes),
+                'images': images,
+                'stale': self.stats['stale'],
+                'connects': self.stats['connects'],
+                'queued': self.jobs.qsize(),
+                'avg_ms': round(self.stats['total_ms'] / images, 1) if images else 0.0,
+                'avg_kb': round(self.stats['bytes'] / images / 1024, 1) if images else 0.0
+            }
+
+    def close_connections(self):
+        """Drop every node connection (shutdown, or simulating an outage)"""
+        with self.lock:
+            sockets = list(self.sockets)
+        for sock in sockets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def close(self):
+        """Stop listening, drop the nodes and stop the workers"""
+        self.shutdown()
+        self.server_close()
+        self.close_connections()
+        for _ in self.workers:
+            self.jobs.put(None)
+
+def start_server(detectors, host='0.0.0.0', port=PORT, workers=WORKERS):
+    """Run the server in a background thread"""
+    server = InferenceServer((host, port), detectors, workers)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="No-Smoking Detection System inference server")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    parser.add_argument('--person-model', default=PERSON_MODEL, help="MODELS key ('' = none)")
+    parser.add_argument('--cigarette-model', default=CIGARETTE_MODEL,
+                        help="MODELS key ('' = HSV detector)")
+    args = parser.parse_args()
+
+    detectors = Detectors(args.person_model, args.cigarette_model)
+    server = start_server(detectors, args.host, args.port, args.workers)
+    served = ', '.join(f"{s}: {m}" for s, m in detectors.stages.items())
+    print(f"✓ Inference server on port {args.port} ({served}, {args.workers} workers)")
+    last = (time.time(), 0)
+    try:
+        while True:
+            time.sleep(STATS_INTERVAL)
+            stats = server.get_stats()
+            now = time.time()
+            rate = (stats['images'] - last[1]) / (now - last[0])
+            last = (now, stats['images'])
+            print(f"📊 {len(stats['nodes'])} nodes, {rate:.1f} images/s, {stats['avg_ms']} ms avg, "
+                  f"{stats['stale']} stale, {stats['queued']} queued")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+if __name__ == "__main__":
+    main()
@@ -24,6 +24,13 @@ if [ ! -f "$SCRIPT_PATH" ]; then
     echo "   Please ensure smoking_detector_with_sh1106.py is in /home/raspberrypi/"
     exit 1
 fi
+for module in event_forwarding.py framing.py; do
+    if [ ! -f "$(dirname "$SCRIPT_PATH")/$module" ]; then
+        echo "❌ $module not found next to the script"
+        echo "   Please copy it to /home/raspberrypi/ as well"
+        exit 1
+    fi
+done
 echo "✓ Script found"
 
 echo ""
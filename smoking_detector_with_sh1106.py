@@ -8,17 +8,48 @@ Access via: http://<pi-ip-address>:5000
 
 import cv2
 import numpy as np
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
+import shutil
 import time
-from picamera2 import Picamera2
 import threading
-import RPi.GPIO as GPIO
-from flask import Flask, render_template_string, Response, jsonify, send_from_directory
-from luma.core.interface.serial import i2c
-from luma.oled.device import sh1106
+import itertools
+import hashlib
+import io
+import json
+import base64
+import socket
+import struct
+import tarfile
+import multiprocessing
+from collections import OrderedDict, deque, namedtuple
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from flask import (Flask, render_template_string, Response, jsonify, send_from_directory,
+                   request, abort)
+from werkzeug.security import safe_join
 from PIL import Image, ImageDraw, ImageFont
 
+from event_forwarding import EventForwarder, write_json_atomic
+from framing import pack_frame, read_frame
+
+# Pi hardware libraries are optional so the system (and benchmark.py soak) can run
+# on a workstation from stream/synthetic sources; the hardware classes then disable
+# themselves like they do when a device is not wired up
+try:
+    from picamera2 import Picamera2, MappedArray
+except ImportError:
+    Picamera2 = MappedArray = None
+try:
+    import RPi.GPIO as GPIO
+except ImportError:
+    GPIO = None
+try:
+    from luma.core.interface.serial import i2c
+    from luma.oled.device import sh1106
+except ImportError:
+    i2c = sh1106 = None
+
 # ==================== GPIO CONFIGURATION ====================
 MQ135_PIN = 17      # MQ-135 smoke sensor
 BUZZER_PIN = 27     # Optional buzzer
@@ -36,14 +67,220 @@ ENABLE_MOTION = True              # Enable motion detection
 ENABLE_VISUAL = True              # Enable visual cigarette detection (IMPROVED ALGORITHM)
 ENABLE_OLED = True                # Enable OLED display
 SENSOR_INVERTED = False           # Set True if sensor logic is backwards
-DETECTION_CONFIDENCE = 0.5        # Visual detection threshold (0.1-0.9) - Balanced sensitivity
+DETECTION_CONFIDENCE = 0.5        # Fused confidence needed for a violation (0.1-0.9) - Balanced sensitivity
+
+# HSV ranges of the visual detector (OpenCV: H 0-180, S/V 0-255)
+HSV_ORANGE_LOWER = (0, 150, 150)  # Lit tip: bright, saturated orange/red
+HSV_ORANGE_UPPER = (20, 255, 255)
+HSV_WHITE_LOWER = (0, 0, 180)     # Cigarette body: bright, unsaturated white
+HSV_WHITE_UPPER = (180, 30, 255)
+
+# ==================== TEMPORAL FUSION ====================
+FUSION_ALPHA = 0.35               # EWMA weight of the newest frame (lower = slower, steadier)
+FUSION_WEIGHTS = {                # How much each smoothed detector score counts (noisy-OR)
+    "sensor": 1.0,
+    "person": 0.6,
+    "motion": 0.6,
+    "visual": 1.0
+}
+FUSION_CONCLUSIVE_HIGH = 0.9      # At/above this the evidence is conclusive: violation
+FUSION_CONCLUSIVE_LOW = 0.05      # At/below this the evidence is conclusive: nothing there
+FUSION_RECHECK_FRAMES = 3         # While conclusive, still run expensive detectors every Nth frame
+
+# ==================== DETECTION CASCADE ====================
+DETECTION_CASCADE = True          # Cheap gates decide whether the expensive detectors run at all
+CASCADE_GATES = ("sensor", "motion")     # Cheap stages, always run (cheapest measured first)
+CASCADE_STAGES = ("person", "visual")    # Expensive stages, run only when a gate opens
+CASCADE_MOTION_GATE = 0.05        # Motion score that opens the gate (0.05 = 500 px^2 changed)
+CASCADE_EXIT_SCORE = 0.9          # Stop running further stages once one scores this high
+CASCADE_REFRESH_FRAMES = 10       # Still run every stage at least every Nth frame per camera
+MOTION_SCALE = 0.5                # Frame differencing runs at this fraction of the frame size
+
+# ==================== MODELS ====================
+MODEL_DIR = os.path.dirname(os.path.abspath(__file__))  # Relative model paths are resolved here
+
+# Detector registry. Swapping a model is a change to PERSON_MODEL / CIGARETTE_MODEL.
+#   format:     "caffe" | "onnx" | "tflite" (int8-quantised TFLite is (de)quantised automatically)
+#   layout:     output decoding - "ssd" (Caffe DetectionOutput), "tflite_ssd" (TFLite
+#               detection postprocess: boxes, classes, scores, count) or "yolo" (YOLOv5/v8 head)
+#   input_size: (width, height) the model was exported with
+#   scale/mean: input normalisation, (pixel - mean) * scale
+#   classes:    class ids that count as a hit for the model's task
+#   threads:    CPU threads for this model's inference
+MODELS = {
+    "mobilenet-ssd": {
+        "task": "person", "format": "caffe", "layout": "ssd",
+        "path": "MobileNetSSD_deploy.caffemodel", "config": "MobileNetSSD_deploy.prototxt",
+        "input_size": (300, 300), "scale": 0.007843, "mean": 127.5,
+        "classes": [15], "threshold": 0.5, "threads": 2
+    },
+    "ssdlite-mobilenet-v2-int8": {
+        "task": "person", "format": "tflite", "layout": "tflite_ssd",
+        "path": "models/ssdlite_mobilenet_v2_coco_int8.tflite",
+        "input_size": (300, 300), "scale": 1 / 127.5, "mean": 127.5,
+        "classes": [0], "threshold": 0.5, "threads": 2
+    },
+    "yolov8n-person": {
+        "task": "person", "format": "onnx", "layout": "yolo",
+        "path": "models/yolov8n.onnx",
+        "input_size": (320, 320), "classes": [0], "threshold": 0.4, "threads": 2
+    },
+    "cigarette-yolov8n-int8": {
+        "task": "cigarette", "format": "tflite", "layout": "yolo",
+        "path": "models/cigarette_yolov8n_int8.tflite",
+        "input_size": (320, 320), "classes": [0], "threshold": 0.4, "threads": 2
+    },
+}
+PERSON_MODEL = "mobilenet-ssd"    # MODELS key for person detection (None = motion only)
+CIGARETTE_MODEL = None            # MODELS key for cigarette detection (None = HSV visual detector)
+
+# ==================== TILING ====================
+TILING = False                    # Also run zoomed tiles around regions of interest (small objects)
+TILING_TASKS = ("cigarette",)     # Model tasks that use tiling ("person" works too)
+TILE_ZOOM = 2.0                   # A tile covers input_size / zoom frame pixels (2 = objects 2x larger)
+TILE_OVERLAP = 0.25               # Overlap between neighbouring tiles on large regions
+TILE_MAX = 4                      # Most tiles per frame, on top of the full-frame pass
+TILE_BUDGET_MS = 150              # Latency budget per model call; the tile count adapts to it
+
+# ==================== EDGE OFFLOAD ====================
+# The expensive stages (person, visual) can run on a stronger machine on the LAN
+# running inference_server.py. The cheap gates always run here, and a stage the
+# server does not answer within OFFLOAD_TIMEOUT runs on the local detectors.
+OFFLOAD_SERVER = None             # "host" or "host:port" of the inference server (None = local only)
+OFFLOAD_PORT = 7071               # Inference server port
+OFFLOAD_MAX_SIDE = 320            # Images are downscaled so their longer side fits this (px)
+OFFLOAD_JPEG_QUALITY = 80
+OFFLOAD_ROI_MAX_AREA = 0.5        # Send only the padded motion region while it covers less than this share
+OFFLOAD_TIMEOUT = 0.3             # Wait this long for detections before detecting locally (s)
+OFFLOAD_MAX_INFLIGHT = 4          # Frames awaiting an answer; further frames are detected locally
+OFFLOAD_MAX_LATE = 3              # Late answers in a row before a slow server is skipped...
+OFFLOAD_RETRY = 5.0               # ...for this long; also the pause between reconnects (s)
+
+# ==================== JPEG ENCODING ====================
+JPEG_ENCODER = "auto"             # "auto" (fastest installed, measured at startup), "opencv",
+                                  # "pil", "simplejpeg" or "turbojpeg"; falls back to OpenCV
+JPEG_SUBSAMPLING = "420"          # Chroma subsampling: "444", "422" or "420" (smallest/fastest)
+JPEG_FAST_DCT = True              # Faster, slightly less exact DCT (simplejpeg/turbojpeg only)
+JPEG_BENCHMARK_FRAMES = 5         # Encodes per backend in the startup benchmark
+STREAM_JPEG_QUALITY = 70          # Live stream quality (violations use image_quality)
+
+# ==================== GALLERY SETTINGS ====================
+THUMBNAIL_WIDTH = 200             # Dashboard thumbnail width (px)
+THUMBNAIL_DIR = ".thumbs"         # Thumbnail cache folder inside the violations folder
+VIOLATION_CACHE_MAX_AGE = 86400   # Browser cache lifetime for violation images/thumbnails (s)
+
+# A violation that looks like a recent one from the same camera (perceptual hash)
+# is counted as another occurrence of that event instead of saving a new image
+DEDUP_ENABLED = True
+DEDUP_HASH_SIZE = 16              # dHash grid: 16 -> 256-bit hash
+DEDUP_MAX_DISTANCE = 24           # Differing hash bits that still count as the same scene
+DEDUP_WINDOW = 300                # An event takes new occurrences until this long after its last one (s)
+DEDUP_INDEX_SIZE = 32             # Recent images remembered per camera
+
+# ==================== EVENT LOG SETTINGS ====================
+EVENT_LOG_DIR = "events"          # Columnar detection log + hourly aggregates
+EVENT_LOG_THRESHOLD = 0.5         # Log detect_all outcomes with confidence at or above this
+EVENT_LOG_MIN_INTERVAL = 1.0      # Max one raw row per camera per second while nothing changes
+EVENT_LOG_FLUSH_INTERVAL = 120    # Seconds between batched appends (few, larger SD writes)
+EVENT_LOG_RETENTION_DAYS = 30     # Day partitions kept on disk
+EVENT_LOG_MAX_LIMIT = 5000        # Most raw rows one /api/events request returns
+
+# ==================== EVENT FORWARDING ====================
+# Violations are pushed to webhook/MQTT sinks through an on-disk queue per sink,
+# so nothing is lost while the network or the receiver is down. Name each sink:
+# the name is its queue folder (outbox/<name>/).
+#   {"name": "hook", "type": "webhook", "url": "https://example.com/nosmoking",
+#    "headers": {"Authorization": "Bearer ..."}}
+#   {"name": "broker", "type": "mqtt", "host": "192.168.1.10", "port": 1883,
+#    "topic": "nosmoking", "username": "...", "password": "..."}
+# A "fleet" sink reports events and health metrics to fleet_aggregator.py:
+#   {"name": "fleet", "type": "fleet", "host": "192.168.1.5", "node": "lobby-1"}
+FORWARD_SINKS = []
+# Queue, batching, retry and fleet reporting settings are in event_forwarding.py
+
+# ==================== MEMORY GOVERNOR ====================
+# Steps down a degradation ladder when the process gets close to swap/OOM on a
+# 512 MB board, and back up when the pressure is gone (see MemoryGovernor)
+MEMORY_GOVERNOR = True            # Watch RSS / available memory (Linux /proc)
+MEMORY_CHECK_INTERVAL = 5         # Seconds between checks
+MEMORY_RSS_HIGH_MB = 300          # Step down while the process RSS is above this...
+MEMORY_AVAILABLE_LOW_MB = 64      # ...or the system's MemAvailable is below this
+MEMORY_RSS_LOW_MB = 240           # Step back up once RSS is below this...
+MEMORY_AVAILABLE_HIGH_MB = 110    # ...and MemAvailable above this
+MEMORY_RECOVER_CHECKS = 3         # Calm checks in a row before each step back up
+MEMORY_STREAM_FPS_DIVISOR = 3     # "stream_fps" level: streams send this many times fewer frames
+MEMORY_RESOLUTION_SCALE = 0.75    # "resolution" level: cameras reopen at this fraction of their size
+MEMORY_DNN_EVERY = 4              # "dnn_cadence" level: expensive detectors run on every Nth frame
+
+# ==================== SUPERVISOR ====================
+# Every stage reports heartbeats; a stage that misses its latency SLO, keeps
+# failing or whose thread died is restarted on its own (see Supervisor)
+SUPERVISOR = True                 # Restart stalled components (False = only report them)
+SUPERVISOR_INTERVAL = 1.0         # Seconds between health checks
+SUPERVISOR_SLO = {                # Seconds a stage may go without a heartbeat / spend in one call
+    'capture': 5.0,               # Camera delivering frames
+    'detect': 15.0,               # One frame through a detection worker
+    'oled': 5.0,                  # One display update over I2C
+    'sensor': 2.0,                # One MQ-135 read
+    'writer': 30.0,               # Event log / forwarding threads, on top of their own interval
+}
+SUPERVISOR_MAX_FAILURES = 5       # Failed calls in a row that count as a stall (OLED, sensor)
+SUPERVISOR_BACKOFF_MIN = 2.0      # Pause after a restart that did not bring the component back (s)
+SUPERVISOR_BACKOFF_MAX = 60.0     # The pause doubles per unsuccessful restart up to this (s)
+
+# ==================== LATENCY TRACKING ====================
+LATENCY_WINDOW = 500              # Most recent samples kept per latency metric
+LATENCY_HEADERS = True            # Frame sequence, age and latency percentiles in MJPEG part headers
+
+# ==================== CAMERA CONFIGURATION ====================
+CAMERA_RESOLUTION = (416, 320)    # Detection resolution (optimized for Pi Zero 2 W)
+DETECTION_WORKERS = 2             # Detection worker threads shared by all cameras
+DETECTION_MODE = "threads"        # "threads" or "processes" (detectors run in worker processes)
+DETECTION_PROCESSES = 3           # Worker processes in "processes" mode (one core left for capture/web)
+FRAME_SKIP = 2                    # Detect on every Nth captured frame
+CAPTURE_INTERVAL = 0.2            # Pause after handing a frame to the detection pool (s)
+SKIP_INTERVAL = 0.05              # Pause after a skipped frame (s)
+CAPTURE_STOP_TIMEOUT = 2.0        # Wait for a retired capture thread to leave read() before reconnecting (s)
+STREAM_INTERVAL = 0.1             # Pause between MJPEG frames sent to a viewer (s)
+SYNTHETIC_SCENE_FRAMES = 40       # "synthetic" source: frames per quiet/smoking scene
+
+# CSI cameras capture two streams: a small YUV420 "lores" stream at the detection
+# resolution and a full-resolution "main" stream that is only read for evidence
+DUAL_STREAM = True                # False = one RGB stream at the detection resolution
+EVIDENCE_RESOLUTION = (1640, 1232)  # Main stream size (full field of view, binned)
+EVIDENCE_MAX_WIDTH = 1640         # Saved violation images are scaled down to this width
+STREAM_FULL_RES = False           # Live stream from the main stream too (more CPU per frame)
+EVIDENCE_BUFFERS = 3              # Pooled main-stream frames (evidence and full-resolution stream)
+EVIDENCE_ARM_RATIO = 0.5          # Keep main-stream frames once fused confidence reaches this share of the threshold
+
+# One entry per camera pipeline. "source" is a Picamera2 camera index (int), any
+# URL / device path cv2.VideoCapture can open (RTSP, HTTP MJPEG, /dev/videoN), or
+# "synthetic" for generated test frames, or "replay:<video file or image folder>" to
+# replay recorded footage through the same dual-stream path as a CSI camera.
+# "weight" is the camera's share of detection worker time when the pool is busy.
+# Each camera gets its own stream (/video_feed/<name>) and folder (violations/<name>/).
+# Optional "zones": polygons with points as fractions of the frame width/height.
+# Detection only looks inside "include" zones (whole frame if there are none) and
+# never inside "exclude" zones, e.g. exit signs, heaters or trees:
+#   "zones": [{"type": "exclude", "points": [[0.8, 0.0], [1.0, 0.0], [1.0, 0.2], [0.8, 0.2]]}]
+CAMERAS = [
+    {"name": "cam0", "source": 0, "weight": 1.0},
+    # {"name": "entrance", "source": "rtsp://192.168.1.50:554/stream1", "weight": 0.5},
+]
+
+# ==================== RUNTIME CONFIG ====================
+# Settings that can be changed while running (POST /api/config). The file holds
+# overrides of the defaults above and is rewritten when the API changes them.
+CONFIG_FILE = os.path.join(MODEL_DIR, "config.json")
 
 class OLEDDisplay:
     """SH1106 OLED Display Handler (using luma.oled)"""
 
-    def __init__(self, address=OLED_ADDRESS):
+    def __init__(self, address=OLED_ADDRESS, supervisor=None):
         """Initialize I2C OLED display"""
         self.enabled = ENABLE_OLED
+        self.address = address
+        self.supervisor = supervisor or Supervisor(enabled=False)
         self.device = None
         self.width = OLED_WIDTH
         self.height = OLED_HEIGHT
@@ -53,6 +290,8 @@ class OLEDDisplay:
             return
 
         try:
+            if sh1106 is None:
+                raise RuntimeError("luma.oled is not installed")
             # Initialize I2C and SH1106 device
             serial = i2c(port=1, address=address)
             self.device = sh1106(serial)
@@ -85,6 +324,16 @@ class OLEDDisplay:
             self.device = None
             self.enabled = False
 
+    def _display(self, image):
+        """Send a frame to the panel (timed by the supervisor)"""
+        with self.supervisor.watch('oled'):
+            self.device.display(image)
+
+    def reset(self):
+        """Reinitialise the device after I2C failures (supervisor restart)"""
+        self.device = sh1106(i2c(port=1, address=self.address))
+        self.device.clear()
+
     def clear(self):
         """Clear display"""
         if not self.enabled or self.device is None:
@@ -119,7 +368,7 @@ class OLEDDisplay:
                 draw.text((x, y), line, font=font, fill=255)
                 y += line_height
 
-            self.device.display(image)
+            self._display(image)
         except Exception as e:
             print(f"⚠ OLED error: {e}")
 
@@ -148,7 +397,7 @@ class OLEDDisplay:
             x = (self.width - text_width) // 2
             draw.text((x, 48), text, font=self.font_normal, fill=255)
 
-            self.device.display(image)
+            self._display(image)
         except:
             pass
 
@@ -182,7 +431,7 @@ class OLEDDisplay:
                 draw.text((x, y), line, font=self.font_normal, fill=255)
                 y += 12
 
-            self.device.display(image)
+            self._display(image)
         except:
             pass
 
@@ -215,7 +464,7 @@ class OLEDDisplay:
             # Violations
             draw.text((0, 54), f"Alerts: {violations}", font=self.font_small, fill=255)
 
-            self.device.display(image)
+            self._display(image)
         except:
             pass
 
@@ -249,7 +498,7 @@ class OLEDDisplay:
             x3 = (self.width - text3_width) // 2
             draw.text((x3, 52), text3, font=self.font_small, fill=255)
 
-            self.device.display(image)
+            self._display(image)
             time.sleep(2)
         except:
             pass
@@ -283,7 +532,7 @@ class OLEDDisplay:
             x2 = (self.width - text2_width) // 2
             draw.text((x2, 52), text2, font=self.font_small, fill=255)
 
-            self.device.display(image)
+            self._display(image)
             time.sleep(3)
         except:
             pass
@@ -314,7 +563,7 @@ class OLEDDisplay:
             x2 = (self.width - text_width2) // 2
             draw.text((x2, 52), label, font=self.font_small, fill=255)
 
-            self.device.display(image)
+            self._display(image)
             time.sleep(2)
         except:
             pass
@@ -322,19 +571,23 @@ class OLEDDisplay:
 class SensorHandler:
     """MQ-135 Smoke Sensor Handler"""
 
-    def __init__(self, pin=MQ135_PIN, inverted=SENSOR_INVERTED, warmup_time=30):
+    def __init__(self, pin=MQ135_PIN, inverted=SENSOR_INVERTED, warmup_time=30, enabled=None,
+                 supervisor=None):
         """Initialize sensor"""
         self.pin = pin
+        self.supervisor = supervisor or Supervisor(enabled=False)
         self.inverted = inverted
         self.warmup_time = warmup_time
         self.is_warmed_up = False
-        self.enabled = ENABLE_SENSOR
+        self.enabled = ENABLE_SENSOR if enabled is None else enabled
 
         if not self.enabled:
             print("⚠ Sensor disabled in settings")
             return
 
         try:
+            if GPIO is None:
+                raise RuntimeError("RPi.GPIO is not installed")
             GPIO.setmode(GPIO.BCM)
             GPIO.setup(self.pin, GPIO.IN)
             print(f"⏳ MQ-135 warming up ({warmup_time}s)...")
@@ -349,13 +602,19 @@ class SensorHandler:
         self.is_warmed_up = True
         print("✓ MQ-135 sensor ready!")
 
+    def reset(self):
+        """Set the GPIO pin up again (supervisor restart)"""
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setup(self.pin, GPIO.IN)
+
     def detect_smoke(self):
         """Check if smoke detected"""
         if not self.enabled or not self.is_warmed_up:
             return False
 
         try:
-            reading = GPIO.input(self.pin)
+            with self.supervisor.watch('sensor'):
+                reading = GPIO.input(self.pin)
             if self.inverted:
                 return reading == GPIO.LOW
             else:
@@ -377,7 +636,10 @@ class AlertSystem:
     def __init__(self, buzzer_pin=BUZZER_PIN, led_red=LED_RED, led_green=LED_GREEN):
         """Initialize alert system"""
         self.enabled = False
+        self.beeping = False
         try:
+            if GPIO is None:
+                raise RuntimeError("RPi.GPIO is not installed")
             GPIO.setmode(GPIO.BCM)
             GPIO.setup(buzzer_pin, GPIO.OUT)
             GPIO.setup(led_red, GPIO.OUT)
@@ -396,19 +658,32 @@ class AlertSystem:
             print(f"⚠ Alert system not available: {e}")
 
     def trigger_alert(self):
-        """Trigger alert"""
+        """Trigger alert: LEDs and buzzer switch on now, the beeps play on their own thread"""
         if not self.enabled:
             return
         try:
             GPIO.output(self.led_red, GPIO.HIGH)
             GPIO.output(self.led_green, GPIO.LOW)
-            for _ in range(3):
-                GPIO.output(self.buzzer_pin, GPIO.HIGH)
+            GPIO.output(self.buzzer_pin, GPIO.HIGH)
+        except:
+            return
+        if not self.beeping:
+            self.beeping = True
+            threading.Thread(target=self._beep, daemon=True).start()
+
+    def _beep(self):
+        """Three beeps (the first one is already sounding)"""
+        try:
+            for i in range(3):
+                if i:
+                    GPIO.output(self.buzzer_pin, GPIO.HIGH)
                 time.sleep(0.2)
                 GPIO.output(self.buzzer_pin, GPIO.LOW)
                 time.sleep(0.1)
         except:
             pass
+        finally:
+            self.beeping = False
 
     def set_normal(self):
         """Set normal status"""
@@ -421,153 +696,1701 @@ class AlertSystem:
         except:
             pass
 
-class SmokingDetectionSystem:
-    def __init__(self, save_dir="violations", alert_cooldown=30,
-                 max_storage_mb=300, max_images=150, image_quality=60, ip_address=""):
-        """Initialize enhanced detection system"""
-        self.save_dir = save_dir
-        self.alert_cooldown = alert_cooldown
-        self.last_alert_time = 0
-        self.last_oled_update = 0
-        self.max_storage_mb = max_storage_mb
-        self.max_images = max_images
-        self.image_quality = image_quality
-        self.ip_address = ip_address
+class JpegEncoder:
+    """BGR frame -> JPEG bytes; subclasses wrap one library
 
-        os.makedirs(save_dir, exist_ok=True)
-        self.cleanup_old_files()
+    encode() never fails for a valid frame: if the backend raises, that frame
+    is encoded with cv2.imencode instead and the failure is counted.
+    """
 
-        # Initialize hardware
-        print("\n" + "="*50)
-        print("🚭 ENHANCED NO-SMOKING DETECTION SYSTEM")
-        print("="*50 + "\n")
+    name = None
+    supports_fast_dct = False
+
+    def __init__(self, subsampling=JPEG_SUBSAMPLING, fast_dct=JPEG_FAST_DCT):
+        """Check the library is importable (raises ImportError if not)"""
+        self.subsampling = subsampling
+        self.fast_dct = fast_dct and self.supports_fast_dct
+        self.lock = threading.Lock()
+        self.count = 0
+        self.total_s = 0.0
+        self.failures = 0
 
-        self.oled = OLEDDisplay()
+    def _encode(self, frame, quality):
+        raise NotImplementedError
 
-        self.sensor = SensorHandler() if ENABLE_SENSOR else None
-        self.alerts = AlertSystem()
+    def encode(self, frame, quality):
+        """JPEG bytes of a BGR uint8 frame"""
+        start = time.time()
+        try:
+            data = self._encode(frame, int(quality))
+        except Exception as e:
+            if not self.failures:
+                print(f"⚠ {self.name} JPEG encoder failed ({e}), using OpenCV")
+            self.failures += 1
+            data = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])[1].tobytes()
+        elapsed = time.time() - start
+        with self.lock:
+            self.count += 1
+            self.total_s += elapsed
+        return data
+
+    def get_stats(self):
+        """Encode count and average time"""
+        with self.lock:
+            return {
+                'backend': self.name,
+                'subsampling': self.subsampling,
+                'fast_dct': self.fast_dct,
+                'encodes': self.count,
+                'avg_ms': round(self.total_s / self.count * 1000, 2) if self.count else 0.0,
+                'failures': self.failures
+            }
+
+class OpenCvJpegEncoder(JpegEncoder):
+    """cv2.imencode (libjpeg/libjpeg-turbo bundled with OpenCV)"""
+
+    name = "opencv"
+    SAMPLING = {'444': 'IMWRITE_JPEG_SAMPLING_FACTOR_444',
+                '422': 'IMWRITE_JPEG_SAMPLING_FACTOR_422',
+                '420': 'IMWRITE_JPEG_SAMPLING_FACTOR_420'}
+
+    def __init__(self, subsampling=JPEG_SUBSAMPLING, fast_dct=JPEG_FAST_DCT):
+        super().__init__(subsampling, fast_dct)
+        self.params = []
+        # Sampling factor needs OpenCV 4.5.5+; older builds always use 4:2:0
+        factor = getattr(cv2, self.SAMPLING.get(subsampling, ''), None)
+        if factor is not None and hasattr(cv2, 'IMWRITE_JPEG_SAMPLING_FACTOR'):
+            self.params = [cv2.IMWRITE_JPEG_SAMPLING_FACTOR, factor]
+
+    def _encode(self, frame, quality):
+        ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality] + self.params)
+        if not ok:
+            raise RuntimeError("imencode failed")
+        return buffer.tobytes()
+
+class PilJpegEncoder(JpegEncoder):
+    """Pillow (libjpeg-turbo in the Raspberry Pi OS and PyPI builds)
+
+    Reads the BGR array without a colour conversion copy and writes into a
+    per-thread output buffer that is reused from frame to frame.
+    """
+
+    name = "pil"
+    SUBSAMPLING = {'444': 0, '422': 1, '420': 2}
+
+    def __init__(self, subsampling=JPEG_SUBSAMPLING, fast_dct=JPEG_FAST_DCT):
+        super().__init__(subsampling, fast_dct)
+        self.local = threading.local()
+
+    def _encode(self, frame, quality):
+        height, width = frame.shape[:2]
+        image = Image.frombuffer("RGB", (width, height), np.ascontiguousarray(frame),
+                                 "raw", "BGR", 0, 1)
+        out = getattr(self.local, 'buffer', None)
+        if out is None:
+            out = self.local.buffer = io.BytesIO()
+        out.seek(0)
+        out.truncate()
+        image.save(out, "JPEG", quality=quality,
+                   subsampling=self.SUBSAMPLING.get(self.subsampling, 2))
+        return out.getvalue()
+
+class SimpleJpegEncoder(JpegEncoder):
+    """simplejpeg (libjpeg-turbo, takes BGR directly)"""
+
+    name = "simplejpeg"
+    supports_fast_dct = True
+
+    def __init__(self, subsampling=JPEG_SUBSAMPLING, fast_dct=JPEG_FAST_DCT):
+        super().__init__(subsampling, fast_dct)
+        import simplejpeg
+        self.simplejpeg = simplejpeg
+
+    def _encode(self, frame, quality):
+        return self.simplejpeg.encode_jpeg(np.ascontiguousarray(frame), quality=quality,
+                                           colorspace='BGR', colorsubsampling=self.subsampling,
+                                           fastdct=self.fast_dct)
+
+class TurboJpegEncoder(JpegEncoder):
+    """PyTurboJPEG (ctypes binding to the system libturbojpeg)"""
+
+    name = "turbojpeg"
+    supports_fast_dct = True
+
+    def __init__(self, subsampling=JPEG_SUBSAMPLING, fast_dct=JPEG_FAST_DCT):
+        super().__init__(subsampling, fast_dct)
+        import turbojpeg
+        self.turbojpeg = turbojpeg
+        self.jpeg = turbojpeg.TurboJPEG()  # Raises if libturbojpeg is not installed
+        self.sample = {'444': turbojpeg.TJSAMP_444, '422': turbojpeg.TJSAMP_422,
+                       '420': turbojpeg.TJSAMP_420}.get(subsampling, turbojpeg.TJSAMP_420)
+        self.flags = turbojpeg.TJFLAG_FASTDCT if fast_dct else 0
+
+    def _encode(self, frame, quality):
+        return self.jpeg.encode(frame, quality=quality, pixel_format=self.turbojpeg.TJPF_BGR,
+                                jpeg_subsample=self.sample, flags=self.flags)
+
+JPEG_ENCODERS = {
+    'opencv': OpenCvJpegEncoder,
+    'pil': PilJpegEncoder,
+    'simplejpeg': SimpleJpegEncoder,
+    'turbojpeg': TurboJpegEncoder,
+}
+
+def available_jpeg_encoders(subsampling=JPEG_SUBSAMPLING, fast_dct=JPEG_FAST_DCT):
+    """{name: encoder} for every backend whose library is installed"""
+    encoders = {}
+    for name, cls in JPEG_ENCODERS.items():
+        try:
+            encoders[name] = cls(subsampling, fast_dct)
+        except Exception:
+            pass  # Library missing
+    return encoders
+
+def benchmark_jpeg_encoders(encoders, frame, quality=STREAM_JPEG_QUALITY,
+                            frames=JPEG_BENCHMARK_FRAMES):
+    """Median ms per encode of each encoder (backends that fail are left out)"""
+    results = {}
+    for name, encoder in encoders.items():
+        try:
+            encoder._encode(frame, quality)  # Warm-up (library init, buffers)
+            timings = []
+            for _ in range(frames):
+                start = time.time()
+                encoder._encode(frame, quality)
+                timings.append((time.time() - start) * 1000)
+            results[name] = float(np.median(timings))
+        except Exception as e:
+            print(f"⚠ JPEG encoder {name} failed: {e}")
+    return results
+
+def _jpeg_test_frame(size):
+    """Camera-like test frame: smooth gradient, noise and edges"""
+    width, height = size
+    frame = np.empty((height, width, 3), np.uint8)
+    frame[:] = np.linspace(40, 200, width, dtype=np.uint8)[np.newaxis, :, np.newaxis]
+    frame += np.random.default_rng(0).integers(0, 24, frame.shape, dtype=np.uint8)
+    cv2.rectangle(frame, (width // 4, height // 4), (width // 2, height // 2), (230, 230, 230), -1)
+    cv2.putText(frame, "JPEG", (10, height - 10), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 0, 255), 2)
+    return frame
+
+def select_jpeg_encoder(name=JPEG_ENCODER, size=CAMERA_RESOLUTION):
+    """The configured encoder, or with "auto" the fastest installed one on this CPU
+
+    Returns (encoder, {name: ms} from the startup benchmark, empty unless "auto").
+    """
+    if name != "auto":
+        try:
+            encoder = JPEG_ENCODERS[name](JPEG_SUBSAMPLING, JPEG_FAST_DCT)
+            print(f"✓ JPEG encoder: {name}")
+            return encoder, {}
+        except Exception as e:
+            print(f"⚠ JPEG encoder '{name}' not available ({e}), using OpenCV")
+            return OpenCvJpegEncoder(JPEG_SUBSAMPLING, JPEG_FAST_DCT), {}
+
+    encoders = available_jpeg_encoders()
+    timings = benchmark_jpeg_encoders(encoders, _jpeg_test_frame(size))
+    if not timings:
+        return OpenCvJpegEncoder(JPEG_SUBSAMPLING, JPEG_FAST_DCT), {}
+    best = min(timings, key=timings.get)
+    print(f"✓ JPEG encoder: {best} (" +
+          ", ".join(f"{n} {ms:.1f} ms" for n, ms in sorted(timings.items(), key=lambda x: x[1])) + ")")
+    return encoders[best], {n: round(ms, 2) for n, ms in timings.items()}
+
+class DualStreamFrame(np.ndarray):
+    """BGR detection frame that also carries the lores stream's Y plane (.luma)
+
+    Motion detection uses the Y plane as its grayscale image, so it needs no
+    colour conversion. Slices and copies do not carry it (luma is None).
+    When asked for, the source also keeps the main-stream frame of the same
+    camera request (.main); .request numbers the requests.
+    """
+
+    luma = None
+    main = None
+    request = 0
+
+def fill_from_i420(frame, i420):
+    """Fill a DualStreamFrame from a contiguous I420 image (Y plane, then U, then V)"""
+    np.copyto(frame.luma, i420[:frame.shape[0]])
+    cv2.cvtColor(i420, cv2.COLOR_YUV2BGR_I420, dst=frame)
+    return frame
+
+# Travels with a frame from capture to the stream: per-camera capture sequence
+# number and time.monotonic() when the frame came out of the camera
+FrameStamp = namedtuple('FrameStamp', 'seq captured')
+
+class FrameBufferPool:
+    """Preallocated frame arrays reused from capture through to the stream
+
+    acquire() hands out a free array, or allocates a fresh one when every array
+    is in use (counted as a miss, so an undersized pool shows up in the stats).
+    release() only takes back arrays that belong to the pool. With luma=True
+    the arrays are DualStreamFrames, each with its own Y plane buffer. A
+    main_pool takes back main-stream frames, attached or handed out on their own.
+    """
+
+    def __init__(self, shape, count=6, luma=False, main_pool=None):
+        """Allocate the arrays"""
+        self.shape = tuple(shape)
+        self.luma = luma
+        self.main_pool = main_pool
+        self.arrays = [self._new() for _ in range(count)]
+        self.free = list(self.arrays)
+        self.lock = threading.Lock()
+        self.misses = 0
+
+    def _new(self):
+        """One frame array"""
+        frame = np.empty(self.shape, np.uint8)
+        if self.luma:
+            frame = frame.view(DualStreamFrame)
+            frame.luma = np.empty(self.shape[:2], np.uint8)
+        return frame
+
+    def acquire(self):
+        """Get an array to fill"""
+        with self.lock:
+            if self.free:
+                return self.free.pop()
+            self.misses += 1
+        return self._new()
+
+    def release(self, frame):
+        """Give an array back"""
+        if frame is None:
+            return
+        main = getattr(frame, 'main', None)
+        if main is not None:
+            frame.main = None
+            self.release(main)
+        if self.main_pool is not None:
+            self.main_pool.release(frame)
+        with self.lock:
+            if (any(a is frame for a in self.arrays)
+                    and not any(f is frame for f in self.free)):
+                self.free.append(frame)
+
+class FrameCopyStats:
+    """Counts full-frame copies and bytes copied per pipeline stage
+
+    Capture-side stages run for every captured frame, later stages only for
+    frames that reach detection, so each stage is averaged over its own frame
+    count and the per-frame totals describe one frame going all the way through.
+    """
 
-        # Initialize camera
-        print("📷 Initializing camera...")
-        self.picam2 = Picamera2()
-        config = self.picam2.create_preview_configuration(
-            main={"size": (416, 320)}  # Optimized for Pi Zero 2 W
-        )
+    CAPTURE_STAGES = ('capture', 'resize')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.captured = 0
+        self.processed = 0
+        self.stages = {}  # stage -> [copies, bytes]
+
+    def add(self, stage, nbytes, copies=1):
+        """Record copies made by a stage"""
+        with self.lock:
+            entry = self.stages.setdefault(stage, [0, 0])
+            entry[0] += copies
+            entry[1] += nbytes
+            if stage == 'capture':
+                self.captured += 1
+
+    def frame_done(self):
+        """Record a frame that went all the way to the stream"""
+        with self.lock:
+            self.processed += 1
+
+    def get_stats(self):
+        """Copies and bytes per frame, per stage and in total"""
+        with self.lock:
+            stages = {}
+            copies_per_frame = 0.0
+            bytes_per_frame = 0.0
+            for stage, (copies, nbytes) in self.stages.items():
+                frames = (self.captured if stage in self.CAPTURE_STAGES else self.processed) or 1
+                copies_per_frame += copies / frames
+                bytes_per_frame += nbytes / frames
+                stages[stage] = {'copies': copies,
+                                 'per_frame': round(copies / frames, 2),
+                                 'kb_per_frame': round(nbytes / frames / 1024, 1)}
+            return {
+                'captured': self.captured,
+                'processed': self.processed,
+                'copies_per_frame': round(copies_per_frame, 2),
+                'kb_copied_per_frame': round(bytes_per_frame / 1024, 1),
+                'stages': stages
+            }
+
+class PiCameraSource:
+    """Picamera2 (CSI ribbon camera) frame source
+
+    With an evidence_size larger than size, the camera runs two streams from
+    one sensor readout: "lores" (YUV420, detection size) is read for every
+    frame and "main" (RGB, evidence size) only for frames read with main=True,
+    or when read_evidence() finds none kept.
+    """
+
+    def __init__(self, camera_num=0, size=CAMERA_RESOLUTION, copy_stats=None, buffers=6,
+                 evidence_size=None):
+        """Configure and start the camera"""
+        self.size = tuple(size)
+        self.copy_stats = copy_stats or FrameCopyStats()
+        if Picamera2 is None:
+            raise RuntimeError("picamera2 is not installed")
+        self.evidence_size = tuple(evidence_size) if evidence_size else None
+        self.dual = self.evidence_size is not None and self.evidence_size[0] > self.size[0]
+        self.main_pool = (FrameBufferPool((self.evidence_size[1], self.evidence_size[0], 3),
+                                          EVIDENCE_BUFFERS) if self.dual else None)
+        self.pool = FrameBufferPool((self.size[1], self.size[0], 3), buffers, luma=self.dual,
+                                    main_pool=self.main_pool)
+        self.requests = 0  # Camera requests read (evidence frame offsets)
+        self.i420_buffer = None  # Only used when lores rows are padded to a wider stride
+        self.lock = threading.Lock()  # read() and read_evidence() run on different threads
+        self.picam2 = Picamera2(camera_num)
+        # "RGB888" is B,G,R in memory, which is OpenCV's BGR layout, so frames
+        # can be used without a colour conversion
+        if self.dual:
+            config = self.picam2.create_preview_configuration(
+                main={"size": self.evidence_size, "format": "RGB888"},
+                lores={"size": self.size, "format": "YUV420"}
+            )
+        else:
+            config = self.picam2.create_preview_configuration(
+                main={"size": self.size, "format": "RGB888"}  # Optimized for Pi Zero 2 W
+            )
         self.picam2.configure(config)
         self.picam2.start()
         time.sleep(2)
-        print("✓ Camera ready")
 
-        # Load AI model (optional)
-        self.load_models()
+    def read(self, main=False):
+        """Capture one BGR frame into a pooled array (one copy out of the camera buffer)
 
-        self.confidence_threshold = DETECTION_CONFIDENCE
-        self.running = False
-        self.frame_skip = 2
-        self.frame_count = 0
+        With main=True the same request's main-stream frame is copied into a
+        pooled array too and kept as frame.main, for evidence.
+        """
+        frame = self.pool.acquire()
+        with self.lock:
+            request = self.picam2.capture_request()
+            self.requests += 1
+            number = self.requests
+        try:
+            if self.dual:
+                frame.request = number
+                with MappedArray(request, "lores") as m:
+                    fill_from_i420(frame, self._lores_i420(m.array))
+                if main:
+                    evidence = self.main_pool.acquire()
+                    with MappedArray(request, "main") as m:
+                        self._copy_rgb(m.array[:self.evidence_size[1], :self.evidence_size[0]], evidence)
+                    frame.main = evidence
+                    self.copy_stats.add('evidence_capture', evidence.nbytes)
+            else:
+                with MappedArray(request, "main") as m:
+                    self._copy_rgb(m.array[:self.size[1], :self.size[0]], frame)
+        finally:
+            request.release()
+        self.copy_stats.add('capture', frame.nbytes)
+        return frame
+
+    def read_evidence(self, frame):
+        """(main-stream BGR frame, offset) for a detection frame (None without dual streams)
+
+        The main-stream frame kept with frame's own request has offset 0.
+        Without one, the camera's next frame is taken, offset requests later.
+        The caller gives the array back with pool.release().
+        """
+        if not self.dual:
+            return None
+        if frame.main is not None:
+            evidence, frame.main = frame.main, None
+            return evidence, 0
+        evidence = self.main_pool.acquire()
+        with self.lock:
+            src = self.picam2.capture_array("main")
+            offset = self.requests + 1 - frame.request
+        width, height = self.evidence_size
+        self._copy_rgb(src[:height, :width], evidence)
+        self.copy_stats.add('evidence_capture', evidence.nbytes)
+        return evidence, offset
+
+    @staticmethod
+    def _copy_rgb(src, frame):
+        """Copy a main-stream array into a BGR frame"""
+        if src.shape[2] == 4:
+            # Camera fell back to XBGR8888 (R,G,B,X in memory)
+            cv2.cvtColor(src, cv2.COLOR_RGBA2BGR, dst=frame)
+        else:
+            np.copyto(frame, src)
+
+    def _lores_i420(self, array):
+        """Contiguous I420 image from the lores array, whose rows may be padded
+
+        picamera2 returns YUV420 as (height * 3 / 2, stride): the Y rows, then
+        the U and V planes with two half-width rows per stride-wide row.
+        """
+        width, height = self.size
+        stride = array.shape[1]
+        if stride == width:
+            return array[:height * 3 // 2]
+        if self.i420_buffer is None or self.i420_buffer.shape != (height * 3 // 2, width):
+            self.i420_buffer = np.empty((height * 3 // 2, width), np.uint8)
+        out = self.i420_buffer
+        out[:height] = array[:height, :width]
+        chroma = out[height:].reshape(2, height // 2, width // 2)
+        for plane in range(2):
+            rows = array[height + plane * height // 4: height + (plane + 1) * height // 4]
+            chroma[plane] = rows.reshape(height // 2, stride // 2)[:, :width // 2]
+        return out
 
-        # For web streaming
-        self.current_frame = None
+    def stop(self):
+        """Stop and close the camera (so it can be opened again at another size)"""
+        self.picam2.stop()
+        self.picam2.close()
+
+class VideoCaptureSource:
+    """USB / network camera frame source (anything cv2.VideoCapture can open)"""
+
+    def __init__(self, url, size=CAMERA_RESOLUTION, copy_stats=None, buffers=6):
+        """Open the stream"""
+        self.url = url
+        self.size = tuple(size)
+        self.copy_stats = copy_stats or FrameCopyStats()
+        self.pool = FrameBufferPool((self.size[1], self.size[0], 3), buffers)
+        self.decode_buffer = None  # Only used when the stream is not at detection size
+        self.cap = cv2.VideoCapture(url)
+        if not self.cap.isOpened():
+            raise RuntimeError(f"Cannot open camera stream {url}")
+
+    def read(self, main=False):
+        """Decode one BGR frame into a pooled array (None on failure)"""
+        frame = self.pool.acquire()
+        target = frame if self.decode_buffer is None else self.decode_buffer
+        ok, decoded = self.cap.read(target)
+        if not ok or decoded is None:
+            self.pool.release(frame)
+            return None
+        self.copy_stats.add('capture', decoded.nbytes)
+        if decoded is not frame:
+            # Stream size differs from the detection size: decode into a reused
+            # buffer and resize straight into the pooled array
+            self.decode_buffer = decoded
+            cv2.resize(decoded, self.size, dst=frame)
+            self.copy_stats.add('resize', frame.nbytes)
+        return frame
+
+    def read_evidence(self, frame):
+        """Single stream: evidence comes from the detection frame"""
+        return None
+
+    def stop(self):
+        """Release the stream"""
+        self.cap.release()
+
+class FileReplaySource:
+    """Replays a video file or a folder of images as a dual-stream camera
+
+    The footage's own resolution plays the main stream. Each frame is scaled
+    to the detection size and converted to YUV420 like picamera2's lores
+    stream, so detection takes the same path as on the device (Y plane for
+    motion) and the dual-stream code can be tested off-device. Loops forever.
+    """
+
+    IMAGE_TYPES = ('.jpg', '.jpeg', '.png', '.bmp')
+
+    def __init__(self, path, size=CAMERA_RESOLUTION, copy_stats=None, buffers=6):
+        """Open the file or list the folder"""
+        self.path = path
+        self.size = tuple(size)
+        self.copy_stats = copy_stats or FrameCopyStats()
+        self.pool = FrameBufferPool((self.size[1], self.size[0], 3), buffers, luma=True)
         self.lock = threading.Lock()
-        self.detection_status = "Monitoring..."
-        self.total_violations = 0
-        self.detection_counts = {
-            'sensor': 0,
-            'motion': 0,
-            'visual': 0,
-            'combined': 0
-        }
+        self.main = None  # Latest full-resolution frame
+        self.requests = 0
+        self.index = 0
+        self.cap = None
+        if os.path.isdir(path):
+            self.files = sorted(os.path.join(path, f) for f in os.listdir(path)
+                                if f.lower().endswith(self.IMAGE_TYPES))
+            if not self.files:
+                raise RuntimeError(f"No images in {path}")
+        else:
+            self.files = None
+            self.cap = cv2.VideoCapture(path)
+            if not self.cap.isOpened():
+                raise RuntimeError(f"Cannot open {path}")
+
+    def _next_main(self):
+        """Next full-resolution frame, starting over at the end"""
+        if self.files is not None:
+            frame = cv2.imread(self.files[self.index % len(self.files)])
+            self.index += 1
+            return frame
+        ok, frame = self.cap.read()
+        if not ok:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, frame = self.cap.read()
+        return frame if ok else None
+
+    def read(self, main=False):
+        """Decode the next frame and derive the lores detection frame from it
+
+        With main=True the decoded frame is kept as frame.main.
+        """
+        decoded = self._next_main()
+        if decoded is None:
+            return None
+        with self.lock:
+            self.main = decoded
+            self.requests += 1
+            number = self.requests
+        lores = cv2.resize(decoded, self.size, interpolation=cv2.INTER_AREA)
+        frame = fill_from_i420(self.pool.acquire(), cv2.cvtColor(lores, cv2.COLOR_BGR2YUV_I420))
+        frame.request = number
+        if main:
+            frame.main = decoded
+        self.copy_stats.add('capture', frame.nbytes)
+        return frame
+
+    def read_evidence(self, frame):
+        """(full-resolution frame, offset): the one frame was derived from, or a
+        copy of the latest, offset frames later"""
+        if frame.main is not None:
+            evidence, frame.main = frame.main, None
+            return evidence, 0
+        with self.lock:
+            if self.main is None:
+                return None
+            evidence = self.main.copy()
+            offset = self.requests - frame.request
+        self.copy_stats.add('evidence_capture', evidence.nbytes)
+        return evidence, offset
 
-        print("\n✓ System initialized!")
-        print(f"Detection modes: Sensor={'✓' if ENABLE_SENSOR else '✗'}, "
-              f"Motion={'✓' if ENABLE_MOTION else '✗'}, "
-              f"Visual={'✓' if ENABLE_VISUAL else '✗'}, "
-              f"OLED={'✓' if ENABLE_OLED else '✗'}\n")
+    def stop(self):
+        """Release the file"""
+        if self.cap is not None:
+            self.cap.release()
+
+class SyntheticFrameSource:
+    """Generated frames: a noisy scene with a cigarette-like object that comes and goes
+
+    Used by the soak test and for trying the system without a camera
+    ("source": "synthetic"). Every other SYNTHETIC_SCENE_FRAMES frames the
+    object moves across the scene, so motion, visual detection, alerts and
+    evidence saving all get exercised.
+    """
+
+    def __init__(self, size=CAMERA_RESOLUTION, copy_stats=None, buffers=6, seed=0):
+        """Render the static background"""
+        self.size = tuple(size)
+        self.copy_stats = copy_stats or FrameCopyStats()
+        self.pool = FrameBufferPool((self.size[1], self.size[0], 3), buffers)
+        rng = np.random.default_rng(seed)
+        self.background = rng.integers(0, 60, (self.size[1], self.size[0], 3), dtype=np.uint8)
+        self.count = 0
+
+    def read(self, main=False):
+        """Render the next frame into a pooled array"""
+        frame = self.pool.acquire()
+        np.copyto(frame, self.background)
+        self.count += 1
+        width, height = self.size
+        if (self.count // SYNTHETIC_SCENE_FRAMES) % 2:
+            x = 20 + (self.count * 9) % max(width - 80, 1)
+            y = height // 2 + int(20 * np.sin(self.count / 5.0))
+            cv2.circle(frame, (x, y), 5, (0, 100, 255), -1)
+            cv2.rectangle(frame, (x + 6, y - 3), (x + 46, y + 3), (230, 230, 230), -1)
+        self.copy_stats.add('capture', frame.nbytes)
+        return frame
+
+    def read_evidence(self, frame):
+        """Single stream: evidence comes from the detection frame"""
+        return None
 
-        self.oled.show_system_ready(self.ip_address)
+    def stop(self):
+        """Nothing to release"""
+        pass
+
+def open_frame_source(source, size=CAMERA_RESOLUTION, copy_stats=None):
+    """Create a frame source from a camera config entry
+
+    int = CSI camera, "synthetic" = generated frames, "replay:<path>" = recorded
+    footage through the dual-stream path, any other str = stream URL.
+    """
+    if isinstance(source, int):
+        return PiCameraSource(source, size, copy_stats,
+                              evidence_size=EVIDENCE_RESOLUTION if DUAL_STREAM else None)
+    if source == "synthetic":
+        return SyntheticFrameSource(size, copy_stats)
+    if source.startswith("replay:"):
+        return FileReplaySource(source[len("replay:"):], size, copy_stats)
+    return VideoCaptureSource(source, size, copy_stats)
+
+def _new_detection_results():
+    """Empty detect_all() result"""
+    return {
+        'sensor': False,
+        'motion': False,
+        'visual': False,
+        'boxes': [],
+        'scores': {'sensor': 0.0, 'person': 0.0, 'motion': 0.0, 'visual': 0.0},
+        'confidence': 0.0,
+        'skipped': ()
+    }
+
+def _combine_scores(results, outputs):
+    """Fill flags, boxes and single-frame confidence from {stage: (score, boxes)}
+
+    A missing stage did not run this frame. A person box or motion score above
+    0.5 sets the motion flag, as the flag-only detectors did.
+    """
+    scores = results['scores']
+    person, motion, visual = (outputs.get(k) for k in ('person', 'motion', 'visual'))
+    if 'sensor' in outputs:
+        results['sensor'] = outputs['sensor'][0] >= 0.5
+    scores['sensor'] = 1.0 if results['sensor'] else 0.0
+    if person is not None:
+        scores['person'] = person[0]
+        if person[1]:
+            results['motion'] = True
+            results['boxes'].extend(person[1])
+    if motion is not None:
+        scores['motion'] = motion[0]
+        if motion[0] > 0.5:
+            results['motion'] = True
+    if visual is not None:
+        scores['visual'] = visual[0]
+        if visual[1]:
+            results['visual'] = True
+            results['boxes'].extend(visual[1])
+    results['confidence'] = max(scores.values())
+    return results['sensor'] or results['motion'] or results['visual']
+
+def _stage_enabled(stage, sensor, settings):
+    """Whether a detection stage is switched on in the detector settings"""
+    if stage == 'sensor':
+        return bool(sensor) and settings['enable_sensor']
+    if stage == 'visual':
+        return settings['enable_visual']
+    return settings['enable_motion']  # person and motion
+
+def _offload_stages(engine, frame, camera, stages, rois, zones):
+    """Stages the engine's inference server answered, each timed as one round trip"""
+    start = time.time()
+    outputs = engine.offload.detect(frame, stages, rois, zones.get(camera, frame.shape))
+    for stage in outputs:
+        engine.cascade.record(stage, time.time() - start)
+    return outputs
+
+class DetectionCascade:
+    """Decides which detection stages run for a frame, cheapest first
+
+    Gate stages (sensor state, low-resolution motion) run on every frame. The
+    expensive stages (MobileNet-SSD, visual detector) only run when a gate
+    opens, i.e. the sensor fires or enough of the scene changed, or when the
+    camera has gone CASCADE_REFRESH_FRAMES frames without a full run. Within
+    each group, stages are ordered by their measured average cost, and once a
+    stage scores CASCADE_EXIT_SCORE the remaining ones are skipped. On a static
+    scene most frames stop after the first gate.
+    """
+
+    def __init__(self, gates=CASCADE_GATES, stages=CASCADE_STAGES, enabled=DETECTION_CASCADE,
+                 motion_gate=CASCADE_MOTION_GATE, exit_score=CASCADE_EXIT_SCORE,
+                 refresh=CASCADE_REFRESH_FRAMES):
+        """Set up cost and skip counters"""
+        self.gates = tuple(gates)
+        self.stages = tuple(stages)
+        self.enabled = enabled
+        self.motion_gate = motion_gate
+        self.exit_score = exit_score
+        self.refresh = max(1, int(refresh))
+        self.cost = {}        # stage -> average ms (EWMA)
+        self.since_full = {}  # camera -> frames since every stage last ran
+        self.counts = {stage: {'runs': 0, 'skipped': 0} for stage in self.gates + self.stages}
+        self.frames = 0
+        self.gated = 0        # Frames that finished after the gate stages
+        self.early_exits = 0  # Frames cut short by a conclusive expensive stage
+        self.lock = threading.Lock()
 
-    def load_models(self):
-        """Load MobileNet-SSD model (optional)"""
-        try:
-            self.net = cv2.dnn.readNetFromCaffe(
-                "MobileNetSSD_deploy.prototxt",
-                "MobileNetSSD_deploy.caffemodel"
-            )
-            self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
-            self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
-            print("✓ MobileNet-SSD loaded")
-        except:
-            print("⚠ MobileNet-SSD not found (using lightweight detection)")
-            self.net = None
+    def order(self, stages, available):
+        """Available stages, cheapest measured first (unmeasured ones first, in config order)"""
+        return sorted((s for s in stages if s in available), key=lambda s: self.cost.get(s, 0.0))
 
-    def detect_person(self, frame):
-        """Detect person using MobileNet-SSD"""
-        if self.net is None or not ENABLE_MOTION:
-            return False, []
+    def record(self, stage, seconds):
+        """Account one run of a stage"""
+        ms = seconds * 1000
+        with self.lock:
+            self.cost[stage] = 0.8 * self.cost.get(stage, ms) + 0.2 * ms
+            self.counts.setdefault(stage, {'runs': 0, 'skipped': 0})['runs'] += 1
+
+    def run(self, stage, fn, *args):
+        """Run and time one stage"""
+        start = time.time()
+        output = fn(*args)
+        self.record(stage, time.time() - start)
+        return output
+
+    def gate_open(self, camera, outputs):
+        """True when the expensive stages should run for this frame"""
+        due = self.since_full.get(camera, self.refresh) >= self.refresh - 1
+        opened = (not self.enabled or due
+                  or not any(g in outputs for g in self.gates)
+                  or outputs.get('sensor', (0.0,))[0] >= 0.5
+                  or outputs.get('motion', (0.0,))[0] >= self.motion_gate)
+        self.since_full[camera] = 0 if opened else self.since_full.get(camera, 0) + 1
+        if not opened:
+            with self.lock:
+                self.gated += 1
+        return opened
+
+    def conclusive(self, outputs):
+        """True when an expensive stage has already scored high enough to stop early
+
+        Gate outputs do not count: strong motion opens the gate, it does not
+        answer whether someone is smoking.
+        """
+        return self.enabled and any(outputs[s][0] >= self.exit_score
+                                    for s in self.stages if s in outputs)
+
+    def finish(self, available, outputs, exited=False):
+        """Count the stages this frame skipped; returns them"""
+        skipped = tuple(s for s in available if s not in outputs)
+        with self.lock:
+            self.frames += 1
+            self.early_exits += exited
+            for stage in skipped:
+                self.counts.setdefault(stage, {'runs': 0, 'skipped': 0})['skipped'] += 1
+        return skipped
+
+    def get_stats(self):
+        """Per-stage cost and skip counts"""
+        with self.lock:
+            stages = {}
+            for stage, c in self.counts.items():
+                total = c['runs'] + c['skipped']
+                stages[stage] = {
+                    'avg_ms': round(self.cost.get(stage, 0.0), 2),
+                    'runs': c['runs'],
+                    'skipped': c['skipped'],
+                    'skip_rate': round(c['skipped'] / total, 3) if total else 0.0
+                }
+            return {
+                'enabled': self.enabled,
+                'frames': self.frames,
+                'gated_frames': self.gated,
+                'early_exits': self.early_exits,
+                'stages': stages
+            }
+
+def nms_boxes(boxes, scores, iou_threshold=0.45):
+    """Vectorised non-maximum suppression; boxes are [x, y, w, h] rows, returns kept indices"""
+    boxes = np.asarray(boxes, np.float32).reshape(-1, 4)
+    scores = np.asarray(scores, np.float32)
+    x1, y1 = boxes[:, 0], boxes[:, 1]
+    x2, y2 = x1 + boxes[:, 2], y1 + boxes[:, 3]
+    areas = np.maximum(boxes[:, 2], 0) * np.maximum(boxes[:, 3], 0)
+    order = scores.argsort()[::-1]
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(int(i))
+        rest = order[1:]
+        w = np.maximum(0, np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]))
+        h = np.maximum(0, np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]))
+        inter = w * h
+        iou = inter / np.maximum(areas[i] + areas[rest] - inter, 1e-6)
+        order = rest[iou <= iou_threshold]
+    return keep
+
+def _tile_spans(start, length, size, limit, overlap):
+    """Tile origins along one axis covering [start, start+length) inside [0, limit)"""
+    if length <= size:
+        origins = [start + length / 2 - size / 2]
+    else:
+        stride = max(1, int(size * (1 - overlap)))
+        origins = list(range(int(start), int(start + length - size), stride))
+        origins.append(start + length - size)
+    return sorted({int(min(max(o, 0), limit - size)) for o in origins})
+
+class DetectorModel:
+    """One object detector from the MODELS registry
+
+    Subclasses run the model (_forward, _forward_batch); this class does the
+    shared input normalisation, output decoding and tiling. detect() returns
+    [(class_id, score, [x, y, w, h])] in frame pixels, score() the task score
+    and boxes for the model's own classes.
+
+    With tiling on, detect() also cuts zoomed tiles around the given regions
+    of interest (motion, person boxes), runs them together with the full frame
+    as one batch, and merges everything with NMS. The number of tiles follows
+    the measured cost per image so a call stays within TILE_BUDGET_MS.
+    """
+
+    backend = "none"
+
+    def __init__(self, name, spec):
+        """Read the registry entry"""
+        self.name = name
+        self.spec = spec
+        self.task = spec.get('task', 'person')
+        self.layout = spec.get('layout', 'ssd')
+        self.input_size = tuple(spec.get('input_size', (300, 300)))
+        self.scale = spec.get('scale', 1 / 255)
+        self.mean = spec.get('mean', 0.0)
+        self.swap_rb = spec.get('swap_rb', spec.get('format') != 'caffe')
+        self.classes = set(spec.get('classes', [0]))
+        self.threshold = spec.get('threshold', 0.5)
+        self.threads = max(1, int(spec.get('threads', 1)))
+        self.tiling = TILING and self.task in TILING_TASKS
+        # Nets and interpreters keep their tensors on the object, so calls
+        # from different workers must not overlap
+        self.lock = threading.Lock()
+        self.runs = 0
+        self.total_ms = 0.0
+        self.image_ms = 0.0   # Average cost of one image in a batch (EWMA)
+        self.tiles_run = 0
+        self.frames_tiled = 0
+
+    def _forward(self, frame):
+        raise NotImplementedError
+
+    def _forward_batch(self, images):
+        """Outputs per image; backends that take a batched blob override this"""
+        return [self._forward(image) for image in images]
+
+    def tile_limit(self):
+        """Tiles that fit the latency budget next to the full-frame pass"""
+        if not self.image_ms:
+            return TILE_MAX
+        return min(TILE_MAX, max(0, int(TILE_BUDGET_MS / self.image_ms) - 1))
+
+    def plan_tiles(self, rois, width, height, limit=None):
+        """Overlapping (x, y, w, h) tiles around regions of interest, smallest region first"""
+        limit = self.tile_limit() if limit is None else limit
+        tw = min(width, int(self.input_size[0] / TILE_ZOOM))
+        th = min(height, int(self.input_size[1] / TILE_ZOOM))
+        tiles = []
+        for rx, ry, rw, rh in sorted(rois, key=lambda r: r[2] * r[3]):
+            if any(t[0] <= rx and t[1] <= ry and rx + rw <= t[0] + tw and ry + rh <= t[1] + th
+                   for t in tiles):
+                continue  # Already inside a planned tile
+            for y in _tile_spans(ry, rh, th, height, TILE_OVERLAP):
+                for x in _tile_spans(rx, rw, tw, width, TILE_OVERLAP):
+                    if len(tiles) >= limit:
+                        return tiles
+                    # Skip tiles mostly covered by one already planned
+                    if any(abs(x - t[0]) < tw / 2 and abs(y - t[1]) < th / 2 for t in tiles):
+                        continue
+                    tiles.append((x, y, tw, th))
+        return tiles
+
+    def detect(self, frame, rois=None, tiles=None):
+        """All detections above a small floor, as (class_id, score, box)"""
+        height, width = frame.shape[:2]
+        if tiles is None:
+            tiles = self.plan_tiles(rois, width, height) if self.tiling and rois else []
+        start = time.time()
+        if not tiles:
+            with self.lock:
+                outputs = self._forward(frame)
+            detections = self._decode(outputs, width, height)
+        else:
+            # Full frame + zoomed tiles in one batch, boxes mapped back to the frame
+            regions = [(0, 0, width, height)] + list(tiles)
+            crops = [frame[y:y + h, x:x + w] for x, y, w, h in regions]
+            with self.lock:
+                per_image = self._forward_batch(crops)
+            found = [(c, s, [b[0] + x, b[1] + y, b[2], b[3]])
+                     for (x, y, w, h), outputs in zip(regions, per_image)
+                     for c, s, b in self._decode(outputs, w, h)]
+            # Per-class NMS in one pass: shift each class to its own coordinate range
+            shifted = [[b[0] + c * 100000, b[1], b[2], b[3]] for c, s, b in found]
+            detections = [found[i] for i in nms_boxes(shifted, [f[1] for f in found])]
+            self.tiles_run += len(tiles)
+            self.frames_tiled += 1
+        ms = (time.time() - start) * 1000
+        per_image = ms / (len(tiles) + 1)
+        self.image_ms = 0.8 * self.image_ms + 0.2 * per_image if self.image_ms else per_image
+        self.runs += 1
+        self.total_ms += ms
+        return detections
+
+    def score(self, frame, rois=None, zone=None):
+        """Highest confidence for the model's classes, and boxes above its threshold
+
+        With a zone the model only sees the zone's bounding box, and detections
+        centred on excluded pixels are dropped.
+        """
+        ox = oy = 0
+        if zone is not None:
+            ox, oy = zone.rect[:2]
+            frame = zone.crop(frame)
+            rois = [[x - ox, y - oy, w, h] for x, y, w, h in rois] if rois else rois
+        score = 0.0
+        boxes = []
+        for class_id, confidence, box in self.detect(frame, rois):
+            if class_id in self.classes and (zone is None or zone.contains(box)):
+                score = max(score, confidence)
+                if confidence >= self.threshold:
+                    boxes.append([box[0] + ox, box[1] + oy, box[2], box[3]])
+        return score, boxes
+
+    def _input_blob(self, frame):
+        """NCHW float blob at the model's input size"""
+        return cv2.dnn.blobFromImage(frame, self.scale, self.input_size,
+                                     (self.mean, self.mean, self.mean), swapRB=self.swap_rb)
+
+    def _decode(self, outputs, width, height):
+        """Model outputs -> [(class_id, score, [x, y, w, h])]"""
+        if self.layout == 'ssd':
+            # [1, 1, N, 7]: image id, class, score, x1, y1, x2, y2 (normalised)
+            dets = outputs[0].reshape(-1, 7)
+            dets = dets[dets[:, 2] > 0.05]
+            return [(int(d[1]), float(d[2]), self._box(d[3], d[4], d[5], d[6], width, height))
+                    for d in dets]
+
+        if self.layout == 'tflite_ssd':
+            # boxes [1, N, 4] (ymin, xmin, ymax, xmax), classes [1, N], scores [1, N], count
+            boxes, classes, scores = (o.reshape(o.shape[1:]) if o.ndim > 1 else o
+                                      for o in outputs[:3])
+            keep = np.flatnonzero(scores > 0.05)
+            return [(int(classes[i]), float(scores[i]),
+                     self._box(boxes[i][1], boxes[i][0], boxes[i][3], boxes[i][2], width, height))
+                    for i in keep]
+
+        # YOLO: [1, 4+C, N] (v8) or [1, N, 5+C] (v5, with objectness)
+        out = outputs[0][0]
+        if out.shape[0] < out.shape[1]:
+            out = out.T
+        if self.spec.get('objectness', False):  # YOLOv5-style exports: set "objectness": True
+            class_scores = out[:, 5:] * out[:, 4:5]
+        else:
+            class_scores = out[:, 4:]
+        class_ids = class_scores.argmax(axis=1)
+        confidences = class_scores[np.arange(len(out)), class_ids]
+        keep = np.flatnonzero(confidences > 0.05)
+        if len(keep) == 0:
+            return []
+        cx, cy, w, h = out[keep, 0], out[keep, 1], out[keep, 2], out[keep, 3]
+        if float(np.max(cx)) <= 2.0:  # Normalised coordinates (common in TFLite exports)
+            sx, sy = width, height
+        else:
+            sx, sy = width / self.input_size[0], height / self.input_size[1]
+        rects = np.stack([(cx - w / 2) * sx, (cy - h / 2) * sy, w * sx, h * sy], axis=1)
+        picked = nms_boxes(rects, confidences[keep])
+        return [(int(class_ids[keep[i]]), float(confidences[keep[i]]),
+                 [int(v) for v in rects[i]]) for i in picked]
+
+    def _split_batch(self, output, count):
+        """Batched network output -> outputs per image"""
+        if self.layout == 'ssd':
+            # DetectionOutput puts every image's rows together, tagged with its index
+            dets = output.reshape(-1, 7)
+            return [[dets[dets[:, 0] == i].reshape(1, 1, -1, 7)] for i in range(count)]
+        return [[output[i:i + 1]] for i in range(count)]
+
+    @staticmethod
+    def _box(x1, y1, x2, y2, width, height):
+        """Normalised corners -> [x, y, w, h] in pixels"""
+        x, y = int(x1 * width), int(y1 * height)
+        return [x, y, int(x2 * width) - x, int(y2 * height) - y]
+
+    def get_stats(self):
+        """Model and timing"""
+        return {
+            'name': self.name,
+            'backend': self.backend,
+            'input_size': list(self.input_size),
+            'threads': self.threads,
+            'runs': self.runs,
+            'avg_ms': round(self.total_ms / self.runs, 2) if self.runs else 0.0,
+            'tiling': {
+                'enabled': self.tiling,
+                'avg_image_ms': round(self.image_ms, 2),
+                'tile_limit': self.tile_limit(),
+                'budget_ms': TILE_BUDGET_MS,
+                'frames_tiled': self.frames_tiled,
+                'tiles_run': self.tiles_run
+            }
+        }
 
+class CvDnnModel(DetectorModel):
+    """Caffe or ONNX model on OpenCV's DNN module"""
+
+    backend = "opencv"
+
+    def __init__(self, name, spec, path, config=None):
+        """Load the network"""
+        super().__init__(name, spec)
+        if spec.get('format') == 'caffe':
+            self.net = cv2.dnn.readNetFromCaffe(config, path)
+        else:
+            self.net = cv2.dnn.readNetFromONNX(path)
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self.batching = True
+        # cv2.dnn runs on OpenCV's global thread pool, so this applies to every
+        # cv2.dnn model in the process (the last one loaded wins)
+        cv2.setNumThreads(self.threads)
+
+    def _forward(self, frame):
+        self.net.setInput(self._input_blob(frame))
+        return [self.net.forward()]
+
+    def _forward_batch(self, images):
+        # One blobFromImages batch and a single forward pass; models exported
+        # with a fixed batch of 1 fall back to one pass per image
+        if self.batching:
+            try:
+                self.net.setInput(cv2.dnn.blobFromImages(
+                    images, self.scale, self.input_size, (self.mean, self.mean, self.mean),
+                    swapRB=self.swap_rb))
+                return self._split_batch(self.net.forward(), len(images))
+            except cv2.error:
+                self.batching = False
+        return super()._forward_batch(images)
+
+class OnnxRuntimeModel(DetectorModel):
+    """ONNX model on onnxruntime (used when it is installed; supports QDQ int8 models)"""
+
+    backend = "onnxruntime"
+
+    def __init__(self, name, spec, path, ort):
+        """Create the inference session"""
+        super().__init__(name, spec)
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = self.threads
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        self.batching = not isinstance(self.session.get_inputs()[0].shape[0], int) or \
+            self.session.get_inputs()[0].shape[0] != 1
+
+    def _forward(self, frame):
+        return self.session.run(None, {self.input_name: self._input_blob(frame)})
+
+    def _forward_batch(self, images):
+        if self.batching:
+            try:
+                blob = cv2.dnn.blobFromImages(images, self.scale, self.input_size,
+                                              (self.mean, self.mean, self.mean),
+                                              swapRB=self.swap_rb)
+                output = self.session.run(None, {self.input_name: blob})[0]
+                return self._split_batch(output, len(images))
+            except Exception:
+                self.batching = False  # Fixed batch-1 export
+        return super()._forward_batch(images)
+
+class TFLiteModel(DetectorModel):
+    """TFLite model (float or int8-quantised) on tflite_runtime or TensorFlow Lite"""
+
+    backend = "tflite"
+
+    def __init__(self, name, spec, path):
+        """Create the interpreter"""
+        super().__init__(name, spec)
         try:
-            height, width = frame.shape[:2]
-            blob = cv2.dnn.blobFromImage(
-                cv2.resize(frame, (300, 300)),
-                0.007843, (300, 300), 127.5
-            )
-            self.net.setInput(blob)
-            detections = self.net.forward()
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            from tensorflow.lite import Interpreter  # Full TensorFlow as a fallback
+        self.interpreter = Interpreter(model_path=path, num_threads=self.threads)
+        self.interpreter.allocate_tensors()
+        self.input = self.interpreter.get_input_details()[0]
+        self.outputs = self.interpreter.get_output_details()
+        self.nhwc_buffer = None
+
+    def _forward(self, frame):
+        # NHWC input; the normalised value is quantised when the model is int8/uint8
+        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) if self.swap_rb else frame
+        x = cv2.resize(rgb, self.input_size).astype(np.float32)
+        x = (x - self.mean) * self.scale
+        q_scale, q_zero = self.input.get('quantization', (0.0, 0))
+        dtype = self.input['dtype']
+        if q_scale and dtype in (np.uint8, np.int8):
+            info = np.iinfo(dtype)
+            x = np.clip(np.round(x / q_scale + q_zero), info.min, info.max)
+        self.interpreter.set_tensor(self.input['index'], x.astype(dtype)[np.newaxis])
+        self.interpreter.invoke()
+
+        outputs = []
+        for detail in self.outputs:
+            out = self.interpreter.get_tensor(detail['index'])
+            q_scale, q_zero = detail.get('quantization', (0.0, 0))
+            if q_scale and out.dtype in (np.uint8, np.int8, np.int16):
+                out = (out.astype(np.float32) - q_zero) * q_scale
+            outputs.append(out)
+        return outputs
+
+def load_detector_model(name, models=None):
+    """Create a detector from a MODELS entry (raises if the model or its runtime is missing)"""
+    spec = (models or MODELS)[name]
+    path = os.path.join(MODEL_DIR, spec['path'])
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{spec['path']} not found")
+
+    fmt = spec.get('format')
+    if fmt == 'caffe':
+        return CvDnnModel(name, spec, path, os.path.join(MODEL_DIR, spec['config']))
+    if fmt == 'onnx':
+        try:
+            import onnxruntime
+        except ImportError:
+            return CvDnnModel(name, spec, path)
+        return OnnxRuntimeModel(name, spec, path, onnxruntime)
+    if fmt == 'tflite':
+        return TFLiteModel(name, spec, path)
+    raise ValueError(f"Unknown model format '{fmt}'")
+
+class ZoneMask:
+    """A camera's include/exclude zones rasterised for one frame size
+
+    rect is the bounding box of the pixels detection may look at. The mask
+    pyramid covers only that box: mask at detection resolution and
+    motion_mask at MOTION_SCALE. Detectors crop to rect first, so pixels
+    outside it are never processed, and the masks clear the rest before any
+    contours are searched.
+    """
+
+    def __init__(self, zones, width, height):
+        """Rasterise the polygons once"""
+        includes = [z for z in zones if z['type'] == 'include']
+        full = np.zeros((height, width), np.uint8) if includes else np.full((height, width), 255, np.uint8)
+        scale = np.array([width, height], np.float64)
+        for zone in includes + [z for z in zones if z['type'] == 'exclude']:
+            points = np.round(np.array(zone['points']) * scale).astype(np.int32)
+            cv2.fillPoly(full, [points], 255 if zone['type'] == 'include' else 0)
+
+        self.coverage = cv2.countNonZero(full) / float(width * height)
+        self.empty = self.coverage == 0.0
+        x, y, w, h = cv2.boundingRect(full) if not self.empty else (0, 0, width, height)
+        self.rect = (x, y, x + w, y + h)
+        self.mask = np.ascontiguousarray(full[y:y + h, x:x + w])
+        self.motion_mask = self.mask
+        if MOTION_SCALE != 1:
+            # Same resize call as motion_gray(), so the sizes always match
+            self.motion_mask = cv2.resize(self.mask, None, fx=MOTION_SCALE, fy=MOTION_SCALE,
+                                          interpolation=cv2.INTER_NEAREST)
+
+    def crop(self, frame):
+        """The part of a frame (or grayscale image) detection looks at"""
+        x0, y0, x1, y1 = self.rect
+        return frame[y0:y1, x0:x1]
+
+    def contains(self, box):
+        """True when a box (in crop coordinates) is centred on an allowed pixel"""
+        x, y, w, h = box
+        cx = min(max(int(x + w / 2), 0), self.mask.shape[1] - 1)
+        cy = min(max(int(y + h / 2), 0), self.mask.shape[0] - 1)
+        return self.mask[cy, cx] > 0
+
+    def get_stats(self):
+        """Share of the frame detection looks at, and its bounding box"""
+        return {'coverage': round(self.coverage, 3), 'rect': list(self.rect)}
+
+class ZoneMasks:
+    """Zones of every camera; each is rasterised on first use at a frame size and cached
+
+    get() returns None for a camera without zones or whose zones allow every
+    pixel, so cameras without zones pay nothing.
+    """
+
+    def __init__(self, zones=None):
+        """Nothing is rasterised yet"""
+        self.zones = zones or {}
+        self.cache = {}  # (camera, width, height) -> ZoneMask or None
+        self.lock = threading.Lock()
 
-            boxes = []
-            for i in range(detections.shape[2]):
-                confidence = detections[0, 0, i, 2]
-                if confidence > 0.5:
-                    idx = int(detections[0, 0, i, 1])
-                    if idx == 15:  # Person class
-                        box = detections[0, 0, i, 3:7] * np.array([width, height, width, height])
-                        (x, y, x2, y2) = box.astype("int")
-                        boxes.append([x, y, x2-x, y2-y])
-
-            return len(boxes) > 0, boxes
-        except:
-            return False, []
+    def get(self, camera, shape):
+        """ZoneMask for a camera's frames of this shape (None = whole frame)"""
+        if not self.zones.get(camera):
+            return None
+        key = (camera, shape[1], shape[0])
+        with self.lock:
+            if key not in self.cache:
+                mask = ZoneMask(self.zones[camera], shape[1], shape[0])
+                self.cache[key] = None if mask.coverage == 1.0 else mask
+            return self.cache[key]
+
+# Everything detect_all() reads from the configuration, swapped as one object
+# between frames so a frame never sees half of a configuration change
+DetectorSet = namedtuple('DetectorSet', 'settings person_model cigarette_model zones')
+
+class OffloadClient:
+    """Runs expensive stages on an inference server (inference_server.py) over one TCP connection
+
+    Frames are a 1-byte type, a 4-byte length and a binary payload:
+      HELLO   JSON, first frame both ways: {node, protocol, timeout} from the
+              client, {protocol, stages: {stage: model}} back from the server
+      DETECT  request id and stage flags, then the image as JPEG
+      RESULT  request id, server ms and stage count, then per stage its flag,
+              box threshold and (confidence, int16 box) candidates in image
+              pixels; a stage that is missing failed on the server
+    Requests are pipelined: detection workers send on the shared connection
+    while a reader thread hands every RESULT to the request waiting for it.
+    detect() returns the stages answered within the timeout; the caller runs
+    the rest on its local detectors. After OFFLOAD_MAX_LATE late answers in a
+    row, or when the connection drops, every frame is detected locally for
+    OFFLOAD_RETRY seconds.
+    """
+
+    HELLO, DETECT, RESULT = 1, 2, 3
+    PROTOCOL = 1
+    STAGE_FLAGS = {'person': 1, 'visual': 2}
+
+    def __init__(self, server=OFFLOAD_SERVER, encoder=None, max_side=OFFLOAD_MAX_SIDE,
+                 quality=OFFLOAD_JPEG_QUALITY, roi_max_area=OFFLOAD_ROI_MAX_AREA,
+                 timeout=OFFLOAD_TIMEOUT, max_inflight=OFFLOAD_MAX_INFLIGHT,
+                 max_late=OFFLOAD_MAX_LATE, retry=OFFLOAD_RETRY):
+        """Connection settings; connects on the first frame"""
+        host, _, port = str(server).partition(':')
+        self.host = host
+        self.port = int(port or OFFLOAD_PORT)
+        self.encoder = encoder
+        self.max_side = max_side
+        self.quality = quality
+        self.roi_max_area = roi_max_area
+        self.timeout = timeout
+        self.max_inflight = max_inflight
+        self.max_late = max_late
+        self.retry = retry
+        self.sock = None
+        self.stages = {}         # Stages the server runs -> its model
+        self.pending = {}        # request id -> [event, result]
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.send_lock = threading.Lock()
+        self.retry_at = 0.0
+        self.late_run = 0
+        self.running = True
+        self.rtt_ms = deque(maxlen=LATENCY_WINDOW)
+        self.reports = {'requests': 0, 'answered': 0, 'late': 0, 'local': 0, 'errors': 0,
+                        'connects': 0, 'bytes_sent': 0, 'server_ms': 0.0}
+
+    def _read_frame(self, sock):
+        """Next frame; the reader idles through socket timeouts while connected"""
+        return read_frame(sock, peer="inference server",
+                          idle=lambda: sock is self.sock and self.running)
+
+    def _connect(self):
+        """Open the connection and read the server's stages (caller holds send_lock)"""
+        sock = socket.create_connection((self.host, self.port), timeout=max(1.0, 4 * self.timeout))
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            hello = json.dumps({'node': socket.gethostname(), 'protocol': self.PROTOCOL,
+                                'timeout': self.timeout})
+            sock.sendall(pack_frame(self.HELLO, hello.encode()))
+            kind, payload = self._read_frame(sock)
+            if kind != self.HELLO:
+                raise ConnectionError("unexpected first frame from inference server")
+            stages = json.loads(payload).get('stages', {})
+        except Exception:
+            sock.close()
+            raise
+        with self.lock:
+            self.sock = sock
+            self.stages = {s: m for s, m in stages.items() if s in self.STAGE_FLAGS}
+        self.reports['connects'] += 1
+        threading.Thread(target=self._read_loop, args=(sock,), daemon=True).start()
+        served = ', '.join(f"{s}: {m}" for s, m in self.stages.items()) or "nothing"
+        print(f"✓ Inference server {self.host}:{self.port} connected ({served})")
+
+    def _read_loop(self, sock):
+        """Hand each RESULT to the request waiting for it"""
+        try:
+            while True:
+                kind, payload = self._read_frame(sock)
+                if kind != self.RESULT:
+                    continue
+                request_id, server_ms, count = struct.unpack_from('>IfB', payload)
+                offset = 9
+                stages = {}
+                for _ in range(count):
+                    flag, threshold, n = struct.unpack_from('>BfB', payload, offset)
+                    offset += 6
+                    stages[flag] = (threshold, [struct.unpack_from('>f4h', payload, offset + 12 * i)
+                                                for i in range(n)])
+                    offset += 12 * n
+                with self.lock:
+                    entry = self.pending.pop(request_id, None)
+                if entry is not None:  # None: the caller already detected locally
+                    entry[1] = (server_ms, stages)
+                    entry[0].set()
+        except (OSError, ValueError, struct.error) as e:
+            self._drop(sock, e)
+
+    def _drop(self, sock, reason):
+        """Close a broken connection; its waiting requests fall back to local detection"""
+        with self.lock:
+            if sock is not self.sock:
+                return
+            self.sock = None
+            pending, self.pending = self.pending, {}
+            self.retry_at = time.time() + self.retry
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        sock.close()
+        for entry in pending.values():
+            entry[0].set()
+        if self.running:
+            print(f"⚠ Inference server connection lost ({reason}), detecting locally")
+
+    def _region(self, frame, rois, zone):
+        """(x, y, w, h) of the frame to send: the zone's bounding box, or the padded
+        motion regions inside it while they are small enough"""
+        height, width = frame.shape[:2]
+        x0, y0, x1, y1 = zone.rect if zone is not None else (0, 0, width, height)
+        if rois:
+            rx0 = min(r[0] for r in rois)
+            ry0 = min(r[1] for r in rois)
+            rx1 = max(r[0] + r[2] for r in rois)
+            ry1 = max(r[1] + r[3] for r in rois)
+            # Context around the motion, so a person or hand is not cut in half
+            px = max(16, (rx1 - rx0) // 4)
+            py = max(16, (ry1 - ry0) // 4)
+            rx0, ry0 = max(x0, rx0 - px), max(y0, ry0 - py)
+            rx1, ry1 = min(x1, rx1 + px), min(y1, ry1 + py)
+            if (rx1 > rx0 and ry1 > ry0 and (rx1 - rx0) * (ry1 - ry0)
+                    < self.roi_max_area * (x1 - x0) * (y1 - y0)):
+                x0, y0, x1, y1 = rx0, ry0, rx1, ry1
+        return int(x0), int(y0), int(x1 - x0), int(y1 - y0)
+
+    def _encode(self, frame, region):
+        """The region, downscaled to max_side, as JPEG; returns (bytes, (width, height))"""
+        x, y, w, h = region
+        image = frame[y:y + h, x:x + w]
+        scale = min(1.0, self.max_side / max(w, h))
+        if scale < 1.0:
+            size = (max(1, round(w * scale)), max(1, round(h * scale)))
+            image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        image = np.ascontiguousarray(image)
+        if self.encoder is not None:
+            data = self.encoder.encode(image, self.quality)
+        else:
+            data = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, int(self.quality)])[1].tobytes()
+        return data, (image.shape[1], image.shape[0])
+
+    def detect(self, frame, stages, rois=None, zone=None):
+        """{stage: (score, boxes)} for the stages the server answered in time"""
+        if not self.running or time.time() < self.retry_at or (zone is not None and zone.empty):
+            self.reports['local'] += 1
+            return {}
+        with self.send_lock:
+            if self.sock is None:
+                try:
+                    self._connect()
+                except (OSError, ValueError) as e:
+                    self.retry_at = time.time() + self.retry
+                    self.reports['local'] += 1
+                    print(f"⚠ Inference server {self.host}:{self.port} unreachable ({e}), "
+                          f"detecting locally")
+                    return {}
+        wanted = [s for s in stages if s in self.stages]
+        with self.lock:
+            busy = len(self.pending) >= self.max_inflight
+        if not wanted or busy:
+            self.reports['local'] += 1
+            return {}
+
+        region = self._region(frame, rois, zone)
+        data, size = self._encode(frame, region)
+        request_id = next(self.ids) & 0xFFFFFFFF
+        entry = [threading.Event(), None]
+        flags = sum(self.STAGE_FLAGS[s] for s in wanted)
+        payload = struct.pack('>IB', request_id, flags) + data
+        start = time.monotonic()
+        with self.lock:
+            self.pending[request_id] = entry
+            sock = self.sock
+        try:
+            if sock is None:
+                raise ConnectionError("not connected")
+            with self.send_lock:
+                sock.sendall(pack_frame(self.DETECT, payload))
+        except OSError as e:
+            if sock is not None:
+                self._drop(sock, e)
+            with self.lock:
+                self.pending.pop(request_id, None)
+            self.reports['local'] += 1
+            return {}
+        self.reports['requests'] += 1
+        self.reports['bytes_sent'] += len(payload) + 5
+
+        answered = entry[0].wait(self.timeout)
+        with self.lock:
+            self.pending.pop(request_id, None)
+        if not answered:
+            self.reports['late'] += 1
+            self.late_run += 1
+            if self.late_run >= self.max_late:
+                self.late_run = 0
+                self.retry_at = time.time() + self.retry
+                print(f"⚠ Inference server slower than {self.timeout * 1000:.0f} ms, "
+                      f"detecting locally for {self.retry:g}s")
+            return {}
+        if entry[1] is None:
+            return {}  # Connection lost while waiting
+        self.late_run = 0
+        self.rtt_ms.append((time.monotonic() - start) * 1000)
+        server_ms, results = entry[1]
+        self.reports['answered'] += 1
+        self.reports['server_ms'] += server_ms
+
+        # Candidates back to frame pixels; the zone decides which ones count
+        rx, ry, rw, rh = region
+        sx, sy = rw / size[0], rh / size[1]
+        ox, oy = zone.rect[:2] if zone is not None else (0, 0)
+        outputs = {}
+        for stage in wanted:
+            if self.STAGE_FLAGS[stage] not in results:
+                self.reports['errors'] += 1
+                continue
+            threshold, candidates = results[self.STAGE_FLAGS[stage]]
+            score, boxes = 0.0, []
+            for confidence, x, y, w, h in candidates:
+                box = [int(rx + x * sx), int(ry + y * sy), int(w * sx), int(h * sy)]
+                if zone is not None and not zone.contains([box[0] - ox, box[1] - oy, box[2], box[3]]):
+                    continue
+                score = max(score, round(confidence, 4))
+                if confidence >= threshold:
+                    boxes.append(box)
+            outputs[stage] = (score, boxes)
+        return outputs
+
+    def get_stats(self):
+        """Connection state, answered/late/local counts and round-trip percentiles"""
+        r = self.reports
+        stats = {
+            'server': f"{self.host}:{self.port}",
+            'connected': self.sock is not None,
+            'stages': dict(self.stages),
+            'requests': r['requests'],
+            'answered': r['answered'],
+            'late': r['late'],
+            'local': r['local'],
+            'errors': r['errors'],
+            'connects': r['connects'],
+            'in_flight': len(self.pending),
+            'avg_kb_sent': round(r['bytes_sent'] / r['requests'] / 1024, 1) if r['requests'] else 0.0,
+            'avg_server_ms': round(r['server_ms'] / r['answered'], 1) if r['answered'] else 0.0
+        }
+        rtt = np.array(list(self.rtt_ms))
+        if rtt.size:
+            p50, p95 = np.percentile(rtt, (50, 95))
+            stats.update(rtt_p50_ms=round(p50, 1), rtt_p95_ms=round(p95, 1))
+        return stats
 
-    def detect_motion(self, frame):
-        """Motion detection fallback"""
-        if not ENABLE_MOTION:
-            return False, []
+    def stop(self):
+        """Close the connection"""
+        self.running = False
+        sock = self.sock
+        if sock is not None:
+            self._drop(sock, "stopped")
+
+class DetectionEngine:
+    """Detectors and the single set of models shared by all camera pipelines"""
+
+    copies_per_frame = 0  # Full-frame copies detect_all() makes before detecting
+
+    def __init__(self, sensor=None, settings=None, offload=None):
+        """Load models"""
+        self.sensor = sensor
+        self.offload = offload  # OffloadClient for the expensive stages, or None
+        self.prev_frames = {}  # Motion reference frame per camera
+        self.cascade = DetectionCascade()
+        self.active = None
+        self.active = self.prepare(settings or detector_settings(default_config()), strict=False)
+
+    @property
+    def person_model(self):
+        return self.active.person_model
+
+    @property
+    def cigarette_model(self):
+        return self.active.cigarette_model
+
+    def prepare(self, settings, strict=True):
+        """Build a DetectorSet for new settings, loading only models that changed
+
+        With strict, a model that fails to load raises ConfigError, so a bad
+        change is rejected while the current detectors keep running.
+        """
+        models = {}
+        for key, fallback in (('person_model', "lightweight detection"),
+                              ('cigarette_model', "HSV visual detection")):
+            if self.active and self.active.settings[key] == settings[key]:
+                models[key] = getattr(self.active, key)  # Unchanged (even if it failed to load)
+            else:
+                models[key] = self._load_model(settings[key], fallback, key if strict else None)
+        if self.active and self.active.settings['zones'] == settings['zones']:
+            zones = self.active.zones  # Keep the rasterised masks
+        else:
+            zones = ZoneMasks(settings['zones'])
+        return DetectorSet(dict(settings), models['person_model'], models['cigarette_model'], zones)
+
+    def commit(self, active):
+        """Switch to a prepared DetectorSet (takes effect from the next frame)"""
+        self.active = active
+
+    def frame_fits(self, shape):
+        """Frames of any size can be detected on"""
+        return True
+
+    @staticmethod
+    def _load_model(name, fallback, config_key=None):
+        """One registry model, or None if it is not configured or cannot be loaded"""
+        if not name:
+            return None
+        try:
+            model = load_detector_model(name)
+            print(f"✓ {name} loaded ({model.backend}, {model.input_size[0]}x{model.input_size[1]}, "
+                  f"{model.threads} threads)")
+            return model
+        except Exception as e:
+            if config_key:
+                raise ConfigError({config_key: f"cannot load {name}: {e}"})
+            print(f"⚠ {name} not available: {e} (using {fallback})")
+            return None
 
-        if not hasattr(self, 'prev_frame'):
-            self.prev_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            self.prev_frame = cv2.GaussianBlur(self.prev_frame, (21, 21), 0)
-            return False, []
+    def detect_person(self, frame):
+        """Detect person using the person model"""
+        score, boxes = self.score_person(frame)
+        return len(boxes) > 0, boxes
+
+    def score_person(self, frame, rois=None, active=None, camera="default"):
+        """Highest person confidence from the person model, and boxes above its threshold"""
+        active = active or self.active
+        if active.person_model is None or not active.settings['enable_motion']:
+            return 0.0, []
+        zone = active.zones.get(camera, frame.shape)
+        if zone is not None and zone.empty:
+            return 0.0, []
 
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        gray = cv2.GaussianBlur(gray, (21, 21), 0)
-        frame_delta = cv2.absdiff(self.prev_frame, gray)
+        try:
+            return active.person_model.score(frame, rois, zone)
+        except:
+            return 0.0, []
+
+    def detect_motion(self, frame, camera="default"):
+        """Motion detection fallback (reference frame kept per camera)"""
+        return self.score_motion(frame, camera)[0] > 0.5, []
+
+    def score_motion(self, frame, camera="default", active=None):
+        """Motion score against the camera's previous frame, and the changed regions"""
+        active = active or self.active
+        if not active.settings['enable_motion']:
+            return 0.0, []
+        zone = active.zones.get(camera, frame.shape)
+        if zone is not None and zone.empty:
+            return 0.0, []
+
+        gray = self.motion_gray(frame, zone)
+        prev_frame = self.prev_frames.get(camera)
+        self.prev_frames[camera] = gray
+        if prev_frame is None:
+            return 0.0, []
+
+        return self.motion_score(prev_frame, gray, zone)
+
+    @staticmethod
+    def motion_gray(frame, zone=None):
+        """Blurred, downscaled grayscale reference used for frame differencing
+        (only of the zone's bounding box when the camera has zones)"""
+        luma = getattr(frame, 'luma', None)
+        if zone is not None:
+            frame = zone.crop(frame)
+            luma = zone.crop(luma) if luma is not None else None
+        # Dual-stream frames carry the lores Y plane: no colour conversion needed
+        gray = luma if luma is not None else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if MOTION_SCALE != 1:
+            gray = cv2.resize(gray, None, fx=MOTION_SCALE, fy=MOTION_SCALE,
+                              interpolation=cv2.INTER_AREA)
+        ksize = int(21 * MOTION_SCALE) | 1
+        return cv2.GaussianBlur(gray, (ksize, ksize), 0)
+
+    @staticmethod
+    def motion_score(prev_gray, gray, zone=None):
+        """Largest changed region between two motion references, scaled so that
+        the 5000 px^2 motion threshold maps to 0.5, and the changed regions in
+        frame pixels (used as tiling regions of interest)"""
+        if prev_gray.shape != gray.shape:
+            return 0.0, []  # Camera resolution or zones changed since the reference frame
+        frame_delta = cv2.absdiff(prev_gray, gray)
         thresh = cv2.threshold(frame_delta, 25, 255, cv2.THRESH_BINARY)[1]
         thresh = cv2.dilate(thresh, None, iterations=2)
-        contours, _ = cv2.findContours(thresh.copy(), cv2.RETR_EXTERNAL,
+        ox = oy = 0
+        if zone is not None:
+            cv2.bitwise_and(thresh, zone.motion_mask, dst=thresh)
+            ox, oy = zone.rect[:2]
+        contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL,
                                        cv2.CHAIN_APPROX_SIMPLE)
 
-        motion_detected = any(cv2.contourArea(c) > 5000 for c in contours)
-        self.prev_frame = gray
-        return motion_detected, []
+        largest = max((cv2.contourArea(c) for c in contours), default=0.0)
+        regions = []
+        for c in contours:
+            if cv2.contourArea(c) > 50:
+                x, y, w, h = (int(v / MOTION_SCALE) for v in cv2.boundingRect(c))
+                regions.append([x + ox, y + oy, w, h])
+        return min(largest / (10000.0 * MOTION_SCALE ** 2), 1.0), regions
 
     def detect_cigarette_visual(self, frame):
         """Improved visual cigarette detection with better filtering"""
-        if not ENABLE_VISUAL:
-            return False, []
+        score, boxes = self.score_visual(frame)
+        return len(boxes) > 0, boxes
+
+    def score_visual(self, frame, rois=None, active=None, camera="default"):
+        """Cigarette score from the cigarette model if one is loaded, else the HSV detector"""
+        active = active or self.active
+        if active.cigarette_model is None:
+            return self.score_cigarette_visual(frame, active, camera)
+        zone = active.zones.get(camera, frame.shape)
+        if zone is not None and zone.empty:
+            return 0.0, []
+        try:
+            return active.cigarette_model.score(frame, rois, zone)
+        except Exception as e:
+            print(f"Cigarette model error: {e}")
+            return 0.0, []
+
+    def score_cigarette_visual(self, frame, active=None, camera="default"):
+        """Visual cigarette score (strongest candidate) and candidate boxes
+
+        A lit tip on its own scores 0.6, an elongated white body 0.6 (0.9 when a
+        tip is nearby), so anything the original detector reported is >= 0.5.
+        With zones, only the zone's bounding box is converted and searched.
+        """
+        active = active or self.active
+        settings = active.settings
+        if not settings['enable_visual']:
+            return 0.0, []
+        zone = active.zones.get(camera, frame.shape)
+        x0 = y0 = 0
+        if zone is not None:
+            if zone.empty:
+                return 0.0, []
+            frame = zone.crop(frame)
+            x0, y0 = zone.rect[:2]
 
         try:
             hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
 
             # Detect bright orange/red (lit cigarette tip - most reliable)
-            lower_orange = np.array([0, 150, 150])  # Higher saturation
-            upper_orange = np.array([20, 255, 255])
+            lower_orange = np.array(settings['hsv_orange_lower'])  # Higher saturation
+            upper_orange = np.array(settings['hsv_orange_upper'])
             orange_mask = cv2.inRange(hsv, lower_orange, upper_orange)
 
             # Detect white cylindrical object (cigarette body)
-            lower_white = np.array([0, 0, 180])  # Brighter white
-            upper_white = np.array([180, 30, 255])  # Less saturation
+            lower_white = np.array(settings['hsv_white_lower'])  # Brighter white
+            upper_white = np.array(settings['hsv_white_upper'])  # Less saturation
             white_mask = cv2.inRange(hsv, lower_white, upper_white)
 
+            # Static exclusions (exit signs, heaters, lamps) never become candidates
+            if zone is not None:
+                cv2.bitwise_and(orange_mask, zone.mask, dst=orange_mask)
+                cv2.bitwise_and(white_mask, zone.mask, dst=white_mask)
+
             # Apply morphological operations
             kernel_small = np.ones((2,2), np.uint8)
             kernel_large = np.ones((5,5), np.uint8)
@@ -585,7 +2408,7 @@ class SmokingDetectionSystem:
                                                  cv2.CHAIN_APPROX_SIMPLE)
 
             boxes = []
-            detected = False
+            score = 0.0
 
             # Check for orange (lit tip) - high confidence
             for contour in orange_contours:
@@ -597,7 +2420,7 @@ class SmokingDetectionSystem:
                     # Check for circular/square shape (lit tip)
                     if 0.5 < aspect_ratio < 2.5:
                         boxes.append([x, y, w, h])
-                        detected = True
+                        score = max(score, 0.6)
 
             # Check for white cylindrical object (cigarette body)
             for contour in white_contours:
@@ -623,76 +2446,1548 @@ class SmokingDetectionSystem:
                             if has_orange_tip or aspect_ratio > 4.0:
                                 if [x, y, w, h] not in boxes:
                                     boxes.append([x, y, w, h])
-                                    detected = True
+                                    score = max(score, 0.9 if has_orange_tip else 0.6)
 
-            return detected, boxes
+            return score, [[x + x0, y + y0, w, h] for x, y, w, h in boxes]
         except Exception as e:
             print(f"Visual detection error: {e}")
-            return False, []
-
-    def detect_all(self, frame):
-        """Run all detection methods"""
-        results = {
-            'sensor': False,
-            'motion': False,
-            'visual': False,
-            'boxes': []
+            return 0.0, []
+
+    def _run_stage(self, stage, frame, camera, rois=None, active=None):
+        """One detection stage as (score, boxes); motion boxes are the changed regions"""
+        if stage == 'sensor':
+            return (1.0 if self.sensor.detect_smoke() else 0.0), []
+        if stage == 'motion':
+            return self.score_motion(frame, camera, active)
+        if stage == 'person':
+            return self.score_person(frame, rois, active, camera)
+        return self.score_visual(frame, rois, active, camera)
+
+    def detect_all(self, frame, camera="default", skip=()):
+        """Run the detection cascade (detectors named in skip are not run)
+
+        results['skipped'] lists every enabled stage that did not run.
+        """
+        results = _new_detection_results()
+        active = self.active  # One configuration for the whole frame
+        cascade = self.cascade
+        available = [s for s in cascade.gates + cascade.stages
+                     if _stage_enabled(s, self.sensor, active.settings) and s not in skip]
+        outputs = {}
+
+        # Cheap gates: sensor state, low-resolution motion
+        for stage in cascade.order(cascade.gates, available):
+            outputs[stage] = cascade.run(stage, self._run_stage, stage, frame, camera, None, active)
+
+        # Expensive stages only when something is going on
+        exited = False
+        if cascade.gate_open(camera, outputs):
+            stages = cascade.order(cascade.stages, available)
+            if self.offload is not None and stages:
+                rois = outputs.get('motion', (0, []))[1]
+                outputs.update(_offload_stages(self, frame, camera, stages, rois, active.zones))
+            for stage in stages:
+                if stage in outputs:
+                    continue  # Answered by the inference server
+                if cascade.conclusive(outputs):
+                    exited = True
+                    break
+                # Motion regions and person boxes found so far steer tiling
+                rois = [box for key in ('motion', 'person') for box in outputs.get(key, (0, []))[1]]
+                outputs[stage] = cascade.run(stage, self._run_stage, stage, frame, camera, rois,
+                                             active)
+
+        results['skipped'] = tuple(skip) + cascade.finish(available, outputs, exited)
+
+        # Overall detection
+        detected = _combine_scores(results, outputs)
+
+        return detected, results
+
+    def get_stats(self):
+        """Engine statistics"""
+        models = {m.task: m.get_stats() for m in (self.person_model, self.cigarette_model) if m}
+        stats = {'mode': 'threads', 'cascade': self.cascade.get_stats(), 'models': models}
+        if self.offload is not None:
+            stats['offload'] = self.offload.get_stats()
+        return stats
+
+    def stop(self):
+        """Close the inference server connection (models are freed with the object)"""
+        if self.offload is not None:
+            self.offload.stop()
+
+class SharedFrameRing:
+    """Fixed set of frame slots in one multiprocessing.shared_memory block
+
+    Frames are copied into a free slot once and worker processes map the same
+    memory, so only slot numbers go through the task queue. Each slot is
+    reference counted: it stays allocated while any queued task still reads it
+    (motion detection also reads the previous frame of the same camera).
+    """
+
+    def __init__(self, slots, max_frame_shape):
+        """Allocate the shared block"""
+        self.slots = slots
+        self.slot_bytes = int(np.prod(max_frame_shape))
+        self.shm = shared_memory.SharedMemory(create=True, size=self.slots * self.slot_bytes)
+        self.refs = [0] * slots
+        self.cond = threading.Condition()
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def acquire(self, timeout=None):
+        """Reserve a free slot (blocks while all slots are in use)"""
+        with self.cond:
+            while True:
+                for slot, refs in enumerate(self.refs):
+                    if refs == 0:
+                        self.refs[slot] = 1
+                        return slot
+                if not self.cond.wait(timeout):
+                    raise TimeoutError("No free shared frame slot")
+
+    def retain(self, slot):
+        """Add a reader to a slot"""
+        with self.cond:
+            self.refs[slot] += 1
+
+    def release(self, slot):
+        """Drop a reader; the slot is reused once nobody reads it"""
+        with self.cond:
+            self.refs[slot] -= 1
+            if self.refs[slot] <= 0:
+                self.refs[slot] = 0
+                self.cond.notify()
+
+    def write(self, slot, frame):
+        """Copy a frame into a slot"""
+        if frame.dtype != np.uint8 or frame.nbytes > self.slot_bytes:
+            raise ValueError(f"Frame {frame.shape} does not fit a {self.slot_bytes} byte slot")
+        view = np.ndarray(frame.shape, np.uint8, buffer=self.shm.buf,
+                          offset=slot * self.slot_bytes)
+        np.copyto(view, frame)
+
+    def close(self):
+        """Free the shared block"""
+        try:
+            self.shm.close()
+            self.shm.unlink()
+        except Exception:
+            pass
+
+def _attach_shared_memory(name):
+    """Attach to the parent's block (spawned children share its resource tracker,
+    so the extra registration on older Pythons is harmless)"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+def _detection_process_main(shm_name, slot_bytes, tasks, results, settings=None):
+    """Detection worker process: reads frames from shared memory, returns scores and boxes"""
+    shm = _attach_shared_memory(shm_name)
+    engine = DetectionEngine(settings=settings)
+    results.put(('ready', os.getpid()))
+    gray_cache = {}  # camera -> (seq, motion reference), saves re-blurring the previous frame
+
+    def frame_view(slot, shape):
+        return np.ndarray(shape, np.uint8, buffer=shm.buf, offset=slot * slot_bytes)
+
+    def motion_reference(camera, seq, slot, shape):
+        cached = gray_cache.get(camera)
+        if cached and cached[0] == seq:
+            return cached[1]
+        return DetectionEngine.motion_gray(frame_view(slot, shape),
+                                           engine.active.zones.get(camera, shape))
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        task_id, kind, camera, seq, slot, shape, prev, rois, settings = task
+        if settings != engine.active.settings:
+            # Configuration changed: switch between two tasks, like the threaded engine
+            engine.commit(engine.prepare(settings, strict=False))
+        start = time.time()
+        try:
+            frame = frame_view(slot, shape)
+            if kind == 'person':
+                score, boxes = engine.score_person(frame, rois, camera=camera)
+            elif kind == 'visual':
+                score, boxes = engine.score_visual(frame, rois, camera=camera)
+            else:
+                zone = engine.active.zones.get(camera, shape)
+                score, boxes = 0.0, []
+                if zone is None or not zone.empty:
+                    gray = DetectionEngine.motion_gray(frame, zone)
+                    if prev is not None:
+                        prev_seq, prev_slot, prev_shape = prev
+                        prev_gray = motion_reference(camera, prev_seq, prev_slot, prev_shape)
+                        score, boxes = DetectionEngine.motion_score(prev_gray, gray, zone)
+                    gray_cache[camera] = (seq, gray)
+            boxes = [[int(v) for v in box] for box in boxes]
+        except Exception as e:
+            print(f"Detection process error ({kind}): {e}")
+            score, boxes = 0.0, []
+        results.put((task_id, float(score), boxes, time.time() - start))
+
+    try:
+        shm.close()
+    except BufferError:
+        pass  # Views still alive at exit; the parent unlinks the block anyway
+
+class ProcessDetectionEngine:
+    """Drop-in DetectionEngine that runs the detectors in worker processes
+
+    detect_all() writes the frame into a shared-memory ring slot, queues one
+    task per detector (person, motion, visual) so a single frame is spread over
+    several cores, and waits for the scores and boxes to come back. The calling
+    thread only blocks on a queue, so Flask and capture threads are not
+    fighting detection for the GIL.
+    """
+
+    copies_per_frame = 1  # The write into the shared-memory slot
+
+    def __init__(self, sensor=None, processes=DETECTION_PROCESSES, slots=8,
+                 max_frame_shape=(CAMERA_RESOLUTION[1], CAMERA_RESOLUTION[0], 3),
+                 task_timeout=5.0, settings=None, offload=None):
+        """Start worker processes"""
+        self.sensor = sensor
+        self.settings = dict(settings or detector_settings(default_config()))
+        self.offload = offload
+        self.zones = ZoneMasks(self.settings['zones'])  # Offloaded images are cropped to the zones
+        self.task_timeout = task_timeout
+        self.ring = SharedFrameRing(slots, max_frame_shape)
+        self.ids = itertools.count()
+        self.last_frame = {}   # camera -> (seq, slot, shape) held for the next motion task
+        self.waiting = {}      # task_id -> [event, result, slots]
+        self.lock = threading.Lock()
+        self.stats = {'frames': 0, 'timeouts': 0, 'task_ms': {}}
+        self.cascade = DetectionCascade()
+
+        ctx = multiprocessing.get_context('spawn')
+        self.tasks = ctx.Queue()
+        self.results = ctx.Queue()
+        self.processes = []
+        for i in range(max(1, int(processes))):
+            p = ctx.Process(target=_detection_process_main, name=f"detect-proc-{i}",
+                            args=(self.ring.name, self.ring.slot_bytes, self.tasks, self.results,
+                                  self.settings),
+                            daemon=True)
+            p.start()
+            self.processes.append(p)
+
+        # Wait until every worker has imported OpenCV and loaded its model
+        # (tens of seconds on a Pi Zero), so the first frames do not time out
+        for _ in self.processes:
+            try:
+                self.results.get(timeout=120)
+            except Exception:
+                print("⚠ Detection process did not report ready")
+                break
+
+        self.running = True
+        self.collector = threading.Thread(target=self._collect_results, daemon=True)
+        self.collector.start()
+        print(f"✓ Detection processes started ({len(self.processes)} workers, "
+              f"{slots} shared frame slots)")
+
+    def _collect_results(self):
+        """Route results from worker processes back to the waiting detect_all call"""
+        while self.running:
+            try:
+                task_id, score, boxes, elapsed = self.results.get(timeout=0.5)
+            except Exception:
+                continue
+            with self.lock:
+                entry = self.waiting.pop(task_id, None)
+            if entry is None:
+                continue  # Caller already gave up on this task
+            entry[1] = (score, boxes, elapsed)
+            for slot in entry[2]:
+                self.ring.release(slot)
+            entry[0].set()
+
+    def prepare(self, settings, strict=True):
+        """Settings for the workers; they load changed models themselves on the next task"""
+        zones = self.zones if settings['zones'] == self.settings['zones'] else ZoneMasks(settings['zones'])
+        return DetectorSet(dict(settings), None, None, zones)
+
+    def commit(self, active):
+        """Switch to prepared settings (sent along with every following task)"""
+        self.settings = active.settings
+        self.zones = active.zones
+
+    def frame_fits(self, shape):
+        """Whether a frame of this shape fits a shared-memory slot"""
+        return int(np.prod(shape)) <= self.ring.slot_bytes
+
+    def _submit(self, kind, camera, seq, slot, shape, prev=None, rois=None, settings=None):
+        """Queue one detector task; its slots stay retained until the result arrives"""
+        task_id = next(self.ids)
+        slots = [slot] + ([prev[1]] if prev else [])
+        for s in slots:
+            self.ring.retain(s)
+        entry = [threading.Event(), None, slots]
+        with self.lock:
+            self.waiting[task_id] = entry
+        self.tasks.put((task_id, kind, camera, seq, slot, shape, prev, rois,
+                        settings or self.settings))
+        return kind, task_id, entry
+
+    def _wait(self, jobs, camera):
+        """Wait for queued tasks; returns {kind: (score, boxes)} for those that finished"""
+        done = {}
+        deadline = time.time() + self.task_timeout
+        for kind, task_id, entry in jobs:
+            if entry[0].wait(max(0.0, deadline - time.time())):
+                score, boxes, elapsed = entry[1]
+                done[kind] = (score, boxes)
+                self.cascade.record(kind, elapsed)
+                task_ms = self.stats['task_ms']
+                task_ms[kind] = 0.9 * task_ms.get(kind, elapsed * 1000) + 0.1 * elapsed * 1000
+            else:
+                with self.lock:
+                    abandoned = self.waiting.pop(task_id, None)
+                if abandoned is not None:
+                    for s in abandoned[2]:
+                        self.ring.release(s)
+                self.stats['timeouts'] += 1
+                print(f"⚠ Detection task '{kind}' timed out ({camera})")
+        return done
+
+    def detect_all(self, frame, camera="default", skip=()):
+        """Run the detection cascade in worker processes (detectors named in skip are not run)
+
+        The gates (sensor here, motion in a worker) run first; the expensive
+        stages that pass the gate are then queued together so they still
+        spread over several cores. Because they run in parallel there is no
+        early exit between them.
+        """
+        results = _new_detection_results()
+        settings, zones = self.settings, self.zones  # One configuration for the whole frame
+        cascade = self.cascade
+        available = [s for s in cascade.gates + cascade.stages
+                     if _stage_enabled(s, self.sensor, settings) and s not in skip]
+        outputs = {}
+
+        # Check sensor (GPIO stays in this process)
+        if 'sensor' in available:
+            outputs['sensor'] = cascade.run(
+                'sensor', lambda: ((1.0 if self.sensor.detect_smoke() else 0.0), []))
+
+        if not any(s in available for s in ('motion', 'person', 'visual')):
+            results['skipped'] = tuple(skip) + cascade.finish(available, outputs)
+            return _combine_scores(results, outputs), results
+
+        frame = np.ascontiguousarray(frame)
+        slot = self.ring.acquire(timeout=self.task_timeout)
+        self.ring.write(slot, frame)
+        seq = next(self.ids)
+        prev = self.last_frame.get(camera)
+
+        # Motion gate first: its reference needs the previous frame of this camera
+        jobs = []
+        if 'motion' in available:
+            jobs.append(self._submit('motion', camera, seq, slot, frame.shape, prev,
+                                     settings=settings))
+
+        # Hold this frame as the next motion reference, drop the hold on the old one
+        self.last_frame[camera] = (seq, slot, frame.shape)
+        if prev is not None:
+            self.ring.release(prev[1])
+
+        outputs.update(self._wait(jobs, camera))
+
+        if cascade.gate_open(camera, outputs):
+            rois = outputs.get('motion', (0, []))[1]  # Changed regions steer tiling
+            stages = cascade.order(cascade.stages, available)
+            if self.offload is not None and stages:
+                outputs.update(_offload_stages(self, frame, camera, stages, rois, zones))
+            jobs = [self._submit(kind, camera, seq, slot, frame.shape, rois=rois, settings=settings)
+                    for kind in stages if kind not in outputs]
+            outputs.update(self._wait(jobs, camera))
+        self.stats['frames'] += 1
+
+        results['skipped'] = tuple(skip) + cascade.finish(available, outputs)
+        detected = _combine_scores(results, outputs)
+        return detected, results
+
+    def get_stats(self):
+        """Worker process statistics"""
+        stats = {
+            'mode': 'processes',
+            'processes': len(self.processes),
+            'alive': sum(p.is_alive() for p in self.processes),
+            'frames': self.stats['frames'],
+            'timeouts': self.stats['timeouts'],
+            'avg_task_ms': {k: round(v, 1) for k, v in self.stats['task_ms'].items()},
+            'cascade': self.cascade.get_stats()
         }
+        if self.offload is not None:
+            stats['offload'] = self.offload.get_stats()
+        return stats
 
-        # Check sensor
-        if self.sensor and ENABLE_SENSOR:
-            results['sensor'] = self.sensor.detect_smoke()
-
-        # Check motion/person
-        if ENABLE_MOTION:
-            person_detected, person_boxes = self.detect_person(frame)
-            if person_detected:
-                results['motion'] = True
-                results['boxes'].extend(person_boxes)
+    def stop(self):
+        """Stop worker processes and free shared memory"""
+        self.running = False
+        if self.offload is not None:
+            self.offload.stop()
+        for _ in self.processes:
+            self.tasks.put(None)
+        for p in self.processes:
+            p.join(timeout=3)
+            if p.is_alive():
+                p.terminate()
+        self.ring.close()
+
+class DetectionWorkerPool:
+    """Shared pool of detection workers serving every camera pipeline
+
+    Each camera has a single pending-frame slot: a newer frame replaces one that
+    has not been picked up yet, so a busy pool drops stale frames instead of
+    queueing them. When several cameras are waiting, the next one served is the
+    camera with the lowest weighted virtual time (busy seconds / weight), which
+    shares worker time in proportion to each camera's weight.
+    """
+
+    def __init__(self, num_workers=DETECTION_WORKERS, supervisor=None):
+        """Create the pool (workers start with start())"""
+        self.num_workers = max(1, int(num_workers))
+        self.supervisor = supervisor or Supervisor(enabled=False)
+        self.cond = threading.Condition()
+        self.pending = {}   # camera name -> (camera, frame, stamp, submitted_at)
+        self.busy = set()   # cameras currently being processed (one worker per camera)
+        self.vtime = {}     # camera name -> weighted virtual time
+        self.stats = {}
+        self.threads = []
+        self.generations = []  # Per worker slot; a replaced worker exits when it sees a newer one
+        self.jobs = {}         # worker slot -> camera name being processed
+        self.errors = {}       # camera name -> frames in a row that raised
+        self.running = False
+
+    def start(self):
+        """Start worker threads"""
+        self.running = True
+        self.threads = [None] * self.num_workers
+        self.generations = [0] * self.num_workers
+        for slot in range(self.num_workers):
+            self._start_worker(slot)
+        print(f"✓ Detection pool started ({self.num_workers} workers)")
+
+    def _start_worker(self, slot):
+        self.generations[slot] += 1
+        t = threading.Thread(target=self._worker, args=(slot, self.generations[slot]),
+                             name=f"detect-{slot}", daemon=True)
+        self.threads[slot] = t
+        t.start()
+
+    def replace_worker(self, slot):
+        """Start a new worker in place of a stuck or dead one (supervisor restart)
+
+        A stuck thread cannot be killed; it is left to exit once its call
+        returns. Its camera is released so the new workers can serve it again.
+        """
+        with self.cond:
+            camera = self.jobs.pop(slot, None)
+            if camera is not None:
+                self.busy.discard(camera)
+            self._start_worker(slot)
+            self.cond.notify_all()
+
+    def stop(self):
+        """Stop worker threads"""
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        for t in self.threads:
+            t.join(timeout=2)
+        self.threads = []
+
+    def submit(self, camera, frame, stamp=None):
+        """Hand the latest frame of a camera to the pool (stamp: its FrameStamp)"""
+        if stamp is None:
+            stamp = FrameStamp(0, time.monotonic())
+        with self.cond:
+            stats = self.stats.setdefault(camera.name, {
+                'submitted': 0, 'processed': 0, 'dropped': 0,
+                'busy_s': 0.0, 'wait_s': 0.0
+            })
+            stats['submitted'] += 1
+            if camera.name in self.pending:
+                stats['dropped'] += 1
+                camera.release_frame(self.pending[camera.name][1])
+            elif camera.name not in self.busy:
+                # A camera returning from idle starts at the current minimum so it
+                # cannot spend credit banked while it had nothing to do
+                active = [self.vtime[n] for n in set(self.pending) | self.busy if n in self.vtime]
+                floor = min(active) if active else 0.0
+                self.vtime[camera.name] = max(self.vtime.get(camera.name, 0.0), floor)
+            self.pending[camera.name] = (camera, frame, stamp, time.time())
+            self.cond.notify()
+
+    def _next_job(self):
+        """Pick the waiting camera with the lowest virtual time (caller holds cond)"""
+        ready = [n for n in self.pending if n not in self.busy]
+        if not ready:
+            return None
+        name = min(ready, key=lambda n: self.vtime.get(n, 0.0))
+        self.busy.add(name)
+        return self.pending.pop(name)
+
+    def _worker(self, slot, generation):
+        """Worker loop (heartbeat on every job and every idle wakeup, failure on every error)"""
+        name = f"detect:{slot}"
+        while True:
+            with self.cond:
+                if self.generations[slot] != generation:
+                    return
+                job = self._next_job()
+                while job is None and self.running:
+                    self.supervisor.beat(name, progress=False)
+                    self.cond.wait(0.5)
+                    if self.generations[slot] != generation:
+                        return
+                    job = self._next_job()
+                if job is None:
+                    return
+                self.jobs[slot] = job[0].name
+            camera, frame, stamp, submitted_at = job
+
+            start = time.time()
+            error = None
+            try:
+                camera.process_frame(frame, stamp)
+            except Exception as e:
+                error = e
+                print(f"❌ Detection error ({camera.name}): {e}")
+                import traceback
+                traceback.print_exc()
+            elapsed = time.time() - start
+
+            with self.cond:
+                if self.generations[slot] != generation:
+                    return  # Replaced while stuck: the slot and the camera are someone else's now
+                del self.jobs[slot]
+                self.busy.discard(camera.name)
+                self.vtime[camera.name] = self.vtime.get(camera.name, 0.0) + elapsed / camera.weight
+                stats = self.stats[camera.name]
+                stats['processed'] += 1
+                stats['busy_s'] += elapsed
+                stats['wait_s'] += start - submitted_at
+                self.errors[camera.name] = 0 if error is None else self.errors.get(camera.name, 0) + 1
+                failing = any(self.errors.values())
+                self.cond.notify()
+            if error is not None:
+                # A frame that raised is no progress: repeated errors trip SUPERVISOR_MAX_FAILURES
+                self.supervisor.fail(name, f"{camera.name}: {error}")
             else:
-                motion_detected, _ = self.detect_motion(frame)
-                results['motion'] = motion_detected
+                # Other cameras' good frames do not clear the failures of one that keeps raising
+                self.supervisor.beat(name, progress=not failing)
+
+    def get_stats(self):
+        """Per-camera scheduling statistics"""
+        with self.cond:
+            total_busy = sum(s['busy_s'] for s in self.stats.values()) or 1.0
+            cameras = {}
+            for name, s in self.stats.items():
+                processed = s['processed'] or 1
+                cameras[name] = {
+                    'submitted': s['submitted'],
+                    'processed': s['processed'],
+                    'dropped': s['dropped'],
+                    'avg_detect_ms': round(s['busy_s'] / processed * 1000, 1),
+                    'avg_wait_ms': round(s['wait_s'] / processed * 1000, 1),
+                    'worker_share': round(s['busy_s'] / total_busy, 3)
+                }
+            return {'workers': self.num_workers, 'cameras': cameras}
+
+class TemporalFusion:
+    """Per-camera confidence fused over recent frames
+
+    Each detector score is smoothed with an EWMA (one float per detector, so
+    updating it every frame is free) and the smoothed scores are combined with a
+    weighted noisy-OR into one confidence value. A single noisy frame only moves
+    the confidence by FUSION_ALPHA of its score; a violation needs evidence that
+    persists over a few frames.
+
+    While the confidence is conclusive either way, plan() tells the caller to
+    skip the expensive detectors (person, visual) except on every
+    FUSION_RECHECK_FRAMES-th frame; their smoothed scores are held, not decayed,
+    while skipped. Cheap detectors (sensor, motion) run every frame and pull the
+    confidence out of the conclusive band when something changes.
+    """
+
+    DETECTORS = ('sensor', 'person', 'motion', 'visual')
+    EXPENSIVE = ('person', 'visual')
+
+    def __init__(self, alpha=FUSION_ALPHA, weights=None, high=FUSION_CONCLUSIVE_HIGH,
+                 low=FUSION_CONCLUSIVE_LOW, recheck=FUSION_RECHECK_FRAMES):
+        """Start with no evidence"""
+        self.alpha = alpha
+        self.weights = dict(FUSION_WEIGHTS, **(weights or {}))
+        self.high = high
+        self.low = low
+        self.recheck = max(1, int(recheck))
+        self.smoothed = dict.fromkeys(self.DETECTORS, 0.0)
+        self.confidence = 0.0
+        self.frames = 0
+        self.since_full = 0
+        self.skipped = dict.fromkeys(self.EXPENSIVE, 0)
+
+    def conclusive(self):
+        """True when the fused confidence is decided either way"""
+        return self.frames > 0 and (self.confidence >= self.high or self.confidence <= self.low)
+
+    def plan(self):
+        """Detectors to skip on the next frame"""
+        if not self.conclusive() or self.since_full >= self.recheck - 1:
+            self.since_full = 0
+            return ()
+        self.since_full += 1
+        for key in self.EXPENSIVE:
+            self.skipped[key] += 1
+        return self.EXPENSIVE
+
+    def update(self, scores, skipped=()):
+        """Fold one frame's detector scores in and return the fused confidence"""
+        for key in self.DETECTORS:
+            if key not in skipped:
+                self.smoothed[key] += self.alpha * (scores.get(key, 0.0) - self.smoothed[key])
+
+        miss = 1.0
+        for key, value in self.smoothed.items():
+            miss *= 1.0 - min(1.0, self.weights.get(key, 0.0) * value)
+        self.confidence = 1.0 - miss
+        self.frames += 1
+        return self.confidence
+
+    def active(self):
+        """Detectors whose smoothed score is still meaningful (used for flags/labels)"""
+        active = {key for key, value in self.smoothed.items() if value >= 0.25}
+        if not active and self.confidence >= 0.25:
+            # Several weak detectors together: label with the strongest one
+            active.add(max(self.smoothed, key=self.smoothed.get))
+        return active
+
+    def get_stats(self):
+        """Fusion state"""
+        return {
+            'confidence': round(self.confidence, 3),
+            'smoothed': {k: round(v, 3) for k, v in self.smoothed.items()},
+            'conclusive': self.conclusive(),
+            'frames': self.frames,
+            'skipped': dict(self.skipped)
+        }
 
-        # Check visual cigarette
-        if ENABLE_VISUAL:
-            visual_detected, visual_boxes = self.detect_cigarette_visual(frame)
-            if visual_detected:
-                results['visual'] = True
-                results['boxes'].extend(visual_boxes)
+def read_cpu_temp():
+    """SoC temperature in °C, or None where the thermal zone is not available"""
+    try:
+        with open('/sys/class/thermal/thermal_zone0/temp') as f:
+            return int(f.read().strip()) / 1000.0
+    except (OSError, ValueError):
+        return None
 
-        # Overall detection
-        detected = results['sensor'] or results['motion'] or results['visual']
+def read_memory_mb():
+    """(process RSS, system MemAvailable) in MB from /proc, None where unreadable"""
+    values = {}
+    for path, key in (('/proc/self/status', 'VmRSS:'), ('/proc/meminfo', 'MemAvailable:')):
+        try:
+            with open(path) as f:
+                for line in f:
+                    if line.startswith(key):
+                        values[key] = int(line.split()[1]) / 1024
+                        break
+        except OSError:
+            pass
+    return values.get('VmRSS:'), values.get('MemAvailable:')
+
+class MemoryGovernor:
+    """Degrades the system step by step under memory pressure, and recovers
+
+    Each level keeps the ones below it:
+      1 streams      only the first camera can be streamed
+      2 stream_fps   streams send MEMORY_STREAM_FPS_DIVISOR times fewer frames
+      3 resolution   cameras reopen at MEMORY_RESOLUTION_SCALE of their resolution
+      4 dnn_cadence  expensive detectors run on every MEMORY_DNN_EVERY-th frame only
+      5 viewers      new viewers are rejected and open streams are closed
+
+    One step per check: down while RSS or available memory is past its
+    high-water mark, back up after MEMORY_RECOVER_CHECKS calm checks in a row.
+    The gap between the marks keeps it from flapping between two levels.
+    """
+
+    LEVELS = ('normal', 'streams', 'stream_fps', 'resolution', 'dnn_cadence', 'viewers')
+
+    def __init__(self, system, enabled=MEMORY_GOVERNOR, interval=MEMORY_CHECK_INTERVAL):
+        """Start at level 0 (nothing degraded)"""
+        self.system = system
+        self.enabled = enabled
+        self.interval = interval
+        self.level = 0
+        self.calm = 0
+        self.rss_mb = None
+        self.available_mb = None
+        self.history = deque(maxlen=50)  # Level transitions, newest last
+        self.dnn_frames = {}             # camera -> frames since the expensive detectors ran
+        self.stop_event = threading.Event()
+
+    def start(self):
+        """Start the check thread"""
+        if self.enabled:
+            threading.Thread(target=self._check_loop, name="memory-governor", daemon=True).start()
 
-        return detected, results
+    def stop(self):
+        """Stop the check thread"""
+        self.stop_event.set()
 
-    def save_violation(self, frame, results):
-        """Save violation image"""
+    def _check_loop(self):
+        """Check memory every interval seconds"""
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                print(f"⚠ Memory governor error: {e}")
+
+    def check(self, rss_mb=None, available_mb=None):
+        """Read memory (or take the given values) and move at most one level"""
+        if rss_mb is None and available_mb is None:
+            rss_mb, available_mb = read_memory_mb()
+        self.rss_mb, self.available_mb = rss_mb, available_mb
+        if rss_mb is None and available_mb is None:
+            return self.level  # No /proc: nothing to govern
+
+        pressure = ((rss_mb is not None and rss_mb > MEMORY_RSS_HIGH_MB)
+                    or (available_mb is not None and available_mb < MEMORY_AVAILABLE_LOW_MB))
+        calm = ((rss_mb is None or rss_mb < MEMORY_RSS_LOW_MB)
+                and (available_mb is None or available_mb > MEMORY_AVAILABLE_HIGH_MB))
+        self.calm = self.calm + 1 if calm else 0
+        if pressure and self.level < len(self.LEVELS) - 1:
+            self.set_level(self.level + 1)
+        elif self.calm >= MEMORY_RECOVER_CHECKS and self.level > 0:
+            self.calm = 0
+            self.set_level(self.level - 1)
+        return self.level
+
+    def set_level(self, level):
+        """Switch level, log the transition and reopen cameras if their size changes"""
+        level = min(max(int(level), 0), len(self.LEVELS) - 1)
+        old, self.level = self.level, level
+        if level == old:
+            return
+        self.history.append({
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'from': self.LEVELS[old],
+            'to': self.LEVELS[level],
+            'level': level,
+            'rss_mb': None if self.rss_mb is None else round(self.rss_mb, 1),
+            'available_mb': None if self.available_mb is None else round(self.available_mb, 1)
+        })
+        arrow = "⬇" if level > old else "⬆"
+        print(f"{arrow} Memory governor: {self.LEVELS[old]} -> {self.LEVELS[level]} "
+              f"(RSS {self.rss_mb or 0:.0f} MB, available {self.available_mb or 0:.0f} MB)")
+        if (old >= 3) != (level >= 3):
+            for cam in self.system.cameras.values():
+                cam.reconfigure(cam.target_size())
+
+    def stream_allowed(self, camera=None):
+        """Whether a viewer may watch (keep watching) a camera's stream"""
+        if self.level >= 5:
+            return False
+        if self.level >= 1 and camera is not None:
+            return camera == next(iter(self.system.cameras), None)
+        return True
+
+    def stream_interval(self):
+        """Pause between stream frames"""
+        return STREAM_INTERVAL * (MEMORY_STREAM_FPS_DIVISOR if self.level >= 2 else 1)
+
+    def resolution_scale(self):
+        """Fraction of their configured size cameras capture at"""
+        return MEMORY_RESOLUTION_SCALE if self.level >= 3 else 1.0
+
+    def plan_skip(self, camera, skip):
+        """Add the expensive detectors to a frame's skip list at the dnn_cadence level"""
+        if self.level < 4:
+            return skip
+        count = self.dnn_frames.get(camera, 0)
+        self.dnn_frames[camera] = (count + 1) % MEMORY_DNN_EVERY
+        if count == 0:
+            return skip
+        return tuple(skip) + tuple(s for s in TemporalFusion.EXPENSIVE if s not in skip)
+
+    def get_stats(self, history=False):
+        """Current level and memory readings (plus recent transitions)"""
+        stats = {
+            'enabled': self.enabled,
+            'level': self.level,
+            'state': self.LEVELS[self.level],
+            'rss_mb': None if self.rss_mb is None else round(self.rss_mb, 1),
+            'available_mb': None if self.available_mb is None else round(self.available_mb, 1),
+            'thresholds': {'rss_high_mb': MEMORY_RSS_HIGH_MB, 'rss_low_mb': MEMORY_RSS_LOW_MB,
+                           'available_low_mb': MEMORY_AVAILABLE_LOW_MB,
+                           'available_high_mb': MEMORY_AVAILABLE_HIGH_MB},
+            'transitions': len(self.history)
+        }
+        if history:
+            stats['history'] = list(self.history)
+        return stats
+
+class Supervisor:
+    """Watches every stage of the pipeline and restarts the one that fails
+
+    Components report in one of two ways:
+      beat(name)    loops (capture, detection workers, writers) call it on every
+                    iteration; no heartbeat within the stage's SLO is a stall,
+                    and SUPERVISOR_MAX_FAILURES fail(name) calls in a row without
+                    progress in between count as a stall too
+      watch(name)   wraps one on-demand call (OLED update, sensor read); a call
+                    running past the SLO is a stall, and so are
+                    SUPERVISOR_MAX_FAILURES failed calls in a row
+    A component whose thread died is down as well. Only that component is
+    restarted (one camera reopened, one worker replaced, the OLED
+    reinitialised...), on a thread of its own so a restart that hangs does not
+    hold up the others. Until the component reports healthy again, further
+    restarts wait its SLO plus a pause that doubles each time. Downtime runs
+    from the last good heartbeat to the first one after the restart.
+    """
+
+    def __init__(self, enabled=SUPERVISOR, interval=SUPERVISOR_INTERVAL):
+        """No components yet (see register())"""
+        self.enabled = enabled
+        self.interval = interval
+        self.components = {}
+        self.lock = threading.Lock()
+        self.history = deque(maxlen=50)  # Stalls, restarts and recoveries, newest last
+        self.stop_event = threading.Event()
+
+    def register(self, name, stage, restart, alive=None, interval=0.0, heartbeat=True):
+        """Watch a component
+
+        restart() brings it back (raising if it could not), alive() tells if
+        its thread is still running, interval is how long the component itself
+        sleeps between heartbeats. heartbeat=False for components that are only
+        used through watch().
+        """
+        with self.lock:
+            self.components[name] = {
+                'stage': stage, 'restart': restart, 'alive': alive, 'heartbeat': heartbeat,
+                'slo': SUPERVISOR_SLO[stage] + interval,
+                'last_beat': time.time(), 'busy_since': None, 'failures': 0,
+                'last_error': None, 'down_since': None, 'reason': None, 'failing': False,
+                'restarting': False, 'attempts': 0, 'next_restart': 0.0,
+                'restarts': 0, 'failed_restarts': 0, 'downtime_s': 0.0, 'last_restart': None
+            }
+
+    def start(self):
+        """Start the check thread (heartbeats count from now)"""
+        now = time.time()
+        for c in self.components.values():
+            c['last_beat'] = now
+        threading.Thread(target=self._check_loop, name="supervisor", daemon=True).start()
+
+    def stop(self):
+        """Stop checking (before components are shut down on purpose)"""
+        self.stop_event.set()
+
+    def beat(self, name, progress=True):
+        """Heartbeat: the component just made progress (progress=False: it is only
+        alive, e.g. an idle wakeup, which keeps its count of failures)"""
+        c = self.components.get(name)
+        if c is None:
+            return
+        c['last_beat'] = time.time()
+        if progress:
+            c['failures'] = 0
+        # Down for failures: only real progress counts as recovered
+        if c['down_since'] is not None and not c['restarting'] and (progress or not c['failing']):
+            self._recovered(name, c)
+
+    def fail(self, name, error):
+        """One failed iteration or call of a component"""
+        c = self.components.get(name)
+        if c is None:
+            return
+        c['failures'] += 1
+        c['last_error'] = str(error)
+
+    @contextmanager
+    def watch(self, name):
+        """Time one call of an on-demand component; exceptions still propagate"""
+        c = self.components.get(name)
+        if c is None:
+            yield
+            return
+        c['busy_since'] = time.time()
+        try:
+            yield
+        except Exception as e:
+            self.fail(name, e)
+            raise
+        else:
+            self.beat(name)
+        finally:
+            c['busy_since'] = None
+
+    def _check_loop(self):
+        """Check every interval seconds"""
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                print(f"⚠ Supervisor error: {e}")
+
+    def _fault(self, c, now):
+        """Why a component counts as down (None if it is healthy)"""
+        if c['alive'] is not None and not c['alive']():
+            return "thread died"
+        busy_since = c['busy_since']
+        if busy_since is not None and now - busy_since > c['slo']:
+            return f"call running for {now - busy_since:.1f}s (SLO {c['slo']:g}s)"
+        if c['failures'] >= SUPERVISOR_MAX_FAILURES:
+            return f"{c['failures']} failures in a row ({c['last_error']})"
+        if c['heartbeat'] and now - c['last_beat'] > c['slo']:
+            return f"no heartbeat for {now - c['last_beat']:.1f}s (SLO {c['slo']:g}s)"
+        return None
+
+    def check(self):
+        """Find failed components and start their restarts"""
+        now = time.time()
+        for name, c in list(self.components.items()):
+            if c['restarting']:
+                continue
+            reason = self._fault(c, now)
+            if reason is None:
+                # Components without heartbeats are back once a restart leaves them healthy
+                if c['down_since'] is not None and not c['heartbeat'] and c['attempts']:
+                    self._recovered(name, c)
+                continue
+            if c['down_since'] is None:
+                # Down since the call that hangs, else since the last sign of progress
+                c['down_since'] = c['busy_since'] or (c['last_beat'] if c['heartbeat'] else now)
+                c['reason'] = reason
+                c['failing'] = c['failures'] >= SUPERVISOR_MAX_FAILURES
+                self._log(name, 'stalled', reason)
+                print(f"⚠ Supervisor: {name} {reason}")
+            if self.enabled and now >= c['next_restart']:
+                c['restarting'] = True
+                threading.Thread(target=self._restart, args=(name, c), name=f"restart-{name}",
+                                 daemon=True).start()
+
+    def _restart(self, name, c):
+        """Run one restart and schedule the next attempt in case it does not help"""
+        start = time.time()
+        c['attempts'] += 1
+        try:
+            c['restart']()
+            ok = True
+        except Exception as e:
+            ok = False
+            c['last_error'] = f"restart failed: {e}"
+        elapsed = time.time() - start
+        c['restarts'] += 1
+        c['failed_restarts'] += 0 if ok else 1
+        c['last_restart'] = datetime.now().isoformat(timespec='seconds')
+        # The old thread or call is abandoned: judge the component afresh
+        c['busy_since'] = None
+        c['failures'] = 0
+        c['last_beat'] = time.time()
+        pause = min(SUPERVISOR_BACKOFF_MAX, SUPERVISOR_BACKOFF_MIN * 2 ** (c['attempts'] - 1))
+        c['next_restart'] = time.time() + c['slo'] + pause
+        self._log(name, 'restarted' if ok else 'restart_failed',
+                  f"{elapsed * 1000:.0f} ms" if ok else c['last_error'])
+        if ok:
+            print(f"🔄 Supervisor: restarted {name} ({elapsed * 1000:.0f} ms)")
+        else:
+            print(f"❌ Supervisor: {name} {c['last_error']} (next attempt in "
+                  f"{c['slo'] + pause:.0f}s)")
+        c['restarting'] = False
+
+    def _recovered(self, name, c):
+        """First good report after a stall: book the downtime"""
+        with self.lock:
+            if c['down_since'] is None:
+                return
+            downtime = max(0.0, time.time() - c['down_since'])
+            c['downtime_s'] += downtime
+            c['down_since'] = None
+            c['failing'] = False
+            c['attempts'] = 0
+            c['next_restart'] = 0.0
+        self._log(name, 'recovered', f"down {downtime:.1f}s")
+        print(f"✓ Supervisor: {name} recovered (down {downtime:.1f}s)")
+
+    def _log(self, name, event, detail):
+        self.history.append({'time': datetime.now().isoformat(timespec='seconds'),
+                             'component': name, 'event': event, 'detail': detail})
+
+    def down(self):
+        """Names of the components currently down"""
+        return [name for name, c in self.components.items() if c['down_since'] is not None]
+
+    def get_stats(self, history=False):
+        """Health, restart counts and downtime per component (plus recent events)"""
+        now = time.time()
+        components = {}
+        for name, c in list(self.components.items()):
+            down_for = now - c['down_since'] if c['down_since'] is not None else 0.0
+            components[name] = {
+                'stage': c['stage'],
+                'status': ('restarting' if c['restarting']
+                           else 'down' if c['down_since'] is not None else 'ok'),
+                'slo_s': c['slo'],
+                'heartbeat_age_s': round(now - c['last_beat'], 1) if c['heartbeat'] else None,
+                'restarts': c['restarts'],
+                'failed_restarts': c['failed_restarts'],
+                'downtime_s': round(c['downtime_s'] + down_for, 1),
+                'down_for_s': round(down_for, 1),
+                'reason': c['reason'] if c['down_since'] is not None else None,
+                'last_restart': c['last_restart'],
+                'last_error': c['last_error']
+            }
+        stats = {
+            'enabled': self.enabled,
+            'healthy': all(c['status'] == 'ok' for c in components.values()),
+            'restarts': sum(c['restarts'] for c in components.values()),
+            'downtime_s': round(sum(c['downtime_s'] for c in components.values()), 1),
+            'components': components
+        }
+        if history:
+            stats['history'] = list(self.history)
+        return stats
+
+class LatencyTracker:
+    """Rolling end-to-end latency percentiles, from the FrameStamp of each frame
+
+      capture_to_decision   frame out of the camera -> fused detection decision
+      decision_to_alert     decision -> buzzer and LEDs on
+      decision_to_disk      decision -> violation image and metadata written
+      capture_to_delivered  frame out of the camera -> MJPEG part handed to a viewer
+
+    The last `window` samples of each are kept. Percentiles are recomputed at
+    most once a second, so every stream part can carry them.
+    """
+
+    METRICS = ('capture_to_decision', 'decision_to_alert', 'decision_to_disk',
+               'capture_to_delivered')
+
+    def __init__(self, window=LATENCY_WINDOW):
+        """Empty sample windows"""
+        self.samples = {metric: deque(maxlen=window) for metric in self.METRICS}
+        self.counts = dict.fromkeys(self.METRICS, 0)
+        self.cached = (0.0, None)
+
+    def add(self, metric, start, end=None):
+        """Record end - start (monotonic seconds, end defaults to now); returns ms"""
+        ms = ((time.monotonic() if end is None else end) - start) * 1000
+        self.samples[metric].append(ms)
+        self.counts[metric] += 1
+        return ms
+
+    def get_stats(self):
+        """p50/p95/p99/max in ms per metric over the window"""
+        now = time.monotonic()
+        cached_at, stats = self.cached
+        if stats is not None and now - cached_at < 1.0:
+            return stats
+        stats = {}
+        for metric in self.METRICS:
+            values = np.array(list(self.samples[metric]))
+            stats[metric] = {'count': self.counts[metric]}
+            if values.size:
+                p50, p95, p99 = np.percentile(values, (50, 95, 99))
+                stats[metric].update(p50_ms=round(p50, 1), p95_ms=round(p95, 1),
+                                     p99_ms=round(p99, 1), max_ms=round(values.max(), 1))
+        self.cached = (now, stats)
+        return stats
+
+# What to draw on a frame: text lines as (text, BGR colour, OverlayRenderer style)
+# from the top-left corner down, and [x, y, w, h] boxes in detection-frame pixels
+Annotation = namedtuple('Annotation', 'lines boxes box_color')
+
+class OverlayRenderer:
+    """Draws stream and evidence annotations, caching their text
+
+    The text lines of an annotation are rendered into a small colour patch
+    and a mask, cached by their content and scale. While the text stays the
+    same (status, counters), drawing it is one masked cv2.copyTo into the
+    frame instead of a putText call per line. Text is only cached the second
+    time it is seen, so one-off text (an evidence timestamp) costs no more
+    than drawing it directly. Boxes go on in the same pass.
+    """
+
+    STYLES = {  # Font scale, thickness, baseline distance from the line above (px at scale 1)
+        'title': (0.6, 2, 25),
+        'status': (0.5, 2, 25),
+        'normal': (0.5, 1, 22),
+        'small': (0.4, 1, 19),
+    }
+    FONT = cv2.FONT_HERSHEY_SIMPLEX
+    MARGIN = 10  # Left edge of the text
+
+    def __init__(self, max_layers=32):
+        """Empty layer cache"""
+        self.max_layers = max_layers
+        self.layers = OrderedDict()  # (lines, scale) -> (patch, mask)
+        self.seen = OrderedDict()    # Text seen once, cached when it comes back
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.draws = 0
+        self.draw_s = 0.0
+
+    def _placed(self, lines, scale):
+        """(text, colour, font scale, thickness, baseline y) per line"""
+        y = 0
+        for text, color, style in lines:
+            font_scale, thickness, advance = self.STYLES[style]
+            y += int(advance * scale)
+            yield text, color, font_scale * scale, max(1, int(thickness * scale)), y
+
+    def _layer(self, lines, scale):
+        """Cached (patch, mask) for a block of text lines; None the first time it is seen"""
+        key = (lines, round(scale, 3))
+        with self.lock:
+            layer = self.layers.get(key)
+            if layer is not None:
+                self.layers.move_to_end(key)
+                self.hits += 1
+                return layer
+            self.misses += 1
+            if key not in self.seen:
+                self.seen[key] = True
+                while len(self.seen) > self.max_layers:
+                    self.seen.popitem(last=False)
+                return None
+            del self.seen[key]
+        layer = self._render(lines, scale)
+        with self.lock:
+            self.layers[key] = layer
+            while len(self.layers) > self.max_layers:
+                self.layers.popitem(last=False)
+        return layer
+
+    def _render(self, lines, scale):
+        """Render text lines onto a black patch; the mask marks the text pixels"""
+        placed = list(self._placed(lines, scale))
+        width = descent = 0
+        for text, color, font_scale, thickness, y in placed:
+            (w, h), baseline = cv2.getTextSize(text, self.FONT, font_scale, thickness)
+            width = max(width, w + thickness)
+            descent = max(descent, baseline + thickness)
+        patch = np.zeros((placed[-1][4] + descent, max(1, width), 3), np.uint8)
+        mask = np.zeros(patch.shape[:2], np.uint8)
+        for text, color, font_scale, thickness, y in placed:
+            cv2.putText(patch, text, (0, y), self.FONT, font_scale, color, thickness)
+            cv2.putText(mask, text, (0, y), self.FONT, font_scale, 255, thickness)
+        return patch, mask
+
+    def draw(self, frame, annotation, scale=1.0, box_scale=None):
+        """Draw an annotation onto frame in place
+
+        scale sizes the text and lines; box_scale maps detection-frame boxes
+        onto this frame (defaults to scale).
+        """
+        start = time.time()
+        box_scale = scale if box_scale is None else box_scale
+        if annotation.lines:
+            layer = self._layer(annotation.lines, scale)
+            if layer is None:
+                for text, color, font_scale, thickness, y in self._placed(annotation.lines, scale):
+                    cv2.putText(frame, text, (self.MARGIN, y), self.FONT, font_scale, color,
+                                thickness)
+            else:
+                patch, mask = layer
+                h = min(patch.shape[0], frame.shape[0])
+                w = min(patch.shape[1], frame.shape[1] - self.MARGIN)
+                if h > 0 and w > 0:
+                    cv2.copyTo(patch[:h, :w], mask[:h, :w], frame[:h, self.MARGIN:self.MARGIN + w])
+        thickness = max(1, int(2 * scale))
+        for box in annotation.boxes:
+            x, y, w, h = (int(v * box_scale) for v in box)
+            cv2.rectangle(frame, (x, y), (x+w, y+h), annotation.box_color, thickness)
+        self.draws += 1
+        self.draw_s += time.time() - start
+
+    def get_stats(self):
+        """Layer cache hits/misses and drawing time"""
+        with self.lock:
+            return {
+                'layers': len(self.layers),
+                'hits': self.hits,
+                'misses': self.misses,
+                'avg_draw_ms': round(self.draw_s / max(1, self.draws) * 1000, 3)
+            }
+
+class CameraPipeline:
+    """One camera: capture loop, stream frame, stats and violation folder"""
+
+    def __init__(self, system, name, source=0, weight=1.0, size=None):
+        """Open the camera source"""
+        self.system = system
+        self.name = name
+        self.source_id = source
+        self.weight = max(float(weight), 0.01)
+        self.save_dir = os.path.join(system.save_dir, name)
+        os.makedirs(self.save_dir, exist_ok=True)
+
+        print(f"📷 Initializing camera '{name}' ({source})...")
+        self.fixed_size = size is not None  # Own size in CAMERAS, not the configured resolution
+        self.base_size = tuple(size or system.config['resolution'])
+        self.size = self.target_size()
+        self.pending_size = None
+        self.copy_stats = FrameCopyStats()
+        self.source = open_frame_source(source, self.size, self.copy_stats)
+        self.source_lock = threading.Lock()  # Serialises replacing self.source
+        self.evidence_buffer = None
+        self.keep_main = False  # Keep main-stream frames with the coming detection frames
+        self.fusion = TemporalFusion()
+        self.capture_thread = None
+        self.capture_generation = 0  # Bumped to retire a capture thread
+        print(f"✓ Camera '{name}' ready")
+
+        self.frame_skip = system.config['frame_skip']
+        self.frame_count = 0
+        self.last_alert_time = 0
+        self.detecting = False
+
+        # For web streaming
+        self.current_frame = None
+        self.current_stamp = None
+        self.stream_jpeg = None  # (seq, JPEG) of the last encoded stream frame
+        self.encoding = None     # Stream frame a viewer is encoding outside the lock
+        self.lock = threading.Lock()
+        self.frame_ready = threading.Condition(self.lock)  # Wakes viewers waiting for a new frame
+        self.detection_status = "Monitoring..."
+        self.total_violations = 0
+        self.detection_counts = {
+            'sensor': 0,
+            'motion': 0,
+            'visual': 0,
+            'combined': 0
+        }
+
+    def start_capture(self):
+        """Start a capture thread (one started before it exits at its next frame)"""
+        self.capture_generation += 1
+        self.capture_thread = threading.Thread(target=self.run_capture,
+                                               args=(self.capture_generation,),
+                                               name=f"capture-{self.name}", daemon=True)
+        self.capture_thread.start()
+
+    def restart_capture(self):
+        """Reconnect the camera and start a fresh capture thread (supervisor restart)
+
+        The old thread is retired first and given CAPTURE_STOP_TIMEOUT to leave
+        read(); one still stuck after that is on a hung camera, which only
+        stopping the source frees. It reads from its own reference to the old
+        source and exits without touching the new one.
+        """
+        old = self.capture_thread
+        with self.source_lock:
+            self.capture_generation += 1
+        if old is not None and old is not threading.current_thread():
+            old.join(CAPTURE_STOP_TIMEOUT)
+        with self.source_lock:
+            print(f"📷 Reconnecting camera '{self.name}'...")
+            try:
+                self.source.stop()
+            except:
+                pass
+            self.source = open_frame_source(self.source_id, self.size, self.copy_stats)
+            self.start_capture()
+
+    def run_capture(self, generation):
+        """Capture loop: hands every frame_skip-th frame to the shared detection pool
+
+        Heartbeats only follow delivered frames, so a camera that stops
+        delivering is reconnected by the supervisor.
+        """
+        beat = self.system.supervisor.beat
+        try:
+            while self.system.running:
+                with self.source_lock:
+                    if generation != self.capture_generation:
+                        return
+                    if self.pending_size:
+                        self._reopen_source()
+                    source = self.source
+                # Main-stream frames are only kept for frames that will be detected on
+                frame = source.read((STREAM_FULL_RES or self.keep_main)
+                                    and (self.frame_count + 1) % self.frame_skip == 0)
+                if frame is None:
+                    time.sleep(1)
+                    continue
+                if generation != self.capture_generation:
+                    source.pool.release(frame)
+                    return  # Replaced while waiting for this frame
+                beat(f"capture:{self.name}")
+
+                self.frame_count += 1
+                stamp = FrameStamp(self.frame_count, time.monotonic())
+                if self.frame_count % self.frame_skip != 0:
+                    self.release_frame(frame)
+                    time.sleep(SKIP_INTERVAL)
+                    continue
+
+                self.system.pool.submit(self, frame, stamp)
+                time.sleep(CAPTURE_INTERVAL)
+
+        except Exception as e:
+            print(f"❌ Camera '{self.name}' error: {e}")
+            import traceback
+            traceback.print_exc()
+
+    def process_frame(self, frame, stamp):
+        """Detect, alert, annotate and publish one frame (runs on a pool worker)
+
+        The captured array itself becomes the stream frame: evidence is saved
+        from it before the overlay is drawn in place, then it is swapped in as
+        current_frame (with its FrameStamp) and the previous stream frame goes
+        back to the pool, or to the viewer still encoding it.
+        """
+        system = self.system
+        evidence = None
+        try:
+            # Run all detections (expensive ones are skipped while the evidence is conclusive)
+            skip = system.governor.plan_skip(self.name, self.fusion.plan())
+            _, results = system.engine.detect_all(frame, camera=self.name, skip=skip)
+
+            # Fuse with recent frames: a violation needs persistent evidence
+            confidence = self.fusion.update(results['scores'], results['skipped'])
+            active = self.fusion.active()
+            results['sensor'] = results['sensor'] or 'sensor' in active
+            results['motion'] = results['motion'] or bool(active & {'person', 'motion'})
+            results['visual'] = results['visual'] or 'visual' in active
+            results['confidence'] = confidence
+            detected = confidence >= system.confidence_threshold
+            decided = time.monotonic()
+            system.latency.add('capture_to_decision', stamp.captured, decided)
+            if system.engine.copies_per_frame:
+                self.copy_stats.add('shared_memory', frame.nbytes * system.engine.copies_per_frame,
+                                    system.engine.copies_per_frame)
+            current_time = time.time()
+            self.detecting = detected
+            # Keep the main-stream frames of the coming frames while a violation builds up
+            self.keep_main = (confidence >= system.confidence_threshold * EVIDENCE_ARM_RATIO
+                              and current_time - self.last_alert_time > system.alert_cooldown)
+            if STREAM_FULL_RES:
+                evidence = self.source.read_evidence(frame)
+
+            # Overlay shows the state from before this frame was handled
+            status_text = self.detection_status
+            violations = self.total_violations
+
+            # Handle detection
+            alerted = False
+            if detected:
+                detection_types = []
+                if results['sensor']:
+                    detection_types.append("SENSOR")
+                if results['motion']:
+                    detection_types.append("MOTION")
+                if results['visual']:
+                    detection_types.append("CIGARETTE")
+
+                self.detection_status = f"⚠️ DETECTED: {'+'.join(detection_types)}"
+
+                # Update OLED with violation
+                system.oled.show_violation('+'.join(detection_types))
+
+                if current_time - self.last_alert_time > system.alert_cooldown:
+                    alerted = True
+                    system.alerts.trigger_alert()  # Buzzer first, then the disk
+                    system.latency.add('decision_to_alert', decided)
+                    self.save_violation(frame, results, evidence, decided=decided)
+                    self.last_alert_time = current_time
+                    print(f"🚨 ALERT [{self.name}]: {'+'.join(detection_types)}")
+                    # Show alert count on OLED briefly
+                    threading.Thread(target=system._show_alert_briefly, daemon=True).start()
+            else:
+                self.detection_status = "Monitoring..."
+
+                # LEDs and OLED are shared, so only go back to normal when no camera sees anything
+                if not system.any_detecting():
+                    system.alerts.set_normal()
+
+                    # Update OLED monitoring status every 5 seconds
+                    if current_time - system.last_oled_update > 5:
+                        sensor_status = system.sensor.get_status() if system.sensor else ""
+                        system.oled.show_monitoring(sensor_status, system.total_violations,
+                                                    system.ip_address)
+                        system.last_oled_update = current_time
+
+            system.event_log.record(self.name, detected, results, alert=alerted)
+
+            # Draw the stream overlay straight onto the captured frame, or onto its
+            # main-stream frame when the stream is full resolution
+            stream_frame = evidence[0] if evidence is not None else frame
+            scale = stream_frame.shape[1] / frame.shape[1]
+            system.overlay.draw(stream_frame,
+                                self._stream_annotation(status_text, detected, results, violations),
+                                scale)
+        except Exception:
+            self.release_frame(frame)
+            if evidence is not None:
+                self.release_frame(evidence[0])
+            raise
+
+        if stream_frame is not frame:
+            self.release_frame(frame)  # Detection frame is done with
+        # Publish for streaming by swapping buffers (no copy under the lock)
+        with self.lock:
+            previous, self.current_frame = self.current_frame, stream_frame
+            self.current_stamp = stamp
+            if previous is self.encoding:
+                previous = None  # get_frame releases it when the encode is done
+            self.frame_ready.notify_all()
+        self.release_frame(previous)
+        self.copy_stats.frame_done()
+
+    def release_frame(self, frame):
+        """Return a frame array to the source's buffer pool"""
+        self.source.pool.release(frame)
+
+    def target_size(self):
+        """Capture size: the configured size, scaled down by the memory governor"""
+        scale = self.system.governor.resolution_scale()
+        if scale >= 1.0:
+            return self.base_size
+        # Keep multiples of 16 (camera/ISP and JPEG friendly)
+        return tuple(max(16, int(d * scale) // 16 * 16) for d in self.base_size)
+
+    def reconfigure(self, size):
+        """Ask the capture loop to reopen the camera at a new resolution"""
+        if tuple(size) != (self.pending_size or self.size):
+            self.pending_size = tuple(size)
+            if not self.system.running:
+                with self.source_lock:
+                    self._reopen_source()
+
+    def _reopen_source(self):
+        """Reopen the camera at pending_size (capture thread, holding source_lock);
+        frames from the old source's pool are simply not taken back by the new one"""
+        size = self.pending_size
+        print(f"📷 Reconfiguring camera '{self.name}' to {size[0]}x{size[1]}...")
+        try:
+            self.source.stop()
+        except:
+            pass
+        try:
+            self.source = open_frame_source(self.source_id, size, self.copy_stats)
+            self.size = size
+            print(f"✓ Camera '{self.name}' ready")
+        except Exception as e:
+            print(f"❌ Camera '{self.name}' reconfiguration failed: {e}")
+            self.source = open_frame_source(self.source_id, self.size, self.copy_stats)
+        finally:
+            # A newer request that arrived while the camera was opening stays pending
+            if self.pending_size == size:
+                self.pending_size = None
+
+    def _evidence_frame(self, shape):
+        """Reusable array for drawing evidence annotations"""
+        if self.evidence_buffer is None or self.evidence_buffer.shape != shape:
+            self.evidence_buffer = np.empty(shape, np.uint8)
+        return self.evidence_buffer
+
+    def save_violation(self, frame, results, evidence=None, decided=None):
+        """Save violation image into this camera's folder
+
+        A frame that repeats a recent violation of this camera is only counted
+        on that image's metadata. Otherwise evidence ((main-stream frame,
+        offset) from read_evidence(), read here when not given) is saved, or
+        the detection frame on a single-stream camera, with the boxes found on
+        the detection frame scaled onto it. The sidecar records the evidence
+        frame's offset from the detection frame. decided is the monotonic time
+        of the detection decision, for the latency stats.
+        """
         timestamp = datetime.now()
         filename = timestamp.strftime("%Y%m%d_%H%M%S") + ".jpg"
         filepath = os.path.join(self.save_dir, filename)
 
-        # Resize if needed
-        height, width = frame.shape[:2]
-        if width > 640:
-            scale = 640 / width
-            frame = cv2.resize(frame, (640, int(height * scale)))
-
-        annotated_frame = frame.copy()
-
-        # Draw boxes
-        for box in results.get('boxes', []):
-            x, y, w, h = box
-            if width > 640:
-                scale = 640 / width
-                x, y, w, h = int(x*scale), int(y*scale), int(w*scale), int(h*scale)
-            cv2.rectangle(annotated_frame, (x, y), (x+w, y+h), (0, 0, 255), 2)
-
-        # Add detection info
-        y_offset = 25
-        cv2.putText(annotated_frame, "VIOLATION DETECTED", (10, y_offset),
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
-        y_offset += 25
+        phash = None
+        duplicates = self.system.duplicates
+        if duplicates.enabled:
+            original, distance, phash = duplicates.match(self.name, frame)
+            if original is not None:
+                repeated = self._add_occurrence(original, distance, timestamp, results, decided)
+                if repeated is not None:
+                    return repeated
+
+        # Resize if needed (straight into the reusable evidence buffer)
+        read = None
+        if evidence is None:
+            evidence = read = self.source.read_evidence(frame)
+        source = evidence[0] if evidence is not None else frame
+        height, width = source.shape[:2]
+        box_scale = width / frame.shape[1]
+        if width > EVIDENCE_MAX_WIDTH:
+            scale = EVIDENCE_MAX_WIDTH / width
+            new_height = int(height * scale)
+            annotated_frame = self._evidence_frame((new_height, EVIDENCE_MAX_WIDTH, 3))
+            cv2.resize(source, (EVIDENCE_MAX_WIDTH, new_height), dst=annotated_frame)
+            box_scale *= scale
+        else:
+            annotated_frame = self._evidence_frame(source.shape)
+            np.copyto(annotated_frame, source)
+        if read is not None:
+            self.release_frame(read[0])
+        self.copy_stats.add('evidence', annotated_frame.nbytes)
+        text_scale = max(1.0, annotated_frame.shape[1] / 640)  # Readable on large images
+        metadata = self._violation_metadata(timestamp, results)
+        if evidence is not None:
+            metadata['evidence_offset'] = evidence[1]  # Frames between detection and evidence
+        self.system.overlay.draw(annotated_frame, self._evidence_annotation(metadata),
+                                 text_scale, box_scale)
 
+        # Save
+        data = self.system.jpeg.encode(annotated_frame, self.system.image_quality)
+        with open(filepath, 'wb') as f:
+            f.write(data)
+
+        file_size = len(data) / 1024
+        print(f"✓ Violation saved: {self.name}/{filename} ({file_size:.1f} KB)")
+        thumbnail = self.system.thumbnails.create(f"{self.name}/{filename}", annotated_frame)
+
+        # Metadata sidecar for exports (removed together with the image)
+        if phash is not None:
+            metadata['phash'] = phash.tobytes().hex()
+        with open(filepath[:-4] + '.json', 'w') as f:
+            json.dump(metadata, f)
+        if decided is not None:
+            self.system.latency.add('decision_to_disk', decided)
+        if phash is not None:
+            duplicates.add(self.name, f"{self.name}/{filename}", phash)
+        self.system.forwarder.put(dict(metadata, image=f"{self.name}/{filename}"), thumbnail[0])
+
+        self._count_violation(results)
+        self.system.cleanup_old_files()
+        return filepath
+
+    def _stream_annotation(self, status_text, detected, results, violations):
+        """Stream overlay: status, sensor and violation count, detection boxes"""
+        lines = [(status_text, (0, 0, 255) if detected else (0, 255, 0), 'status')]
+        if self.system.sensor:
+            lines.append((f"Sensor: {self.system.sensor.get_status()}",
+                          (0, 0, 255) if results['sensor'] else (0, 255, 0), 'small'))
+        lines.append((f"Violations: {violations}", (255, 255, 255), 'small'))
+        return Annotation(tuple(lines), results.get('boxes', []), (0, 0, 255))
+
+    def _evidence_annotation(self, metadata):
+        """Evidence overlay, from the same boxes plus the violation metadata"""
+        red = (0, 0, 255)
+        timestamp = datetime.fromisoformat(metadata['timestamp'])
+        lines = (("VIOLATION DETECTED", red, 'title'),
+                 (f"{self.name} | Type: {'+'.join(metadata['detection_types'])}", red, 'normal'),
+                 (timestamp.strftime("%Y-%m-%d %H:%M:%S"), red, 'normal'))
+        return Annotation(lines, metadata['boxes'], red)
+
+    def _violation_metadata(self, timestamp, results):
+        """Metadata of one violation (sidecar and forwarded event)"""
         detection_types = []
         if results['sensor']:
             detection_types.append("SENSOR")
@@ -700,22 +3995,48 @@ class SmokingDetectionSystem:
             detection_types.append("MOTION")
         if results['visual']:
             detection_types.append("CIGARETTE")
+        return {
+            'camera': self.name,
+            'timestamp': timestamp.isoformat(timespec='seconds'),
+            'detection_types': detection_types,
+            'sensor': bool(results['sensor']),
+            'motion': bool(results['motion']),
+            'visual': bool(results['visual']),
+            'confidence': round(float(results.get('confidence', 0.0)), 3),
+            'boxes': [[int(v) for v in box] for box in results.get('boxes', [])]
+        }
 
-        cv2.putText(annotated_frame, f"Type: {'+'.join(detection_types)}",
-                   (10, y_offset), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
-        y_offset += 20
-
-        cv2.putText(annotated_frame, timestamp.strftime("%Y-%m-%d %H:%M:%S"),
-                   (10, y_offset), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
-
-        # Save
-        cv2.imwrite(filepath, annotated_frame,
-                   [cv2.IMWRITE_JPEG_QUALITY, self.image_quality])
+    def _add_occurrence(self, relname, distance, timestamp, results, decided=None):
+        """Count a repeated violation on the image it repeats (None if that image is gone)
 
-        file_size = os.path.getsize(filepath) / 1024
-        print(f"✓ Violation saved: {filename} ({file_size:.1f} KB)")
+        Only the small metadata sidecar is rewritten, no JPEG or thumbnail.
+        """
+        filepath = os.path.join(self.system.save_dir, *relname.split('/'))
+        sidecar = filepath[:-4] + '.json'
+        if not os.path.isfile(filepath):
+            return None
+        try:
+            with open(sidecar) as f:
+                metadata = json.load(f)
+        except (OSError, ValueError):
+            metadata = {'camera': self.name}  # Saved before metadata sidecars existed
+        event = self._violation_metadata(timestamp, results)
+        metadata['occurrences'] = metadata.get('occurrences', 1) + 1
+        metadata['last_seen'] = event['timestamp']
+        metadata['max_confidence'] = max(metadata.get('max_confidence', 0.0),
+                                         metadata.get('confidence', 0.0), event['confidence'])
+        write_json_atomic(sidecar, metadata)
+        if decided is not None:
+            self.system.latency.add('decision_to_disk', decided)
+        self.system.forwarder.put(dict(event, image=relname,
+                                       occurrences=metadata['occurrences']))
+
+        print(f"✓ Violation repeats {relname} (occurrence {metadata['occurrences']}, "
+              f"hash distance {distance})")
+        self._count_violation(results)
+        return filepath
 
-        # Update counters
+    def _count_violation(self, results):
         self.total_violations += 1
         if results['sensor'] and (results['motion'] or results['visual']):
             self.detection_counts['combined'] += 1
@@ -726,36 +4047,1076 @@ class SmokingDetectionSystem:
         elif results['motion']:
             self.detection_counts['motion'] += 1
 
+    def get_frame(self, since=None, timeout=0):
+        """(JPEG, FrameStamp) for streaming
+
+        With since (a FrameStamp seq) only a newer frame is returned, waiting
+        up to timeout seconds for it; None if there is none. Each frame is
+        encoded once, outside the lock, by the first viewer to ask for it;
+        the others wait for that JPEG.
+        """
+        with self.frame_ready:
+            self.frame_ready.wait_for(lambda: self.current_frame is not None and (
+                since is None or self.current_stamp.seq != since), timeout)
+            if self.current_frame is None or (since is not None and self.current_stamp.seq == since):
+                return None
+            while True:
+                stamp = self.current_stamp
+                if self.stream_jpeg is not None and self.stream_jpeg[0] == stamp.seq:
+                    return self.stream_jpeg[1], stamp
+                if self.encoding is None:
+                    break
+                self.frame_ready.wait()
+            frame = self.encoding = self.current_frame
+        jpeg = None
+        try:
+            jpeg = self.system.jpeg.encode(frame, STREAM_JPEG_QUALITY)
+        finally:
+            with self.frame_ready:
+                self.encoding = None
+                retired = frame if frame is not self.current_frame else None
+                if jpeg is not None:
+                    self.stream_jpeg = (stamp.seq, jpeg)
+                self.frame_ready.notify_all()
+            self.release_frame(retired)
+        return jpeg, stamp
+
+    def get_stats(self):
+        """Per-camera statistics"""
+        return {
+            'status': self.detection_status,
+            'stream_url': f"/video_feed/{self.name}",
+            'weight': self.weight,
+            'total_violations': self.total_violations,
+            'detection_counts': self.detection_counts,
+            'fusion': self.fusion.get_stats(),
+            'frame_copies': dict(self.copy_stats.get_stats(), pool_misses=self.source.pool.misses)
+        }
+
+    def stop(self):
+        """Stop the camera source"""
+        with self.source_lock:
+            try:
+                self.source.stop()
+            except:
+                pass
+
+def _tar_header(name, size, mtime):
+    """512-byte tar header for a regular file"""
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = int(mtime)
+    info.mode = 0o644
+    return info.tobuf()
+
+def _tar_member(name, data, mtime):
+    """Complete tar member (header, data, padding) for small in-memory content"""
+    return _tar_header(name, len(data), mtime) + data + bytes(-len(data) % 512)
+
+class ThumbnailCache:
+    """Small JPEG previews of violation images for the dashboard gallery
+
+    A thumbnail is written under <save_dir>/.thumbs/ when a violation is saved
+    (or on first request for older images) and the most recent ones are kept
+    in an in-memory LRU, so dashboard polling does not touch the SD card.
+    Retention cleanup removes a thumbnail together with its original.
+    """
+
+    def __init__(self, save_dir, width=THUMBNAIL_WIDTH, quality=70, memory_items=64,
+                 encoder=None):
+        """Set up the cache folder"""
+        self.save_dir = save_dir
+        self.thumb_dir = os.path.join(save_dir, THUMBNAIL_DIR)
+        self.width = width
+        self.quality = quality
+        self.encoder = encoder or OpenCvJpegEncoder()
+        self.memory_items = memory_items
+        self.memory = OrderedDict()  # relname -> (data, etag, mtime)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        os.makedirs(self.thumb_dir, exist_ok=True)
+
+    def _path(self, relname):
+        return os.path.join(self.thumb_dir, *relname.split('/'))
+
+    def _remember(self, relname, data, mtime):
+        entry = (data, hashlib.sha1(data).hexdigest()[:20], mtime)
+        with self.lock:
+            self.memory[relname] = entry
+            self.memory.move_to_end(relname)
+            while len(self.memory) > self.memory_items:
+                self.memory.popitem(last=False)
+        return entry
+
+    def create(self, relname, frame):
+        """Write the thumbnail for an image that is already in memory"""
+        height, width = frame.shape[:2]
+        thumb_height = max(1, int(height * self.width / width))
+        thumb = cv2.resize(frame, (self.width, thumb_height), interpolation=cv2.INTER_AREA)
+        data = self.encoder.encode(thumb, self.quality)
+        path = self._path(relname)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+        self.generated += 1
+        return self._remember(relname, data, os.path.getmtime(path))
+
+    def get(self, relname):
+        """(data, etag, mtime) for an image's thumbnail, or None if the image is gone"""
+        original = os.path.join(self.save_dir, *relname.split('/'))
+        if not os.path.isfile(original):
+            self.remove(relname)
+            return None
+
+        with self.lock:
+            entry = self.memory.get(relname)
+            if entry is not None:
+                self.memory.move_to_end(relname)
+                self.hits += 1
+                return entry
+        self.misses += 1
+
+        path = self._path(relname)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            return self._remember(relname, data, os.path.getmtime(path))
+        except OSError:
+            # Older image without a thumbnail: decode at reduced size and build it now
+            frame = cv2.imread(original, cv2.IMREAD_REDUCED_COLOR_2)
+            if frame is None:
+                return None
+            return self.create(relname, frame)
+
+    def remove(self, relname):
+        """Drop a thumbnail (called when its original is deleted)"""
+        with self.lock:
+            self.memory.pop(relname, None)
+        try:
+            os.remove(self._path(relname))
+        except OSError:
+            pass
+
+    def prune(self, relnames):
+        """Delete thumbnails whose original no longer exists"""
+        keep = set(relnames)
+        removed = 0
+        for root, dirs, names in os.walk(self.thumb_dir):
+            for f in names:
+                relname = os.path.relpath(os.path.join(root, f), self.thumb_dir).replace(os.sep, '/')
+                if relname not in keep:
+                    self.remove(relname)
+                    removed += 1
+        if removed:
+            print(f"🗑️  Removed {removed} orphaned thumbnails")
+
+    def get_stats(self):
+        """Cache statistics"""
+        with self.lock:
+            cached = len(self.memory)
+        return {
+            'memory_items': cached,
+            'hits': self.hits,
+            'misses': self.misses,
+            'generated': self.generated
+        }
+
+class DuplicateIndex:
+    """Recent violation images per camera, by perceptual hash
+
+    The hash is a dHash: the frame's grey image shrunk to (size + 1) x size,
+    one bit per horizontally adjacent pixel pair telling which is brighter.
+    It survives JPEG noise, small movements and exposure changes, and is
+    computed from the lores Y plane when the frame carries one. A camera's
+    hashes sit in one array, so a lookup is a single vectorised XOR and
+    popcount over all of them.
+    """
+
+    POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1)
+
+    def __init__(self, enabled=DEDUP_ENABLED, hash_size=DEDUP_HASH_SIZE,
+                 max_distance=DEDUP_MAX_DISTANCE, window=DEDUP_WINDOW, size=DEDUP_INDEX_SIZE):
+        """Empty index"""
+        self.enabled = enabled
+        self.hash_size = hash_size
+        self.max_distance = max_distance
+        self.window = window
+        self.size = size
+        self.cameras = {}  # camera -> (hashes [n, bytes] uint8, last_seen [n] float, [relname])
+        self.lock = threading.Lock()
+        self.stats = {'checked': 0, 'duplicates': 0, 'hash_ms': 0.0}
+
+    def hash(self, frame):
+        """Packed dHash of a BGR frame"""
+        grey = getattr(frame, 'luma', None)
+        if grey is None:
+            grey = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        small = cv2.resize(grey, (self.hash_size + 1, self.hash_size),
+                           interpolation=cv2.INTER_AREA)
+        return np.packbits(small[:, 1:] > small[:, :-1])
+
+    def match(self, camera, frame, now=None):
+        """(relname, distance, hash) of the recent image this frame repeats (relname None if new)"""
+        start = time.time()
+        phash = self.hash(frame)
+        now = now if now is not None else time.time()
+        relname, distance = None, None
+        with self.lock:
+            self.stats['checked'] += 1
+            self.stats['hash_ms'] += (time.time() - start) * 1000
+            entry = self.cameras.get(camera)
+            if entry is not None and self.enabled:
+                hashes, last_seen, names = entry
+                distances = self.POPCOUNT[hashes ^ phash].sum(axis=1)
+                distances[last_seen < now - self.window] = phash.size * 8 + 1
+                best = int(np.argmin(distances))
+                if distances[best] <= self.max_distance:
+                    relname, distance = names[best], int(distances[best])
+                    last_seen[best] = now
+                    self.stats['duplicates'] += 1
+        return relname, distance, phash
+
+    def add(self, camera, relname, phash, now=None):
+        """Remember a newly saved image (the oldest one drops out beyond size)"""
+        now = now if now is not None else time.time()
+        with self.lock:
+            hashes, last_seen, names = self.cameras.get(
+                camera, (np.empty((0, phash.size), np.uint8), np.empty(0), []))
+            self.cameras[camera] = (np.vstack([hashes, phash])[-self.size:],
+                                    np.append(last_seen, now)[-self.size:],
+                                    (names + [relname])[-self.size:])
+
+    def load(self, files):
+        """Index the newest size images per camera from their sidecars' hashes
+
+        files are (relative name, path, mtime, size) tuples. A sidecar's mtime
+        is when it was last written, i.e. the image's last occurrence, so it is
+        used as last_seen. Sidecars without a hash of this size are skipped.
+        """
+        nbytes = self.hash_size * self.hash_size // 8
+        sidecars = {}
+        for relname, filepath, _, _ in files:
+            sidecar = filepath[:-4] + '.json'
+            try:
+                mtime = os.path.getmtime(sidecar)
+            except OSError:
+                continue
+            sidecars.setdefault(relname.split('/')[0], []).append((mtime, relname, sidecar))
+        cameras = {}
+        for camera, entries in sidecars.items():
+            hashes, last_seen, names = [], [], []
+            for mtime, relname, sidecar in sorted(entries, reverse=True):
+                if len(names) >= self.size:
+                    break
+                try:
+                    with open(sidecar) as f:
+                        phash = bytes.fromhex(json.load(f)['phash'])
+                except (OSError, ValueError, KeyError, TypeError, AttributeError):
+                    continue
+                if len(phash) == nbytes:
+                    hashes.append(np.frombuffer(phash, np.uint8))
+                    last_seen.append(mtime)
+                    names.append(relname)
+            if names:
+                # Oldest first, as add() keeps them
+                cameras[camera] = (np.array(hashes[::-1]), np.array(last_seen[::-1]), names[::-1])
+        with self.lock:
+            self.cameras.update(cameras)
+        return sum(len(e[2]) for e in cameras.values())
+
+    def remove(self, relname):
+        """Forget an image deleted by retention"""
+        camera = relname.split('/')[0]
+        with self.lock:
+            entry = self.cameras.get(camera)
+            if entry is None or relname not in entry[2]:
+                return
+            keep = [i for i, name in enumerate(entry[2]) if name != relname]
+            self.cameras[camera] = (entry[0][keep], entry[1][keep], [entry[2][i] for i in keep])
+
+    def get_stats(self):
+        """Lookups, duplicates found and hashing cost"""
+        with self.lock:
+            checked = self.stats['checked']
+            return {
+                'enabled': self.enabled,
+                'indexed': sum(len(e[2]) for e in self.cameras.values()),
+                'checked': checked,
+                'duplicates': self.stats['duplicates'],
+                'avg_hash_ms': round(self.stats['hash_ms'] / max(1, checked), 3)
+            }
+
+class EventLog:
+    """Compact append-only detection log with incrementally maintained aggregates
+
+    Events are stored per day (events/YYYYMMDD/) as one binary file per column,
+    so a query only reads the columns it needs and old days are deleted as a
+    whole directory. Rows are buffered in memory and appended in one batch
+    every EVENT_LOG_FLUSH_INTERVAL seconds, and repeated identical outcomes
+    from a camera are thinned to one row per EVENT_LOG_MIN_INTERVAL, which
+    keeps SD card writes to a few KB per minute even under constant detections.
+
+    Hourly counts per camera are updated on every event (including thinned
+    ones) and saved next to the columns, so per-hour and per-day questions are
+    answered from memory without reading the event columns.
+    """
+
+    COLUMNS = (
+        ('t_ms', '<u4'),        # Milliseconds since the partition's midnight
+        ('camera', 'u1'),       # Index into cameras.json
+        ('flags', 'u1'),        # FLAG_* bits
+        ('sensor', 'u1'),       # Scores quantised to 0-255
+        ('person', 'u1'),
+        ('motion', 'u1'),
+        ('visual', 'u1'),
+        ('confidence', 'u1'),
+        ('box_count', 'u1'),
+    )
+    FLAG_SENSOR = 1
+    FLAG_MOTION = 2
+    FLAG_VISUAL = 4
+    FLAG_DETECTED = 8
+    FLAG_ALERT = 16
+    MAX_BOXES = 16
+
+    # Hourly aggregate counters, in array column order
+    COUNTERS = ('events', 'alerts', 'sensor', 'motion', 'visual')
+
+    def __init__(self, directory=EVENT_LOG_DIR, threshold=EVENT_LOG_THRESHOLD,
+                 min_interval=EVENT_LOG_MIN_INTERVAL, flush_interval=EVENT_LOG_FLUSH_INTERVAL,
+                 retention_days=EVENT_LOG_RETENTION_DAYS, supervisor=None):
+        """Load camera names and aggregates, start the flush thread"""
+        self.directory = directory
+        self.supervisor = supervisor or Supervisor(enabled=False)
+        self.threshold = threshold
+        self.min_interval = min_interval
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()  # One flush at a time keeps the columns' rows aligned
+        self.buffer = []          # (day, row tuple, boxes)
+        self.last_logged = {}     # camera -> (time, flags)
+        self.hourly = {}          # day -> camera -> int64 array [24, len(COUNTERS)]
+        self.dirty_days = set()
+        self.stats = {'rows_written': 0, 'bytes_written': 0, 'flushes': 0, 'thinned': 0}
+        os.makedirs(directory, exist_ok=True)
+
+        self.cameras_path = os.path.join(directory, 'cameras.json')
+        try:
+            with open(self.cameras_path) as f:
+                self.cameras = json.load(f)
+        except (OSError, ValueError):
+            self.cameras = []
+        self._load_aggregates()
+        self._repair_columns()
+
+        self.running = True
+        self.flush_thread = None
+        self.flush_generation = 0
+        self.start_flush()
+
+    def start_flush(self):
+        """Start the flush thread (also the supervisor restart; an old one exits when it wakes)"""
+        self.flush_generation += 1
+        self.flush_thread = threading.Thread(target=self._flush_loop,
+                                             args=(self.flush_generation,),
+                                             name="event-log-flush", daemon=True)
+        self.flush_thread.start()
+
+    def _load_aggregates(self):
+        for day in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, day, 'hourly.json')
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            self.hourly[day] = {cam: np.array(rows, dtype=np.int64) for cam, rows in data.items()}
+
+    def _repair_columns(self):
+        """Cut every column of a day to its shortest one
+
+        A crash between column appends leaves some columns a few rows longer;
+        appending after them would shift every later row in those columns.
+        """
+        for day in os.listdir(self.directory):
+            part = os.path.join(self.directory, day)
+            if not os.path.isdir(part):
+                continue
+            try:
+                sizes = {name: os.path.getsize(os.path.join(part, name + '.col'))
+                         for name, _ in self.COLUMNS}
+            except OSError:
+                continue
+            itemsizes = {name: np.dtype(dtype).itemsize for name, dtype in self.COLUMNS}
+            rows = min(sizes[name] // itemsizes[name] for name in sizes)
+            box_count = np.fromfile(os.path.join(part, 'box_count.col'), dtype='u1', count=rows)
+            box_bytes = int(box_count.sum(dtype=np.int64)) * 8
+            targets = dict({name: rows * itemsizes[name] for name in sizes}, boxes=box_bytes)
+            repaired = False
+            for name, size in targets.items():
+                path = os.path.join(part, name + '.col')
+                if os.path.exists(path) and os.path.getsize(path) > size:
+                    os.truncate(path, size)
+                    repaired = True
+            if repaired:
+                print(f"⚠ Event log {day}: torn append repaired ({rows} rows kept)")
+
+    def _camera_index(self, name):
+        """Stable small integer for a camera name (caller holds lock)"""
+        if name not in self.cameras:
+            self.cameras.append(name)
+            write_json_atomic(self.cameras_path, self.cameras)
+        return self.cameras.index(name)
+
+    def record(self, camera, detected, results, alert=False, timestamp=None):
+        """Log one detect_all outcome if its confidence reaches the threshold"""
+        scores = results.get('scores', {})
+        confidence = results.get('confidence', 1.0 if detected else 0.0)
+        if confidence < self.threshold and not alert:
+            return
+
+        now = timestamp or time.time()
+        local = datetime.fromtimestamp(now)
+        day = local.strftime("%Y%m%d")
+        midnight = local.replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+
+        flags = ((self.FLAG_SENSOR if results.get('sensor') else 0)
+                 | (self.FLAG_MOTION if results.get('motion') else 0)
+                 | (self.FLAG_VISUAL if results.get('visual') else 0)
+                 | (self.FLAG_DETECTED if detected else 0)
+                 | (self.FLAG_ALERT if alert else 0))
+
+        with self.lock:
+            # Aggregates see every outcome
+            per_camera = self.hourly.setdefault(day, {})
+            counts = per_camera.get(camera)
+            if counts is None:
+                counts = per_camera[camera] = np.zeros((24, len(self.COUNTERS)), np.int64)
+            counts[local.hour] += (1, int(alert), int(bool(results.get('sensor'))),
+                                   int(bool(results.get('motion'))),
+                                   int(bool(results.get('visual'))))
+            self.dirty_days.add(day)
+
+            # Raw rows are thinned while nothing changes
+            last = self.last_logged.get(camera)
+            if (last is not None and not alert and last[1] == flags
+                    and now - last[0] < self.min_interval):
+                self.stats['thinned'] += 1
+                return
+            self.last_logged[camera] = (now, flags)
+
+            q = self._quantise
+            boxes = [[int(v) for v in box] for box in results.get('boxes', [])[:self.MAX_BOXES]]
+            row = (int((now - midnight) * 1000), self._camera_index(camera), flags,
+                   q(scores.get('sensor', 0)), q(scores.get('person', 0)),
+                   q(scores.get('motion', 0)), q(scores.get('visual', 0)),
+                   q(confidence), len(boxes))
+            self.buffer.append((day, row, boxes))
+
+    @staticmethod
+    def _quantise(value):
+        """Score in [0, 1] -> uint8"""
+        return int(round(min(max(float(value), 0.0), 1.0) * 255))
+
+    def _flush_loop(self, generation):
+        while self.running and generation == self.flush_generation:
+            self.supervisor.beat('writer:event_log')
+            time.sleep(self.flush_interval)
+            if generation != self.flush_generation:
+                return
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠ Event log flush failed: {e}")
+
+    def flush(self):
+        """Append buffered rows column by column and save changed aggregates"""
+        with self.flush_lock:
+            self._flush()
+
+    def _flush(self):
+        """flush() while holding flush_lock"""
+        with self.lock:
+            buffer, self.buffer = self.buffer, []
+            dirty = {day: {cam: counts.tolist() for cam, counts in self.hourly.get(day, {}).items()}
+                     for day in self.dirty_days}
+            self.dirty_days = set()
+
+        by_day = {}
+        for day, row, boxes in buffer:
+            by_day.setdefault(day, []).append((row, boxes))
+
+        written = 0
+        for day, rows in by_day.items():
+            part = os.path.join(self.directory, day)
+            os.makedirs(part, exist_ok=True)
+            for i, (name, dtype) in enumerate(self.COLUMNS):
+                column = np.array([r[0][i] for r in rows], dtype=dtype)
+                with open(os.path.join(part, name + '.col'), 'ab') as f:
+                    f.write(column.tobytes())
+                written += column.nbytes
+            boxes = np.array([v for r in rows for box in r[1] for v in box], dtype='<i2')
+            with open(os.path.join(part, 'boxes.col'), 'ab') as f:
+                f.write(boxes.tobytes())
+            written += boxes.nbytes
+
+        for day, data in dirty.items():
+            part = os.path.join(self.directory, day)
+            os.makedirs(part, exist_ok=True)
+            write_json_atomic(os.path.join(part, 'hourly.json'), data)
+
+        self.stats['rows_written'] += len(buffer)
+        self.stats['bytes_written'] += written
+        self.stats['flushes'] += 1
+        self._apply_retention()
+
+    def _apply_retention(self):
+        """Delete day partitions older than the retention period"""
+        cutoff = (datetime.now() - timedelta(days=self.retention_days)).strftime("%Y%m%d")
+        for day in os.listdir(self.directory):
+            path = os.path.join(self.directory, day)
+            if os.path.isdir(path) and day < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+                with self.lock:
+                    self.hourly.pop(day, None)
+
+    def aggregate(self, bucket='hour', start=None, end=None, camera=None):
+        """Counts per hour or per day between two timestamps, from memory"""
+        start = start if start is not None else time.time() - 7 * 86400
+        end = end if end is not None else time.time()
+        first_day = datetime.fromtimestamp(start).strftime("%Y%m%d")
+        last_day = datetime.fromtimestamp(end).strftime("%Y%m%d")
+
+        with self.lock:
+            days = {day: {cam: counts.copy() for cam, counts in cams.items()
+                          if camera is None or cam == camera}
+                    for day, cams in self.hourly.items() if first_day <= day <= last_day}
+
+        buckets = []
+        for day in sorted(days):
+            total = sum(days[day].values(), np.zeros((24, len(self.COUNTERS)), np.int64))
+            date = datetime.strptime(day, "%Y%m%d")
+            if bucket == 'day':
+                if date.timestamp() + 86400 > start and date.timestamp() < end:
+                    buckets.append(dict(time=date.isoformat(),
+                                        **dict(zip(self.COUNTERS, total.sum(axis=0).tolist()))))
+                continue
+            for hour in range(24):
+                begin = date.replace(hour=hour)
+                if begin.timestamp() + 3600 <= start or begin.timestamp() >= end:
+                    continue
+                if total[hour].any():
+                    buckets.append(dict(time=begin.isoformat(),
+                                        **dict(zip(self.COUNTERS, total[hour].tolist()))))
+        return buckets
+
+    def read_events(self, start=None, end=None, camera=None, limit=500):
+        """Raw rows between two timestamps (the column files plus the unflushed buffer)"""
+        start = start if start is not None else time.time() - 86400
+        end = end if end is not None else time.time()
+        first_day = datetime.fromtimestamp(start).strftime("%Y%m%d")
+        last_day = datetime.fromtimestamp(end).strftime("%Y%m%d")
+
+        # No flush in between, so every row is either on disk or in the buffer
+        with self.flush_lock:
+            stored = {}
+            for day in os.listdir(self.directory):
+                part = os.path.join(self.directory, day)
+                if not os.path.isdir(part) or not (first_day <= day <= last_day):
+                    continue
+                try:
+                    cols = {name: np.fromfile(os.path.join(part, name + '.col'), dtype=dtype)
+                            for name, dtype in self.COLUMNS}
+                    boxes = np.fromfile(os.path.join(part, 'boxes.col'), dtype='<i2')
+                except (OSError, ValueError):
+                    continue
+                rows = min(len(c) for c in cols.values())  # Torn tails are repaired at startup
+                stored[day] = ({name: c[:rows] for name, c in cols.items()}, boxes)
+            with self.lock:
+                buffered = [entry for entry in self.buffer if first_day <= entry[0] <= last_day]
+
+        for day in {entry[0] for entry in buffered}:
+            rows = [(row, box_list) for d, row, box_list in buffered if d == day]
+            cols, boxes = stored.get(day, ({name: np.zeros(0, dtype) for name, dtype in self.COLUMNS},
+                                           np.zeros(0, '<i2')))
+            cols = {name: np.concatenate((cols[name], np.array([r[0][i] for r in rows], dtype)))
+                    for i, (name, dtype) in enumerate(self.COLUMNS)}
+            boxes = np.concatenate((boxes, np.array([v for r in rows for box in r[1] for v in box],
+                                                    '<i2')))
+            stored[day] = (cols, boxes)
+
+        events = []
+        for day in sorted(stored):
+            cols, boxes = stored[day]
+            boxes = boxes[:len(boxes) // 4 * 4].reshape(-1, 4)
+            rows = len(cols['t_ms'])
+            offsets = np.concatenate(([0], np.cumsum(cols['box_count'][:rows], dtype=np.int64)))
+            midnight = datetime.strptime(day, "%Y%m%d").timestamp()
+            times = midnight + cols['t_ms'][:rows] / 1000.0
+            wanted = np.nonzero((times >= start) & (times < end))[0]
+            for i in wanted:
+                name = self.cameras[cols['camera'][i]] if cols['camera'][i] < len(self.cameras) else "?"
+                if camera is not None and name != camera:
+                    continue
+                flags = int(cols['flags'][i])
+                events.append({
+                    'time': datetime.fromtimestamp(times[i]).isoformat(timespec='milliseconds'),
+                    'camera': name,
+                    'detected': bool(flags & self.FLAG_DETECTED),
+                    'alert': bool(flags & self.FLAG_ALERT),
+                    'sensor': bool(flags & self.FLAG_SENSOR),
+                    'motion': bool(flags & self.FLAG_MOTION),
+                    'visual': bool(flags & self.FLAG_VISUAL),
+                    'scores': {k: round(int(cols[k][i]) / 255, 3)
+                               for k in ('sensor', 'person', 'motion', 'visual')},
+                    'confidence': round(int(cols['confidence'][i]) / 255, 3),
+                    'boxes': boxes[offsets[i]:offsets[i + 1]].tolist()
+                           if offsets[i + 1] <= len(boxes) else []
+                })
+        return events[-limit:] if limit > 0 else []
+
+    def totals(self):
+        """Lifetime counters (over retained days), survives restarts"""
+        with self.lock:
+            total = np.zeros(len(self.COUNTERS), np.int64)
+            for cams in self.hourly.values():
+                for counts in cams.values():
+                    total += counts.sum(axis=0)
+        return dict(zip(self.COUNTERS, total.tolist()))
+
+    def get_stats(self):
+        """Write volume statistics"""
+        with self.lock:
+            buffered = len(self.buffer)
+        return dict(self.stats, buffered=buffered)
+
+    def close(self):
+        """Flush and stop"""
+        self.running = False
+        self.flush()
+
+# Runtime-configurable settings: key -> (type, minimum, maximum)
+CONFIG_SCHEMA = {
+    'enable_sensor': ('bool', None, None),
+    'enable_motion': ('bool', None, None),
+    'enable_visual': ('bool', None, None),
+    'detection_confidence': ('float', 0.05, 0.99),
+    'hsv_orange_lower': ('hsv', None, None),
+    'hsv_orange_upper': ('hsv', None, None),
+    'hsv_white_lower': ('hsv', None, None),
+    'hsv_white_upper': ('hsv', None, None),
+    'person_model': ('model', None, None),
+    'cigarette_model': ('model', None, None),
+    'frame_skip': ('int', 1, 30),
+    'resolution': ('size', (160, 120), (1920, 1088)),
+    'alert_cooldown': ('float', 0, 3600),
+    'max_storage_mb': ('int', 10, 100000),
+    'max_images': ('int', 10, 100000),
+    'image_quality': ('int', 10, 100),
+    'zones': ('zones', None, None)
+}
+
+# Keys detect_all() reads; they travel together in a DetectorSet
+DETECTOR_KEYS = ('enable_sensor', 'enable_motion', 'enable_visual', 'hsv_orange_lower',
+                 'hsv_orange_upper', 'hsv_white_lower', 'hsv_white_upper',
+                 'person_model', 'cigarette_model', 'zones')
+
+class ConfigError(ValueError):
+    """Rejected configuration; errors maps each bad key to a message"""
+
+    def __init__(self, errors):
+        super().__init__("; ".join(f"{k}: {v}" for k, v in errors.items()))
+        self.errors = errors
+
+def default_config():
+    """Runtime configuration from the module settings"""
+    return {
+        'enable_sensor': ENABLE_SENSOR,
+        'enable_motion': ENABLE_MOTION,
+        'enable_visual': ENABLE_VISUAL,
+        'detection_confidence': DETECTION_CONFIDENCE,
+        'hsv_orange_lower': list(HSV_ORANGE_LOWER),
+        'hsv_orange_upper': list(HSV_ORANGE_UPPER),
+        'hsv_white_lower': list(HSV_WHITE_LOWER),
+        'hsv_white_upper': list(HSV_WHITE_UPPER),
+        'person_model': PERSON_MODEL,
+        'cigarette_model': CIGARETTE_MODEL,
+        'frame_skip': FRAME_SKIP,
+        'resolution': list(CAMERA_RESOLUTION),
+        'alert_cooldown': 30,
+        'max_storage_mb': 300,
+        'max_images': 150,
+        'image_quality': 60,
+        'zones': {}
+    }
+
+def detector_settings(config):
+    """The part of a configuration detect_all() uses"""
+    return {key: config[key] for key in DETECTOR_KEYS}
+
+def _check_config_value(key, value):
+    """Normalised value, or raises ValueError with the reason"""
+    kind, low, high = CONFIG_SCHEMA[key]
+    if kind == 'bool':
+        if not isinstance(value, bool):
+            raise ValueError("must be true or false")
+        return value
+    if kind == 'model':
+        if value is None:
+            return None
+        if value not in MODELS:
+            raise ValueError(f"unknown model (choose from {', '.join(MODELS)} or null)")
+        if not os.path.exists(os.path.join(MODEL_DIR, MODELS[value]['path'])):
+            raise ValueError(f"{MODELS[value]['path']} not found")
+        return value
+    if kind == 'zones':
+        return _check_zones(value)
+    if kind in ('hsv', 'size'):
+        count = 3 if kind == 'hsv' else 2
+        if (not isinstance(value, (list, tuple)) or len(value) != count
+                or not all(isinstance(v, int) and not isinstance(v, bool) for v in value)):
+            raise ValueError(f"must be a list of {count} integers")
+        if kind == 'hsv':
+            if not (0 <= value[0] <= 180 and 0 <= value[1] <= 255 and 0 <= value[2] <= 255):
+                raise ValueError("H must be 0-180, S and V 0-255")
+        elif not (low[0] <= value[0] <= high[0] and low[1] <= value[1] <= high[1]):
+            raise ValueError(f"must be between {low[0]}x{low[1]} and {high[0]}x{high[1]}")
+        elif value[0] % 2 or value[1] % 2:
+            raise ValueError("width and height must be even")
+        return list(value)
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError("must be a number")
+    if kind == 'int' and value != int(value):
+        raise ValueError("must be a whole number")
+    if not low <= value <= high:
+        raise ValueError(f"must be between {low} and {high}")
+    return int(value) if kind == 'int' else float(value)
+
+def _check_zones(value):
+    """Normalised {camera: [zone, ...]}, or raises ValueError with the reason"""
+    if not isinstance(value, dict):
+        raise ValueError("must map camera names to lists of zones")
+    zones = {}
+    for camera, camera_zones in value.items():
+        if not isinstance(camera_zones, list):
+            raise ValueError(f"{camera}: must be a list of zones")
+        checked = []
+        for i, zone in enumerate(camera_zones):
+            where = f"{camera} zone {i}"
+            if not isinstance(zone, dict) or zone.get('type') not in ('include', 'exclude'):
+                raise ValueError(f"{where}: type must be 'include' or 'exclude'")
+            points = zone.get('points')
+            if (not isinstance(points, list) or len(points) < 3
+                    or not all(isinstance(p, (list, tuple)) and len(p) == 2
+                               and all(isinstance(v, (int, float)) and not isinstance(v, bool)
+                                       and 0 <= v <= 1 for v in p) for p in points)):
+                raise ValueError(f"{where}: points must be 3+ [x, y] pairs between 0 and 1 "
+                                 "(fractions of the frame size)")
+            checked.append({'type': zone['type'], 'points': [[float(x), float(y)] for x, y in points]})
+        if checked:
+            zones[camera] = checked
+    return zones
+
+def validate_config(changes, base):
+    """Check a set of changes against the schema and the rest of the configuration
+
+    Returns the merged configuration; raises ConfigError listing every problem,
+    so nothing is applied unless the whole change is valid. Values equal to
+    the base ones are kept as they are.
+    """
+    if not isinstance(changes, dict):
+        raise ConfigError({'config': "must be a JSON object"})
+    errors = {}
+    merged = dict(base)
+    for key, value in changes.items():
+        if key not in CONFIG_SCHEMA:
+            errors[key] = "unknown setting"
+            continue
+        if value == base.get(key) and type(value) is type(base.get(key)):
+            continue  # Unchanged, e.g. a saved default model that is not downloaded
+        try:
+            merged[key] = _check_config_value(key, value)
+        except ValueError as e:
+            errors[key] = str(e)
+    for name in ('orange', 'white'):
+        lower, upper = merged[f'hsv_{name}_lower'], merged[f'hsv_{name}_upper']
+        if not errors.get(f'hsv_{name}_lower') and not errors.get(f'hsv_{name}_upper') \
+                and any(lo > hi for lo, hi in zip(lower, upper)):
+            errors[f'hsv_{name}_upper'] = f"must be >= hsv_{name}_lower in every channel"
+    if errors:
+        raise ConfigError(errors)
+    return merged
+
+def load_config_file(path, base):
+    """Defaults overridden by the config file; an invalid file is reported and ignored"""
+    if not os.path.exists(path):
+        return dict(base)
+    try:
+        with open(path) as f:
+            config = validate_config(json.load(f), base)
+        print(f"✓ Config loaded from {path}")
+        return config
+    except (OSError, ValueError) as e:
+        print(f"❌ Ignoring invalid config file {path}: {e}")
+        return dict(base)
+
+class SmokingDetectionSystem:
+    def __init__(self, save_dir="violations", alert_cooldown=30,
+                 max_storage_mb=300, max_images=150, image_quality=60, ip_address="",
+                 cameras=None):
+        """Initialize enhanced detection system"""
+        # Constructor arguments are the defaults, config.json overrides them
+        camera_configs = cameras if cameras is not None else CAMERAS
+        defaults = dict(default_config(), alert_cooldown=alert_cooldown,
+                        max_storage_mb=max_storage_mb, max_images=max_images,
+                        image_quality=image_quality,
+                        zones=_check_zones({c['name']: c['zones'] for c in camera_configs
+                                            if c.get('zones')}))
+        self.config = load_config_file(CONFIG_FILE, defaults)
+        self.config_lock = threading.Lock()
+
+        self.save_dir = save_dir
+        self.alert_cooldown = self.config['alert_cooldown']
+        self.last_oled_update = 0
+        self.max_storage_mb = self.config['max_storage_mb']
+        self.max_images = self.config['max_images']
+        self.image_quality = self.config['image_quality']
+        self.ip_address = ip_address
+        self.storage_lock = threading.Lock()
+
+        os.makedirs(save_dir, exist_ok=True)
+        self.supervisor = Supervisor()
+        self.event_log = EventLog(EVENT_LOG_DIR, supervisor=self.supervisor)
+        self.jpeg, self.jpeg_benchmark = select_jpeg_encoder(JPEG_ENCODER, self.config['resolution'])
+        self.thumbnails = ThumbnailCache(save_dir, encoder=self.jpeg)
+        self.duplicates = DuplicateIndex()
+        self.overlay = OverlayRenderer()
         self.cleanup_old_files()
-        return filepath
+        files = self._violation_files()
+        self.thumbnails.prune(f[0] for f in files)
+        indexed = self.duplicates.load(files)
+        if indexed:
+            print(f"✓ Duplicate index: {indexed} recent violation images")
 
-    def cleanup_old_files(self):
-        """Remove old files if limits exceeded"""
-        files = []
-        for f in os.listdir(self.save_dir):
-            if f.endswith('.jpg'):
-                filepath = os.path.join(self.save_dir, f)
-                files.append((filepath, os.path.getmtime(filepath)))
+        # Initialize hardware
+        print("\n" + "="*50)
+        print("🚭 ENHANCED NO-SMOKING DETECTION SYSTEM")
+        print("="*50 + "\n")
 
-        files.sort(key=lambda x: x[1])
-        total_size = sum(os.path.getsize(f[0]) for f in files) / (1024 * 1024)
-        removed_count = 0
+        self.oled = OLEDDisplay(supervisor=self.supervisor)
 
-        while len(files) > self.max_images or total_size > self.max_storage_mb:
-            if not files:
-                break
-            os.remove(files.pop(0)[0])
-            removed_count += 1
-            total_size = sum(os.path.getsize(f[0]) for f in files) / (1024 * 1024)
+        self.sensor = (SensorHandler(enabled=True, supervisor=self.supervisor)
+                       if self.config['enable_sensor'] else None)
+        self.alerts = AlertSystem()
 
-        if removed_count > 0:
-            print(f"🗑️  Cleaned up {removed_count} old files")
+        # Load AI model once (optional), shared by all cameras
+        settings = detector_settings(self.config)
+        offload = OffloadClient(OFFLOAD_SERVER, self.jpeg) if OFFLOAD_SERVER else None
+        if DETECTION_MODE == "processes":
+            width, height = max((tuple(c.get('size') or self.config['resolution'])
+                                 for c in camera_configs), key=lambda s: s[0] * s[1])
+            # Every camera holds its last frame for motion, plus one frame per dispatcher
+            self.engine = ProcessDetectionEngine(
+                self.sensor, DETECTION_PROCESSES,
+                slots=len(camera_configs) + DETECTION_WORKERS + 1,
+                max_frame_shape=(height, width, 3), settings=settings, offload=offload
+            )
+        else:
+            self.engine = DetectionEngine(self.sensor, settings, offload)
+        self.pool = DetectionWorkerPool(DETECTION_WORKERS, self.supervisor)
+        self.latency = LatencyTracker()
+
+        self.confidence_threshold = self.config['detection_confidence']
+        self.running = False
+        self.stopped = False
+        self.stream_clients = 0  # Open MJPEG streams
+        self.stream_lock = threading.Lock()
+        self.governor = MemoryGovernor(self)
+
+        # Initialize cameras
+        self.cameras = {}
+        for cam in camera_configs:
+            self.cameras[cam['name']] = CameraPipeline(
+                self, cam['name'], cam.get('source', 0),
+                cam.get('weight', 1.0), cam.get('size')
+            )
+
+        self.start_time = time.time()
+        self.fleet_sample = (self.start_time, 0)
+        self.forwarder = EventForwarder(FORWARD_SINKS, metrics=self.fleet_metrics)
+
+        print("\n✓ System initialized!")
+        print(f"Cameras: {', '.join(self.cameras)}")
+        if offload is not None:
+            print(f"Edge offload: {offload.host}:{offload.port} (local detectors as fallback)")
+        print(f"Detection modes: Sensor={'✓' if settings['enable_sensor'] else '✗'}, "
+              f"Motion={'✓' if settings['enable_motion'] else '✗'}, "
+              f"Visual={'✓' if settings['enable_visual'] else '✗'}, "
+              f"OLED={'✓' if ENABLE_OLED else '✗'}\n")
+
+        self.oled.show_system_ready(self.ip_address)
+
+    def fleet_metrics(self):
+        """Live health values for fleet sinks (see event_forwarding.FLEET_METRIC_KEYS)"""
+        now = time.time()
+        pool = list(self.pool.get_stats()['cameras'].values())
+        frames = sum(c['processed'] for c in pool)
+        last_time, last_frames = self.fleet_sample
+        self.fleet_sample = (now, frames)
+        return {
+            'uptime_s': now - self.start_time,
+            'cpu_temp_c': read_cpu_temp(),
+            'rss_mb': read_memory_mb()[0],
+            'memory_level': self.governor.level,
+            'cameras': len(self.cameras),
+            'fps': (frames - last_frames) / max(1e-6, now - last_time),
+            'detect_ms': max((c['avg_detect_ms'] for c in pool), default=0.0),
+            'queue_ms': max((c['avg_wait_ms'] for c in pool), default=0.0),
+            'violations': self.total_violations
+        }
+
+    @property
+    def total_violations(self):
+        """Violations across all cameras"""
+        return sum(cam.total_violations for cam in self.cameras.values())
+
+    @property
+    def detection_counts(self):
+        """Detection counts summed across all cameras"""
+        counts = {'sensor': 0, 'motion': 0, 'visual': 0, 'combined': 0}
+        for cam in self.cameras.values():
+            for key, value in cam.detection_counts.items():
+                counts[key] += value
+        return counts
+
+    @property
+    def detection_status(self):
+        """Overall status (first camera reporting a detection wins, then failed components)"""
+        for cam in self.cameras.values():
+            if cam.detecting:
+                if len(self.cameras) > 1:
+                    return f"[{cam.name}] {cam.detection_status}"
+                return cam.detection_status
+        down = self.supervisor.down()
+        if down:
+            return f"⚠ Recovering: {', '.join(down)}"
+        return "Monitoring..."
+
+    def any_detecting(self):
+        """True if any camera currently sees a violation"""
+        return any(cam.detecting for cam in self.cameras.values())
+
+    def get_camera(self, name=None):
+        """Look up a camera pipeline (first camera if name is None)"""
+        if name is None:
+            return next(iter(self.cameras.values()), None)
+        return self.cameras.get(name)
+
+    def _violation_files(self):
+        """(relative name, path, mtime, size) for every saved image, all cameras"""
+        files = []
+        for root, dirs, names in os.walk(self.save_dir):
+            dirs[:] = [d for d in dirs if not d.startswith('.')]  # Skip thumbnail cache
+            for f in names:
+                if f.endswith('.jpg'):
+                    filepath = os.path.join(root, f)
+                    try:
+                        stat = os.stat(filepath)
+                    except OSError:
+                        continue
+                    relname = os.path.relpath(filepath, self.save_dir).replace(os.sep, '/')
+                    files.append((relname, filepath, stat.st_mtime, stat.st_size))
+        return files
+
+    def apply_config(self, changes, save=True):
+        """Validate and apply configuration changes without a restart
+
+        Everything that can fail (validation, model loading, frame size limits)
+        happens before anything is switched. Detectors change as one object
+        between frames; cameras are reopened only when their resolution changes.
+        Returns the changed settings and the cameras being reopened.
+        """
+        with self.config_lock:
+            merged = validate_config(changes, self.config)
+            changed = {k: v for k, v in merged.items() if v != self.config[k]}
+            width, height = merged['resolution']
+            if 'resolution' in changed and not self.engine.frame_fits((height, width, 3)):
+                raise ConfigError({'resolution': "larger than the shared-memory frame slots "
+                                                 "(needs a restart)"})
+            active = None
+            if any(key in changed for key in DETECTOR_KEYS):
+                active = self.engine.prepare(detector_settings(merged))
+
+            # Nothing below can reject the change
+            if merged['enable_sensor'] and self.sensor is None:
+                self.sensor = SensorHandler(enabled=True, supervisor=self.supervisor)
+                self.engine.sensor = self.sensor
+                if self.sensor.enabled:
+                    self.supervisor.register('sensor', 'sensor', self.sensor.reset,
+                                             heartbeat=False)
+            if active is not None:
+                self.engine.commit(active)
+            self.confidence_threshold = merged['detection_confidence']
+            self.alert_cooldown = merged['alert_cooldown']
+            self.image_quality = merged['image_quality']
+            self.max_storage_mb = merged['max_storage_mb']
+            self.max_images = merged['max_images']
+            reopened = []
+            for cam in self.cameras.values():
+                cam.frame_skip = merged['frame_skip']
+                if 'zones' in changed and (merged['zones'].get(cam.name)
+                                           != self.config['zones'].get(cam.name)):
+                    cam.fusion = TemporalFusion()  # Drop evidence from areas now excluded
+                if 'resolution' in changed and not cam.fixed_size:
+                    cam.base_size = tuple(merged['resolution'])
+                    cam.reconfigure(cam.target_size())
+                    reopened.append(cam.name)
+            self.config = merged
+            if save and changed:
+                write_json_atomic(CONFIG_FILE, merged)
+
+        if 'max_storage_mb' in changed or 'max_images' in changed:
+            self.cleanup_old_files()
+        if changed:
+            print(f"⚙️ Config updated: {', '.join(changed)}")
+        return changed, reopened
+
+    def cleanup_old_files(self):
+        """Remove old files if limits exceeded (limits apply across all cameras)"""
+        with self.storage_lock:
+            files = self._violation_files()
+            files.sort(key=lambda x: x[2])
+            total_size = sum(f[3] for f in files) / (1024 * 1024)
+            removed_count = 0
+
+            while len(files) > self.max_images or total_size > self.max_storage_mb:
+                if not files:
+                    break
+                oldest = files.pop(0)
+                self._remove_violation(oldest[0], oldest[1])
+                removed_count += 1
+                total_size -= oldest[3] / (1024 * 1024)
+
+            if removed_count > 0:
+                print(f"🗑️  Cleaned up {removed_count} old files")
+
+    def _remove_violation(self, relname, filepath):
+        """Delete an image with its metadata sidecar and thumbnail"""
+        os.remove(filepath)
+        try:
+            os.remove(filepath[:-4] + '.json')
+        except OSError:
+            pass
+        self.thumbnails.remove(relname)
+        self.duplicates.remove(relname)
 
     def get_storage_info(self):
         """Get storage statistics"""
-        files = [f for f in os.listdir(self.save_dir) if f.endswith('.jpg')]
-        total_size = sum(os.path.getsize(os.path.join(self.save_dir, f))
-                        for f in files) / (1024 * 1024)
+        files = self._violation_files()
+        total_size = sum(f[3] for f in files) / (1024 * 1024)
         return {
             "total_images": len(files),
             "total_size_mb": round(total_size, 2),
@@ -763,24 +5124,102 @@ class SmokingDetectionSystem:
             "storage_percent": round((total_size / self.max_storage_mb) * 100, 1)
         }
 
-    def get_recent_violations(self, limit=20):
-        """Get recent violations"""
+    def get_recent_violations(self, limit=20, camera=None):
+        """Get recent violations (optionally for one camera)"""
         files = []
-        for f in os.listdir(self.save_dir):
-            if f.endswith('.jpg'):
-                filepath = os.path.join(self.save_dir, f)
-                files.append({
-                    'filename': f,
-                    'timestamp': datetime.fromtimestamp(
-                        os.path.getmtime(filepath)
-                    ).strftime('%Y-%m-%d %H:%M:%S'),
-                    'size_kb': round(os.path.getsize(filepath) / 1024, 1)
-                })
+        for relname, filepath, mtime, size in self._violation_files():
+            cam_name = relname.split('/')[0] if '/' in relname else ""
+            if camera is not None and cam_name != camera:
+                continue
+            files.append({
+                'filename': relname,
+                'thumbnail': f"/thumbnails/{relname}",
+                'camera': cam_name,
+                'timestamp': datetime.fromtimestamp(mtime).strftime('%Y-%m-%d %H:%M:%S'),
+                'size_kb': round(size / 1024, 1)
+            })
         files.sort(key=lambda x: x['timestamp'], reverse=True)
         return files[:limit]
 
+    @staticmethod
+    def make_export_cursor(mtime, relname):
+        """Opaque token meaning: everything after this image
+
+        repr() keeps the exact float, so the resume comparison neither repeats
+        this image nor skips one with a nearly equal mtime.
+        """
+        return base64.urlsafe_b64encode(f"{mtime!r}|{relname}".encode()).decode()
+
+    @staticmethod
+    def parse_export_cursor(cursor):
+        """(mtime, relname) from a cursor token"""
+        mtime, relname = base64.urlsafe_b64decode(cursor.encode()).decode().split('|', 1)
+        return float(mtime), relname
+
+    def export_entries(self, start=None, end=None, cursor=None, camera=None):
+        """Images in [start, end) oldest first, resuming after a cursor"""
+        after = self.parse_export_cursor(cursor) if cursor else None
+        entries = []
+        for relname, filepath, mtime, size in self._violation_files():
+            if start is not None and mtime < start:
+                continue
+            if end is not None and mtime >= end:
+                continue
+            if after is not None and (mtime, relname) <= after:
+                continue
+            if camera is not None and not relname.startswith(camera + '/'):
+                continue
+            entries.append((relname, filepath, mtime))
+        entries.sort(key=lambda e: (e[2], e[0]))
+        return entries
+
+    def iter_export(self, entries, chunk_size=64 * 1024):
+        """Stream a tar archive of violations without buffering it
+
+        Each image is followed by a <name>.json member holding its metadata and
+        the resume cursor for everything after it, so a client whose download
+        broke can continue from the last complete .json member. A manifest.jsonl
+        listing every exported entry closes the archive.
+        """
+        manifest = []
+        for relname, filepath, mtime in entries:
+            try:
+                f = open(filepath, 'rb')
+            except OSError:
+                continue  # Removed by retention since the listing was taken
+            with f:
+                size = os.fstat(f.fileno()).st_size
+                yield _tar_header(relname, size, mtime)
+                remaining = size
+                while remaining > 0:
+                    chunk = f.read(min(chunk_size, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    yield chunk
+                if remaining:
+                    yield bytes(remaining)  # File shrank under us; keep the archive valid
+                yield bytes(-size % 512)
+
+            metadata = {'file': relname,
+                        'timestamp': datetime.fromtimestamp(mtime).isoformat(timespec='seconds')}
+            try:
+                with open(filepath[:-4] + '.json') as mf:
+                    metadata.update(json.load(mf))
+            except (OSError, ValueError):
+                pass  # Saved before metadata sidecars existed
+            metadata['resume_cursor'] = self.make_export_cursor(mtime, relname)
+            manifest.append(metadata)
+
+            data = json.dumps(metadata).encode()
+            yield _tar_member(relname[:-4] + '.json', data, mtime)
+
+        data = ''.join(json.dumps(m) + '\n' for m in manifest).encode()
+        yield _tar_member('manifest.jsonl', data, time.time())
+        yield bytes(1024)  # End-of-archive marker
+
     def run_detection(self):
-        """Main detection loop"""
+        """Main detection loop: one capture thread per camera feeding the shared pool"""
         self.running = True
         print("🎥 Detection started...\n")
 
@@ -791,111 +5230,68 @@ class SmokingDetectionSystem:
                 time.sleep(1)
 
         self.oled.show_no_smoking()
-
+        self.pool.start()
+        self.governor.start()
+        for cam in self.cameras.values():
+            cam.start_capture()
+        self._supervise()
+        self.supervisor.start()
+
+        # Failed stages are restarted by the supervisor, this thread only waits for stop()
         try:
             while self.running:
-                frame = self.picam2.capture_array()
-                frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
-
-                self.frame_count += 1
-                if self.frame_count % self.frame_skip != 0:
-                    time.sleep(0.05)
-                    continue
-
-                # Run all detections
-                detected, results = self.detect_all(frame)
-                current_time = time.time()
-
-                # Prepare display frame
-                display_frame = frame.copy()
-                status_color = (0, 0, 255) if detected else (0, 255, 0)
-
-                # Draw status
-                cv2.putText(display_frame, self.detection_status, (10, 25),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.5, status_color, 2)
-
-                # Draw detection info
-                y_offset = 45
-                if self.sensor:
-                    sensor_status = self.sensor.get_status()
-                    sensor_color = (0, 0, 255) if results['sensor'] else (0, 255, 0)
-                    cv2.putText(display_frame, f"Sensor: {sensor_status}", (10, y_offset),
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.4, sensor_color, 1)
-                    y_offset += 18
-
-                cv2.putText(display_frame, f"Violations: {self.total_violations}",
-                           (10, y_offset), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 255), 1)
-
-                # Draw boxes
-                for box in results.get('boxes', []):
-                    x, y, w, h = box
-                    cv2.rectangle(display_frame, (x, y), (x+w, y+h), (0, 0, 255), 2)
-
-                # Handle detection
-                if detected:
-                    detection_types = []
-                    if results['sensor']:
-                        detection_types.append("SENSOR")
-                    if results['motion']:
-                        detection_types.append("MOTION")
-                    if results['visual']:
-                        detection_types.append("CIGARETTE")
-
-                    self.detection_status = f"⚠️ DETECTED: {'+'.join(detection_types)}"
-
-                    # Update OLED with violation
-                    self.oled.show_violation('+'.join(detection_types))
-
-                    if current_time - self.last_alert_time > self.alert_cooldown:
-                        self.save_violation(frame, results)
-                        self.alerts.trigger_alert()
-                        self.last_alert_time = current_time
-                        print(f"🚨 ALERT: {'+'.join(detection_types)}")
-                        # Show alert count on OLED briefly
-                        threading.Thread(target=self._show_alert_briefly, daemon=True).start()
-                else:
-                    self.detection_status = "Monitoring..."
-                    self.alerts.set_normal()
-
-                    # Update OLED monitoring status every 5 seconds
-                    if current_time - self.last_oled_update > 5:
-                        sensor_status = self.sensor.get_status() if self.sensor else ""
-                        self.oled.show_monitoring(sensor_status, self.total_violations, self.ip_address)
-                        self.last_oled_update = current_time
-
-                # Update frame for streaming
-                with self.lock:
-                    self.current_frame = display_frame.copy()
-
-                time.sleep(0.2)
-
-        except Exception as e:
-            print(f"❌ Error: {e}")
-            import traceback
-            traceback.print_exc()
+                time.sleep(1)
         finally:
             self.running = False
+            self.supervisor.stop()
+            self.pool.stop()
+
+    def _supervise(self):
+        """Register every stage with the supervisor"""
+        supervisor = self.supervisor
+        for cam in self.cameras.values():
+            supervisor.register(f"capture:{cam.name}", 'capture', cam.restart_capture,
+                                alive=lambda cam=cam: (cam.capture_thread.is_alive()
+                                                       or not self.running))  # Shutting down
+        for slot in range(self.pool.num_workers):
+            supervisor.register(f"detect:{slot}", 'detect',
+                                lambda slot=slot: self.pool.replace_worker(slot),
+                                alive=lambda slot=slot: self.pool.threads[slot].is_alive())
+        if self.oled.enabled:
+            supervisor.register('oled', 'oled', self.oled.reset, heartbeat=False)
+        if self.sensor and self.sensor.enabled:
+            supervisor.register('sensor', 'sensor', self.sensor.reset, heartbeat=False)
+        log = self.event_log
+        supervisor.register('writer:event_log', 'writer', log.start_flush,
+                            alive=lambda: log.flush_thread.is_alive(),
+                            interval=log.flush_interval)
+        for sink in self.forwarder.sinks:
+            supervisor.register(f"writer:{sink.name}", 'writer', sink.start,
+                                alive=lambda sink=sink: sink.thread.is_alive(), heartbeat=False)
 
     def _show_alert_briefly(self):
         """Show alert count briefly after detection"""
         time.sleep(3)  # Wait 3 seconds while violation message is showing
         self.oled.show_alert_count(self.total_violations)
 
-    def get_frame(self):
-        """Get frame for streaming"""
-        with self.lock:
-            if self.current_frame is not None:
-                ret, buffer = cv2.imencode('.jpg', self.current_frame,
-                                          [cv2.IMWRITE_JPEG_QUALITY, 70])
-                return buffer.tobytes()
-        return None
+    def get_frame(self, camera=None, since=None, timeout=0):
+        """(JPEG, FrameStamp) for streaming (first camera by default)"""
+        cam = self.get_camera(camera)
+        return cam.get_frame(since, timeout) if cam else None
 
     def stop(self):
         """Stop system"""
         self.running = False
-        self.picam2.stop()
+        self.stopped = True
+        self.supervisor.stop()  # Threads exiting now are not failures
+        self.governor.stop()
+        for cam in self.cameras.values():
+            cam.stop()
+        self.engine.stop()
+        self.event_log.close()
+        self.forwarder.close()
         self.oled.clear()
-        if self.sensor:
+        if self.sensor and self.sensor.enabled:
             GPIO.cleanup()
         print("✓ System stopped")
 
@@ -962,6 +5358,12 @@ HTML_TEMPLATE = """
             height: auto;
             display: block;
         }
+        .video-label {
+            padding: 6px 10px;
+            font-size: 13px;
+            color: #ff4444;
+            background: #1a1a1a;
+        }
         .violations-section {
             background: #2a2a2a;
             padding: 15px;
@@ -972,6 +5374,12 @@ HTML_TEMPLATE = """
             color: #ff4444;
             font-size: 18px;
         }
+        .export-link {
+            float: right;
+            font-size: 13px;
+            color: #4CAF50;
+            text-decoration: none;
+        }
         .violations-grid {
             display: grid;
             grid-template-columns: repeat(auto-fill, minmax(200px, 1fr));
@@ -1044,12 +5452,15 @@ HTML_TEMPLATE = """
             </div>
         </div>
 
+        {% for camera in cameras %}
         <div class="video-container">
-            <img src="{{ url_for('video_feed') }}" alt="Live Detection Feed">
+            {% if cameras|length > 1 %}<div class="video-label">📷 {{ camera }}</div>{% endif %}
+            <img src="{{ url_for('camera_feed', camera=camera) }}" alt="Live Detection Feed - {{ camera }}">
         </div>
+        {% endfor %}
 
         <div class="violations-section">
-            <h2>📸 Recent Violations</h2>
+            <h2>📸 Recent Violations <a href="/api/export" class="export-link">⬇ Export</a></h2>
             <div class="violations-grid" id="violations-list">
                 <p style="color: #999;">No violations recorded</p>
             </div>
@@ -1057,6 +5468,8 @@ HTML_TEMPLATE = """
     </div>
 
     <script>
+        let lastViolationsKey = null;
+
         function updateStats() {
             fetch('/api/stats')
                 .then(response => response.json())
@@ -1074,19 +5487,24 @@ HTML_TEMPLATE = """
                     document.getElementById('images').textContent = data.storage.total_images;
                 });
 
-            fetch('/api/violations')
+            fetch('/api/violations', {cache: 'no-cache'})
                 .then(response => response.json())
                 .then(data => {
+                    // Only rebuild the gallery when the list actually changed
+                    const key = data.violations.map(v => v.filename).join('|');
+                    if (key === lastViolationsKey) return;
+                    lastViolationsKey = key;
+
                     const list = document.getElementById('violations-list');
                     if (data.violations.length === 0) {
                         list.innerHTML = '<p style="color: #999;">No violations recorded</p>';
                     } else {
                         list.innerHTML = data.violations.map(v => `
                             <div class="violation-card" onclick="window.open('/violations/${v.filename}', '_blank')">
-                                <img src="/violations/${v.filename}" alt="Violation">
+                                <img src="${v.thumbnail}" alt="Violation" loading="lazy">
                                 <div class="violation-info">
                                     <div style="color: #ff4444; font-weight: bold;">${v.timestamp}</div>
-                                    <div style="color: #999; margin-top: 5px;">${v.size_kb} KB</div>
+                                    <div style="color: #999; margin-top: 5px;">${v.camera ? v.camera + ' · ' : ''}${v.size_kb} KB</div>
                                 </div>
                             </div>
                         `).join('');
@@ -1101,26 +5519,77 @@ HTML_TEMPLATE = """
 </html>
 """
 
-def generate_frames():
-    """Generate frames for streaming"""
+def _stream_part(data, stamp, latency):
+    """One multipart/x-mixed-replace part, with the frame's age and the stream latency"""
+    headers = f"--frame\r\nContent-Type: image/jpeg\r\nContent-Length: {len(data)}\r\n"
+    if LATENCY_HEADERS:
+        delivered = latency.get_stats()['capture_to_delivered']
+        headers += (f"X-Frame-Seq: {stamp.seq}\r\n"
+                    f"X-Frame-Age-Ms: {(time.monotonic() - stamp.captured) * 1000:.1f}\r\n")
+        if delivered['count']:
+            headers += (f"X-Latency-P50-Ms: {delivered['p50_ms']}\r\n"
+                        f"X-Latency-P95-Ms: {delivered['p95_ms']}\r\n")
+    return headers.encode() + b'\r\n' + data + b'\r\n'
+
+def generate_frames(camera=None):
+    """Generate frames for streaming
+
+    Ends when the system stops or the memory governor drops the stream; when the viewer disconnects the server closes
+    the generator, so the finally block always drops it from stream_clients.
+    """
     global detector
-    while True:
-        if detector is not None:
-            frame = detector.get_frame()
-            if frame is not None:
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-        time.sleep(0.1)
+    system = detector
+    if system is None:
+        return
+    with system.stream_lock:
+        system.stream_clients += 1
+    last_seq = None
+    try:
+        while not system.stopped and system.governor.stream_allowed(camera):
+            # Each frame is sent once, as soon as it is published
+            frame = system.get_frame(camera, since=last_seq, timeout=1.0)
+            if frame is None:
+                continue
+            data, stamp = frame
+            last_seq = stamp.seq
+            yield _stream_part(data, stamp, system.latency)
+            # The server asks for the next part once this one is written out
+            system.latency.add('capture_to_delivered', stamp.captured)
+            time.sleep(system.governor.stream_interval())  # Frame rate limit
+    finally:
+        with system.stream_lock:
+            system.stream_clients -= 1
 
 @app.route('/')
 def index():
-    return render_template_string(HTML_TEMPLATE)
+    cameras = list(detector.cameras) if detector is not None else []
+    return render_template_string(HTML_TEMPLATE, cameras=cameras)
+
+def _stream_rejected(camera=None):
+    """503 response when the memory governor is not taking this viewer, else None"""
+    if detector is not None and not detector.governor.stream_allowed(camera):
+        state = detector.governor.LEVELS[detector.governor.level]
+        return jsonify({'error': f'Stream unavailable: low memory ({state})'}), 503
+    return None
 
 @app.route('/video_feed')
 def video_feed():
+    rejected = _stream_rejected()
+    if rejected:
+        return rejected
     return Response(generate_frames(),
                    mimetype='multipart/x-mixed-replace; boundary=frame')
 
+@app.route('/video_feed/<camera>')
+def camera_feed(camera):
+    if detector is None or detector.get_camera(camera) is None:
+        return jsonify({'error': f'Unknown camera: {camera}'}), 404
+    rejected = _stream_rejected(camera)
+    if rejected:
+        return rejected
+    return Response(generate_frames(camera),
+                   mimetype='multipart/x-mixed-replace; boundary=frame')
+
 @app.route('/api/stats')
 def api_stats():
     global detector
@@ -1135,22 +5604,212 @@ def api_stats():
         'sensor_status': sensor_status,
         'total_violations': detector.total_violations,
         'detection_counts': detector.detection_counts,
-        'storage': storage
+        'storage': storage,
+        'stream_clients': detector.stream_clients,
+        'memory': detector.governor.get_stats(),
+        'jpeg_encoder': dict(detector.jpeg.get_stats(), startup_benchmark_ms=detector.jpeg_benchmark),
+        'cameras': {name: cam.get_stats() for name, cam in detector.cameras.items()},
+        'detection_pool': detector.pool.get_stats(),
+        'detection_engine': detector.engine.get_stats(),
+        'thumbnails': detector.thumbnails.get_stats(),
+        'deduplication': detector.duplicates.get_stats(),
+        'overlay': detector.overlay.get_stats(),
+        'event_log': detector.event_log.get_stats(),
+        'forwarding': detector.forwarder.get_stats(),
+        'supervisor': detector.supervisor.get_stats(),
+        'latency': detector.latency.get_stats(),
+        'lifetime_counts': detector.event_log.totals()
     })
 
+@app.route('/api/memory')
+def api_memory():
+    global detector
+    if detector is None:
+        return jsonify({'error': 'System not initialized'}), 503
+    return jsonify(detector.governor.get_stats(history=True))
+
+@app.route('/api/latency')
+def api_latency():
+    global detector
+    if detector is None:
+        return jsonify({'error': 'System not initialized'}), 503
+    return jsonify(detector.latency.get_stats())
+
+@app.route('/api/health')
+def api_health():
+    global detector
+    if detector is None:
+        return jsonify({'error': 'System not initialized'}), 503
+    return jsonify(detector.supervisor.get_stats(history=True))
+
+@app.route('/api/forwarding')
+def api_forwarding():
+    global detector
+    if detector is None:
+        return jsonify({'error': 'System not initialized'}), 503
+    return jsonify(detector.forwarder.get_stats())
+
+@app.route('/api/cameras')
+def api_cameras():
+    global detector
+    if detector is None:
+        return jsonify({'cameras': []})
+
+    cameras = []
+    for name, cam in detector.cameras.items():
+        stats = cam.get_stats()
+        stats['name'] = name
+        cameras.append(stats)
+    return jsonify({'cameras': cameras})
+
 @app.route('/api/violations')
 def api_violations():
     global detector
     if detector is None:
         return jsonify({'violations': []})
 
-    violations = detector.get_recent_violations(limit=20)
-    return jsonify({'violations': violations})
+    camera = request.args.get('camera')
+    violations = detector.get_recent_violations(limit=20, camera=camera)
+
+    # Dashboards poll this every 1.5 s; let them revalidate with If-None-Match
+    response = jsonify({'violations': violations})
+    response.set_etag(hashlib.sha1(response.get_data()).hexdigest()[:20])
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
-@app.route('/violations/<filename>')
+@app.route('/violations/<path:filename>')
 def serve_violation(filename):
     global detector
-    return send_from_directory(detector.save_dir, filename)
+    # send_from_directory adds ETag/Last-Modified and answers 304s itself
+    return send_from_directory(detector.save_dir, filename, max_age=VIOLATION_CACHE_MAX_AGE)
+
+@app.route('/thumbnails/<path:filename>')
+def serve_thumbnail(filename):
+    global detector
+    if detector is None or safe_join(detector.save_dir, filename) is None:
+        abort(404)
+
+    entry = detector.thumbnails.get(filename)
+    if entry is None:
+        abort(404)
+
+    data, etag, mtime = entry
+    response = Response(data, mimetype='image/jpeg')
+    response.set_etag(etag)
+    response.last_modified = datetime.fromtimestamp(mtime)
+    response.cache_control.public = True
+    response.cache_control.max_age = VIOLATION_CACHE_MAX_AGE
+    return response.make_conditional(request)
+
+def _parse_time_arg(value):
+    """Unix timestamp from an ISO date/time or epoch seconds query argument"""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+@app.route('/api/export')
+def api_export():
+    """Stream a tar of violations: ?start=&end= (ISO or epoch), &camera=, &cursor="""
+    global detector
+    if detector is None:
+        return jsonify({'error': 'System not initialized'}), 503
+
+    try:
+        start = _parse_time_arg(request.args.get('start'))
+        end = _parse_time_arg(request.args.get('end'))
+        entries = detector.export_entries(start, end, request.args.get('cursor'),
+                                          request.args.get('camera'))
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({'error': f'Bad export parameters: {e}'}), 400
+
+    name = "violations_" + datetime.now().strftime("%Y%m%d_%H%M%S") + ".tar"
+    response = Response(detector.iter_export(entries), mimetype='application/x-tar')
+    response.headers['Content-Disposition'] = f'attachment; filename="{name}"'
+    response.headers['X-Export-Count'] = str(len(entries))
+    return response
+
+@app.route('/api/events/aggregates')
+def api_event_aggregates():
+    """Counts per ?bucket=hour|day between ?start= and ?end= (default: last 7 days)"""
+    global detector
+    if detector is None:
+        return jsonify({'buckets': []})
+
+    bucket = request.args.get('bucket', 'hour')
+    if bucket not in ('hour', 'day'):
+        return jsonify({'error': 'bucket must be hour or day'}), 400
+    try:
+        start = _parse_time_arg(request.args.get('start'))
+        end = _parse_time_arg(request.args.get('end'))
+    except ValueError as e:
+        return jsonify({'error': f'Bad time: {e}'}), 400
+
+    buckets = detector.event_log.aggregate(bucket, start, end, request.args.get('camera'))
+    return jsonify({'bucket': bucket, 'buckets': buckets})
+
+@app.route('/api/events')
+def api_events():
+    """Raw detection events between ?start= and ?end= (default: last 24 hours), the
+    newest ?limit= (1 to EVENT_LOG_MAX_LIMIT, default 500)"""
+    global detector
+    if detector is None:
+        return jsonify({'events': []})
+
+    try:
+        start = _parse_time_arg(request.args.get('start'))
+        end = _parse_time_arg(request.args.get('end'))
+        limit = int(request.args.get('limit', 500))
+    except ValueError as e:
+        return jsonify({'error': f'Bad parameters: {e}'}), 400
+    if not 1 <= limit <= EVENT_LOG_MAX_LIMIT:
+        return jsonify({'error': f'limit must be between 1 and {EVENT_LOG_MAX_LIMIT}'}), 400
+
+    events = detector.event_log.read_events(start, end, request.args.get('camera'), limit)
+    return jsonify({'events': events})
+
+@app.route('/api/config', methods=['GET', 'POST'])
+def api_config():
+    """Current runtime configuration, or apply a partial change (JSON object)"""
+    global detector
+    if detector is None:
+        return jsonify({'error': 'System not initialized'}), 503
+
+    if request.method == 'GET':
+        schema = {key: {'type': kind, 'min': low, 'max': high}
+                  for key, (kind, low, high) in CONFIG_SCHEMA.items()}
+        return jsonify({'config': detector.config, 'schema': schema, 'models': list(MODELS)})
+
+    try:
+        changed, cameras = detector.apply_config(request.get_json(silent=True))
+    except ConfigError as e:
+        return jsonify({'errors': e.errors}), 400
+    return jsonify({'changed': changed, 'reconfigured_cameras': cameras,
+                    'config': detector.config})
+
+@app.route('/api/zones/<camera>', methods=['GET', 'POST'])
+def api_zones(camera):
+    """A camera's detection zones, or replace them (JSON list; [] = whole frame)"""
+    global detector
+    if detector is None:
+        return jsonify({'error': 'System not initialized'}), 503
+    cam = detector.cameras.get(camera)
+    if cam is None:
+        return jsonify({'error': f'Unknown camera: {camera}'}), 404
+
+    if request.method == 'POST':
+        zones = dict(detector.config['zones'])
+        zones[camera] = request.get_json(silent=True)
+        try:
+            detector.apply_config({'zones': zones})
+        except ConfigError as e:
+            return jsonify({'errors': e.errors}), 400
+
+    zones = detector.config['zones'].get(camera, [])
+    mask = ZoneMask(zones, *cam.size).get_stats() if zones else None
+    return jsonify({'camera': camera, 'zones': zones, 'mask': mask})
 
 def start_web_server():
     app.run(host='0.0.0.0', port=5000, threaded=True, debug=False)
@@ -1166,8 +5825,12 @@ if __name__ == "__main__":
     print(f"  OLED Display: {'✓' if ENABLE_OLED else '✗'}")
     print(f"\nSettings:")
     print(f"  Sensor inverted: {SENSOR_INVERTED}")
-    print(f"  Visual confidence: {DETECTION_CONFIDENCE}")
+    print(f"  Fused confidence: {DETECTION_CONFIDENCE} (EWMA alpha {FUSION_ALPHA})")
     print(f"  OLED address: 0x{OLED_ADDRESS:02x}")
+    print(f"  Cameras: {', '.join(c['name'] for c in CAMERAS)} "
+          f"({DETECTION_WORKERS} shared detection workers)")
+    print(f"  Detection mode: {DETECTION_MODE}"
+          + (f" ({DETECTION_PROCESSES} processes)" if DETECTION_MODE == "processes" else ""))
     print("="*50 + "\n")
 
     # Get IP address first
@@ -0,0 +1,22 @@
+"""Make the top-level scripts importable from the tests"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import smoking_detector_with_sh1106 as sd  # noqa: E402
+
+
+@pytest.fixture
+def system(tmp_path, monkeypatch):
+    """A system on one synthetic camera with every file in tmp_path, set as the web app's detector"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(sd, 'CONFIG_FILE', str(tmp_path / "config.json"))
+    system = sd.SmokingDetectionSystem(save_dir=str(tmp_path / "violations"),
+                                       cameras=[{"name": "a", "source": "synthetic"}])
+    monkeypatch.setattr(sd, 'detector', system)
+    yield system
+    system.stop()
@@ -0,0 +1,119 @@
+"""Runtime configuration validation (the /api/config write API)"""
+
+import copy
+import os
+
+import pytest
+
+import smoking_detector_with_sh1106 as sd
+
+BASE = sd.default_config()
+
+SQUARE = [[0.1, 0.1], [0.9, 0.1], [0.9, 0.9]]
+
+
+@pytest.mark.parametrize('changes, expected', [
+    ({'enable_visual': False}, {'enable_visual': False}),
+    ({'frame_skip': 3.0}, {'frame_skip': 3}),            # Whole-number float is an int
+    ({'detection_confidence': 0.7}, {'detection_confidence': 0.7}),
+    ({'alert_cooldown': 0}, {'alert_cooldown': 0.0}),
+    ({'resolution': (640, 480)}, {'resolution': [640, 480]}),
+    ({'hsv_orange_lower': [0, 0, 0], 'hsv_orange_upper': [180, 255, 255]},
+     {'hsv_orange_lower': [0, 0, 0], 'hsv_orange_upper': [180, 255, 255]}),
+    ({'person_model': None}, {'person_model': None}),
+    ({'zones': {'a': [{'type': 'exclude', 'points': [[0, 0], [1, 0], (1, 1)]}]}},
+     {'zones': {'a': [{'type': 'exclude', 'points': [[0.0, 0.0], [1.0, 0.0], [1.0, 1.0]]}]}}),
+    ({'zones': {'a': []}}, {'zones': {}}),                # No zones = whole frame
+])
+def test_valid_changes_are_normalised(changes, expected):
+    merged = sd.validate_config(changes, BASE)
+    for key, value in expected.items():
+        assert merged[key] == value
+        assert type(merged[key]) is type(value)
+    assert {k: v for k, v in merged.items() if k not in expected} == \
+        {k: v for k, v in BASE.items() if k not in expected}
+
+
+@pytest.mark.parametrize('changes, key', [
+    # Bools are not numbers and numbers are not bools
+    ({'enable_motion': 1}, 'enable_motion'),
+    ({'enable_motion': 'true'}, 'enable_motion'),
+    ({'frame_skip': True}, 'frame_skip'),
+    ({'detection_confidence': False}, 'detection_confidence'),
+    # Whole numbers, ranges
+    ({'frame_skip': 2.5}, 'frame_skip'),
+    ({'frame_skip': 0}, 'frame_skip'),
+    ({'image_quality': '80'}, 'image_quality'),
+    ({'max_images': 10 ** 9}, 'max_images'),
+    # Resolutions
+    ({'resolution': [641, 480]}, 'resolution'),
+    ({'resolution': [640, 481]}, 'resolution'),
+    ({'resolution': [100, 100]}, 'resolution'),
+    ({'resolution': [4000, 3000]}, 'resolution'),
+    ({'resolution': [640.0, 480]}, 'resolution'),
+    ({'resolution': [640]}, 'resolution'),
+    ({'resolution': "640x480"}, 'resolution'),
+    # HSV ranges
+    ({'hsv_white_lower': [0, 0, 256]}, 'hsv_white_lower'),
+    ({'hsv_white_lower': [181, 0, 0]}, 'hsv_white_lower'),
+    ({'hsv_white_lower': [0, True, 0]}, 'hsv_white_lower'),
+    ({'hsv_orange_lower': [30, 150, 150]}, 'hsv_orange_upper'),    # Lower above upper
+    ({'hsv_white_lower': [0, 0, 200], 'hsv_white_upper': [180, 30, 199]}, 'hsv_white_upper'),
+    # Models
+    ({'person_model': 'no-such-model'}, 'person_model'),
+    # Zones
+    ({'zones': []}, 'zones'),
+    ({'zones': {'a': {'type': 'include'}}}, 'zones'),
+    ({'zones': {'a': [{'type': 'keep', 'points': SQUARE}]}}, 'zones'),
+    ({'zones': {'a': [{'type': 'include', 'points': SQUARE[:2]}]}}, 'zones'),
+    ({'zones': {'a': [{'type': 'include', 'points': [[0, 0], [1.5, 0], [1, 1]]}]}}, 'zones'),
+    ({'zones': {'a': [{'type': 'include', 'points': [[0, 0], [1, 0], [1]]}]}}, 'zones'),
+    ({'zones': {'a': [{'type': 'include', 'points': [[0, 0], [True, 0], [1, 1]]}]}}, 'zones'),
+    ({'zones': {'a': [{'type': 'include'}]}}, 'zones'),
+    # Unknown keys
+    ({'resolution_x': 640}, 'resolution_x'),
+])
+def test_invalid_changes_are_rejected(changes, key):
+    with pytest.raises(sd.ConfigError) as error:
+        sd.validate_config(changes, BASE)
+    assert key in error.value.errors
+
+
+def test_every_problem_is_reported():
+    with pytest.raises(sd.ConfigError) as error:
+        sd.validate_config({'frame_skip': 0, 'enable_visual': 1, 'bogus': 1}, BASE)
+    assert set(error.value.errors) == {'frame_skip', 'enable_visual', 'bogus'}
+
+
+def test_changes_must_be_an_object():
+    for changes in (None, [], "frame_skip=2"):
+        with pytest.raises(sd.ConfigError):
+            sd.validate_config(changes, BASE)
+
+
+def test_invalid_change_leaves_the_system_unchanged(system):
+    client = sd.app.test_client()
+    before = copy.deepcopy(system.config)
+    active = system.engine.active
+    response = client.post('/api/config', json={'frame_skip': 4, 'resolution': [641, 480],
+                                                 'hsv_orange_lower': [30, 150, 150]})
+    assert response.status_code == 400
+    assert set(response.get_json()['errors']) == {'resolution', 'hsv_orange_upper'}
+    assert system.config == before
+    assert system.engine.active is active
+    assert system.cameras['a'].frame_skip == before['frame_skip']
+    assert not os.path.exists(sd.CONFIG_FILE)
+
+    response = client.post('/api/zones/a', json=[{'type': 'include', 'points': SQUARE[:2]}])
+    assert response.status_code == 400
+    assert system.config == before
+
+
+def test_valid_change_is_applied_and_saved(system):
+    client = sd.app.test_client()
+    response = client.post('/api/config', json={'frame_skip': 4, 'enable_visual': False})
+    assert response.status_code == 200
+    assert set(response.get_json()['changed']) == {'frame_skip', 'enable_visual'}
+    assert system.cameras['a'].frame_skip == 4
+    assert system.engine.active.settings['enable_visual'] is False
+    assert sd.load_config_file(sd.CONFIG_FILE, BASE) == system.config
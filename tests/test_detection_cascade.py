@@ -0,0 +1,55 @@
+"""Detection cascade: gates, early exit and the stages that still run"""
+
+import numpy as np
+
+import smoking_detector_with_sh1106 as sd
+
+
+def make_engine(scores):
+    """DetectionEngine whose stages return fixed scores and log what ran"""
+    settings = dict(sd.detector_settings(sd.default_config()), enable_sensor=False,
+                    enable_motion=True, enable_visual=True,
+                    person_model=None, cigarette_model=None)
+    engine = sd.DetectionEngine(settings=settings)
+    engine.ran = []
+
+    def run_stage(stage, frame, camera, rois=None, active=None):
+        engine.ran.append(stage)
+        return scores.get(stage, 0.0), []
+
+    engine._run_stage = run_stage
+    return engine
+
+
+def test_gate_outputs_do_not_exit_early():
+    cascade = sd.DetectionCascade()
+    assert not cascade.conclusive({'motion': (0.95, []), 'sensor': (1.0, [])})
+    assert cascade.conclusive({'motion': (0.95, []), 'person': (0.95, [])})
+
+
+def test_high_motion_still_runs_visual():
+    engine = make_engine({'motion': 0.95, 'person': 0.0, 'visual': 0.9})
+    frame = np.zeros((320, 416, 3), np.uint8)
+    _, results = engine.detect_all(frame, camera="a")
+    assert 'visual' in engine.ran
+    assert 'visual' not in results['skipped']
+    assert results['scores']['visual'] == 0.9
+    assert engine.cascade.get_stats()['early_exits'] == 0
+
+
+def test_conclusive_expensive_stage_skips_the_rest():
+    engine = make_engine({'motion': 0.95, 'person': 0.95, 'visual': 0.9})
+    engine.cascade.cost = {'person': 1.0, 'visual': 2.0}  # person runs first
+    _, results = engine.detect_all(np.zeros((320, 416, 3), np.uint8), camera="a")
+    assert engine.ran == ['motion', 'person']
+    assert 'visual' in results['skipped']
+    assert engine.cascade.get_stats()['early_exits'] == 1
+
+
+def test_quiet_scene_stops_at_the_gates():
+    engine = make_engine({'motion': 0.0})
+    frame = np.zeros((320, 416, 3), np.uint8)
+    engine.detect_all(frame, camera="a")  # First frame of a camera runs everything
+    engine.ran.clear()
+    engine.detect_all(frame, camera="a")
+    assert engine.ran == ['motion']
@@ -0,0 +1,124 @@
+"""DiskQueue: crash safety and at-least-once delivery"""
+
+import os
+
+import event_forwarding as fwd
+
+
+def records(start, count):
+    return [{'n': n, 'pad': 'x' * 10} for n in range(start, start + count)]
+
+
+def numbers(batch):
+    return [r['n'] for r in batch]
+
+
+def small_queue(path, segment_bytes=64, max_bytes=1024 * 1024):
+    """Queue with tiny segments: every append of 4 records starts a new file"""
+    queue = fwd.DiskQueue(str(path), max_bytes=max_bytes)
+    queue.SEGMENT_BYTES = segment_bytes
+    return queue
+
+
+def test_round_trip(tmp_path):
+    queue = fwd.DiskQueue(str(tmp_path))
+    queue.append(records(0, 5))
+    assert queue.pending == 5
+    batch, position = queue.peek(3)
+    assert numbers(batch) == [0, 1, 2]
+    assert queue.pending == 5  # Not delivered until acked
+    queue.ack(position)
+    assert queue.pending == 2
+    batch, _ = queue.peek(10)
+    assert numbers(batch) == [3, 4]
+
+
+def test_torn_append_is_cut_on_reopen(tmp_path):
+    queue = fwd.DiskQueue(str(tmp_path))
+    queue.append(records(0, 3))
+    segment = queue._path(queue.segments[-1])
+    with open(segment, 'ab') as f:
+        f.write(b'{"n": 3, "half')  # Power cut in the middle of a record
+
+    queue = fwd.DiskQueue(str(tmp_path))
+    assert queue.pending == 3
+    with open(segment, 'rb') as f:
+        assert f.read().endswith(b'}\n')
+    queue.append(records(3, 1))
+    batch, position = queue.peek(10)
+    assert numbers(batch) == [0, 1, 2, 3]
+    assert position[2] == 4
+    assert queue.corrupt == 0
+
+
+def test_cursor_survives_restart_after_partial_consume(tmp_path):
+    queue = small_queue(tmp_path)
+    queue.append(records(0, 4))
+    queue.append(records(4, 4))
+    assert len(queue.segments) == 2
+    batch, position = queue.peek(5)  # Ends inside the second segment
+    queue.ack(position)
+
+    queue = fwd.DiskQueue(str(tmp_path))
+    assert queue.pending == 3
+    batch, _ = queue.peek(10)
+    assert numbers(batch) == [5, 6, 7]
+    assert len(queue.segments) == 1  # The consumed segment was deleted
+
+
+def test_unacked_batch_is_delivered_again(tmp_path):
+    queue = fwd.DiskQueue(str(tmp_path))
+    queue.append(records(0, 4))
+    queue.ack(queue.peek(2)[1])
+    queue.peek(2)  # Sent, but the process died before the ack
+
+    queue = fwd.DiskQueue(str(tmp_path))
+    assert queue.pending == 2
+    assert numbers(queue.peek(10)[0]) == [2, 3]
+
+
+def test_oldest_segments_are_dropped_beyond_max_bytes(tmp_path):
+    queue = small_queue(tmp_path, max_bytes=300)
+    for start in range(0, 40, 4):
+        queue.append(records(start, 4))
+    assert queue.size <= 300
+    assert queue.size == sum(os.path.getsize(queue._path(s)) for s in queue.segments)
+    assert queue.dropped + queue.pending == 40
+    batch, _ = queue.peek(100)
+    assert len(batch) == queue.pending
+    assert numbers(batch) == list(range(40 - len(batch), 40))  # Newest kept, in order
+
+    queue = fwd.DiskQueue(str(tmp_path), max_bytes=300)
+    assert numbers(queue.peek(100)[0]) == numbers(batch)
+
+
+def test_ack_after_its_segment_was_dropped(tmp_path):
+    queue = small_queue(tmp_path, max_bytes=300)
+    queue.append(records(0, 4))
+    queue.append(records(4, 4))
+    batch, position = queue.peek(6)  # Spans both segments
+    for start in range(8, 24, 4):  # Meanwhile the oldest segments are dropped
+        queue.append(records(start, 4))
+    cursor = queue.cursor
+    queue.ack(position)
+    assert queue.cursor >= cursor  # Never moves back onto a dropped segment
+    remaining = numbers(queue.peek(100)[0])
+    assert queue.pending == len(remaining)
+    assert remaining == sorted(set(remaining)) and remaining[-1] == 23
+
+    queue = fwd.DiskQueue(str(tmp_path), max_bytes=300)
+    assert numbers(queue.peek(100)[0]) == remaining
+    assert queue.pending == len(remaining)
+
+
+def test_corrupt_line_is_skipped_and_counted(tmp_path):
+    queue = fwd.DiskQueue(str(tmp_path))
+    queue.append(records(0, 1))
+    with open(queue._path(queue.segments[-1]), 'ab') as f:
+        f.write(b'not json\n')
+    queue.append(records(1, 1))
+    batch, position = queue.peek(10)
+    assert numbers(batch) == [0, 1]
+    assert queue.corrupt == 1
+    queue.ack(position)
+    assert queue.pending == 0
@@ -0,0 +1,151 @@
+"""DuplicateIndex: near-duplicate threshold, window, size cap and rebuild from sidecars"""
+
+import json
+import os
+
+import numpy as np
+import pytest
+
+import smoking_detector_with_sh1106 as sd
+
+SIZE = sd.DEDUP_HASH_SIZE
+
+
+def pattern(seed):
+    """Random dHash bit pattern"""
+    return np.random.default_rng(seed).random((SIZE, SIZE)) > 0.5
+
+
+def flip(bits, count):
+    """The pattern with its first count bits inverted"""
+    flipped = bits.copy().ravel()
+    flipped[:count] = ~flipped[:count]
+    return flipped.reshape(bits.shape)
+
+
+def frame_for(bits, scale=8):
+    """BGR frame whose dHash is exactly bits: every cell is a flat block brighter
+    or darker than its left neighbour"""
+    steps = np.where(bits, 4, -4)
+    small = np.hstack([np.full((SIZE, 1), 128), 128 + np.cumsum(steps, axis=1)]).astype(np.uint8)
+    grey = np.kron(small, np.ones((scale, scale), np.uint8))
+    return np.repeat(grey[:, :, None], 3, axis=2)
+
+
+@pytest.fixture
+def index():
+    return sd.DuplicateIndex(enabled=True, max_distance=24, window=300, size=4)
+
+
+def test_hash_of_synthetic_frames(index):
+    bits = pattern(0)
+    assert np.array_equal(index.hash(frame_for(bits)), np.packbits(bits))
+    distance = index.POPCOUNT[index.hash(frame_for(bits)) ^ index.hash(frame_for(flip(bits, 10)))]
+    assert distance.sum() == 10
+
+
+def test_near_duplicate_threshold(index):
+    bits = pattern(1)
+    relname, _, phash = index.match('a', frame_for(bits), now=1000)
+    assert relname is None
+    index.add('a', 'a/1.jpg', phash, now=1000)
+
+    assert index.match('a', frame_for(flip(bits, 24)), now=1001)[:2] == ('a/1.jpg', 24)
+    assert index.match('a', frame_for(flip(bits, 25)), now=1002)[0] is None
+    assert index.match('b', frame_for(bits), now=1003)[0] is None  # Per camera
+    assert index.get_stats()['duplicates'] == 1
+    assert index.get_stats()['checked'] == 4
+
+
+def test_closest_image_wins(index):
+    bits = pattern(2)
+    index.add('a', 'a/far.jpg', np.packbits(flip(bits, 20)), now=1000)
+    index.add('a', 'a/near.jpg', np.packbits(flip(bits, 3)), now=1000)
+    assert index.match('a', frame_for(bits), now=1001)[:2] == ('a/near.jpg', 3)
+
+
+def test_window_expires_and_occurrences_extend_it(index):
+    bits = pattern(3)
+    index.add('a', 'a/1.jpg', np.packbits(bits), now=1000)
+    assert index.match('a', frame_for(bits), now=1250)[0] == 'a/1.jpg'
+    # The match at 1250 restarted the window
+    assert index.match('a', frame_for(bits), now=1500)[0] == 'a/1.jpg'
+    assert index.match('a', frame_for(bits), now=1801)[0] is None
+
+
+def test_size_cap_per_camera(index):
+    for i in range(6):
+        index.add('a', f'a/{i}.jpg', np.packbits(pattern(10 + i)), now=1000 + i)
+    index.add('b', 'b/0.jpg', np.packbits(pattern(20)), now=1000)
+    assert index.cameras['a'][2] == ['a/2.jpg', 'a/3.jpg', 'a/4.jpg', 'a/5.jpg']
+    assert index.get_stats()['indexed'] == 5
+    assert index.match('a', frame_for(pattern(10)), now=1010)[0] is None  # Dropped out
+    assert index.match('a', frame_for(pattern(15)), now=1010)[0] == 'a/5.jpg'
+
+
+def test_remove(index):
+    index.add('a', 'a/1.jpg', np.packbits(pattern(4)), now=1000)
+    index.add('a', 'a/2.jpg', np.packbits(pattern(5)), now=1000)
+    index.remove('a/1.jpg')
+    index.remove('a/missing.jpg')
+    assert index.cameras['a'][2] == ['a/2.jpg']
+    assert index.match('a', frame_for(pattern(4)), now=1001)[0] is None
+    assert index.match('a', frame_for(pattern(5)), now=1001)[0] == 'a/2.jpg'
+
+
+def test_disabled_index_never_matches():
+    index = sd.DuplicateIndex(enabled=False)
+    bits = pattern(6)
+    index.add('a', 'a/1.jpg', np.packbits(bits), now=1000)
+    assert index.match('a', frame_for(bits), now=1001)[0] is None
+
+
+def write_violation(directory, relname, sidecar, mtime):
+    """Image and sidecar as save_violation() leaves them; the sidecar gets mtime"""
+    path = os.path.join(directory, *relname.split('/'))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'jpeg')
+    with open(path[:-4] + '.json', 'w') as f:
+        f.write(sidecar if isinstance(sidecar, str) else json.dumps(sidecar))
+    os.utime(path[:-4] + '.json', (mtime, mtime))
+    return relname, path, mtime, 4
+
+
+def test_load_rebuilds_newest_images_per_camera(tmp_path, index):
+    now = 1_700_000_000
+    files = [write_violation(tmp_path, f'a/{i}.jpg',
+                             {'camera': 'a', 'phash': np.packbits(pattern(30 + i)).tobytes().hex()},
+                             now - 100 + i)
+             for i in range(6)]
+    files.append(write_violation(tmp_path, 'b/0.jpg',
+                                 {'phash': np.packbits(pattern(40)).tobytes().hex()}, now - 400))
+    files.append(write_violation(tmp_path, 'b/old.jpg', {'camera': 'b'}, now))  # No hash yet
+    files.append(write_violation(tmp_path, 'b/short.jpg', {'phash': 'abcd'}, now))
+    files.append(write_violation(tmp_path, 'b/torn.jpg', '{"phash": "ab', now))
+
+    assert index.load(files) == 5
+    hashes, last_seen, names = index.cameras['a']
+    assert names == ['a/2.jpg', 'a/3.jpg', 'a/4.jpg', 'a/5.jpg']  # Newest size, oldest first
+    assert last_seen.tolist() == [now - 98, now - 97, now - 96, now - 95]
+    assert index.cameras['b'][2] == ['b/0.jpg']
+
+    # Matching works as before the restart, and the window counts from the mtime
+    assert index.match('a', frame_for(pattern(33)), now=now)[0] == 'a/3.jpg'
+    assert index.match('b', frame_for(pattern(40)), now=now)[0] is None  # 400 s > window
+    assert index.match('a', frame_for(pattern(30)), now=now)[0] is None  # Not among the newest
+
+
+def test_system_startup_seeds_the_index(tmp_path, monkeypatch):
+    save_dir = tmp_path / "violations"
+    bits = pattern(50)
+    now = 1_700_000_000
+    write_violation(save_dir, 'a/1.jpg', {'phash': np.packbits(bits).tobytes().hex()}, now)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(sd, 'CONFIG_FILE', str(tmp_path / "config.json"))
+    system = sd.SmokingDetectionSystem(save_dir=str(save_dir), max_images=1000,
+                                       cameras=[{"name": "a", "source": "synthetic"}])
+    try:
+        assert system.duplicates.match('a', frame_for(bits), now=now + 10)[:2] == ('a/1.jpg', 0)
+    finally:
+        system.stop()
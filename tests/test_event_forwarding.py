@@ -0,0 +1,99 @@
+"""EventForwarder against a local webhook: delivery, rejection, restart, and no heavy imports"""
+
+import json
+import os
+import subprocess
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import event_forwarding as fwd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Receiver(BaseHTTPRequestHandler):
+    """Answers server.status and records the event ids of every 2xx batch"""
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        status = self.server.status
+        if 200 <= status < 300:
+            self.server.received.extend(e['id'] for e in body['events'])
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def receiver():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Receiver)
+    server.status = 200
+    server.received = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def forwarder(receiver, directory):
+    config = {'name': 'hook', 'type': 'webhook',
+              'url': f"http://127.0.0.1:{receiver.server_address[1]}/events"}
+    return fwd.EventForwarder([config], directory=str(directory), batch_size=4,
+                              batch_latency=0.05, backoff_min=0.05, backoff_max=0.2, timeout=2)
+
+
+def put_events(forwarder, count):
+    for n in range(count):
+        forwarder.put({'camera': 'a', 'n': n})
+
+
+def test_imports_without_camera_gpio_or_web_packages():
+    blocked = ['flask', 'werkzeug', 'cv2', 'numpy', 'PIL', 'picamera2', 'RPi', 'luma']
+    code = ("import sys\n"
+            f"sys.modules.update(dict.fromkeys({blocked!r}))\n"
+            "import event_forwarding\n"
+            "print(sorted(event_forwarding.FORWARD_SINK_TYPES))")
+    out = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True)
+    assert out.returncode == 0, out.stderr
+    assert out.stdout.strip() == "['fleet', 'mqtt', 'webhook']"
+
+
+def test_events_are_delivered_once(receiver, tmp_path):
+    f = forwarder(receiver, tmp_path)
+    put_events(f, 10)
+    assert f.drain(5)
+    f.close()
+    assert len(receiver.received) == len(set(receiver.received)) == 10
+    stats = f.get_stats()['sinks'][0]
+    assert stats['sent'] == 10 and stats['queued'] == 0
+
+
+def test_rejected_batch_is_dropped(receiver, tmp_path):
+    receiver.status = 400
+    f = forwarder(receiver, tmp_path)
+    put_events(f, 3)
+    assert f.drain(5)
+    f.close()
+    stats = f.get_stats()['sinks'][0]
+    assert stats['rejected'] == 3 and stats['sent'] == 0
+
+
+def test_queue_survives_a_restart(receiver, tmp_path):
+    receiver.status = 503
+    f = forwarder(receiver, tmp_path)
+    put_events(f, 6)
+    assert not f.drain(0.3)
+    f.close()
+    assert receiver.received == []
+
+    receiver.status = 200
+    f = forwarder(receiver, tmp_path)
+    assert f.drain(5)
+    f.close()
+    assert len(set(receiver.received)) == 6
@@ -0,0 +1,143 @@
+"""EventLog: columnar round trip, torn-append repair and buffered reads"""
+
+import os
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+import smoking_detector_with_sh1106 as sd
+
+
+@pytest.fixture
+def open_log(tmp_path):
+    """Open EventLogs on tmp_path whose flush thread never fires; all closed afterwards"""
+    logs = []
+
+    def open_log():
+        log = sd.EventLog(str(tmp_path), min_interval=0.0, flush_interval=3600)
+        logs.append(log)
+        return log
+
+    yield open_log
+    for log in logs:
+        log.running = False
+
+
+def result(visual=0.9, boxes=(), motion=0.2):
+    return {'sensor': False, 'motion': motion >= 0.5, 'visual': visual >= 0.5,
+            'scores': {'sensor': 0.0, 'person': 0.0, 'motion': motion, 'visual': visual},
+            'confidence': visual, 'boxes': [list(b) for b in boxes]}
+
+
+def record_rows(log, count, start, camera='a'):
+    """count rows one second apart, row i with i boxes (at most 3)"""
+    for i in range(count):
+        boxes = [(i, 2 * i, 10, 20)] * (i % 4)
+        log.record(camera, True, result(0.5 + i / 100, boxes), alert=i == 0,
+                   timestamp=start + i)
+
+
+def today(hour=1):
+    """A time early today, so every row of a test lands in one day partition"""
+    return datetime.now().replace(hour=hour, minute=0, second=0, microsecond=0).timestamp()
+
+
+def window(start):
+    return dict(start=start - 1, end=start + 3600)
+
+
+def test_round_trip(open_log):
+    start = today()
+    log = open_log()
+    record_rows(log, 5, start)
+    log.record('b', False, result(0.6, [(1, 2, 3, 4)], motion=0.8), timestamp=start + 10)
+    log.flush()
+    events = log.read_events(**window(start))
+    assert len(events) == 6
+    first = events[0]
+    assert first['camera'] == 'a' and first['alert'] and first['detected'] and first['visual']
+    assert first['confidence'] == round(round(0.5 * 255) / 255, 3)
+    assert [len(e['boxes']) for e in events[:5]] == [0, 1, 2, 3, 0]
+    assert events[3]['boxes'] == [[3, 6, 10, 20]] * 3
+    last = events[-1]
+    assert last['camera'] == 'b' and not last['detected'] and last['motion']
+    assert last['boxes'] == [[1, 2, 3, 4]]
+    assert log.read_events(camera='b', **window(start)) == [last]
+    assert log.get_stats()['rows_written'] == 6
+
+    # Reopened, the rows and the aggregates come back from disk
+    reopened = open_log()
+    assert reopened.read_events(**window(start)) == events
+    assert reopened.totals()['events'] == 6
+    assert reopened.totals()['alerts'] == 1
+
+
+def test_identical_outcomes_are_thinned(tmp_path):
+    log = sd.EventLog(str(tmp_path), min_interval=5.0, flush_interval=3600)
+    start = today()
+    for i in range(4):
+        log.record('a', True, result(), timestamp=start + i)
+    log.running = False
+    assert len(log.read_events(**window(start))) == 1
+    assert log.get_stats()['thinned'] == 3
+    assert log.totals()['events'] == 4  # Aggregates still count every outcome
+
+
+def test_torn_append_is_repaired_on_reopen(open_log):
+    start = today()
+    log = open_log()
+    record_rows(log, 6, start)
+    log.flush()
+    part = os.path.join(log.directory, datetime.fromtimestamp(start).strftime("%Y%m%d"))
+    # Crash after t_ms was appended in full but visual only half-way
+    with open(os.path.join(part, 't_ms.col'), 'ab') as f:
+        f.write(b'\x01\x02\x03\x04')
+    os.truncate(os.path.join(part, 'visual.col'), 5)
+    expected = log.read_events(**window(start))[:5]
+
+    reopened = open_log()
+    for name, dtype in sd.EventLog.COLUMNS:
+        size = os.path.getsize(os.path.join(part, name + '.col'))
+        assert size == 5 * sd.np.dtype(dtype).itemsize, name
+    assert os.path.getsize(os.path.join(part, 'boxes.col')) == (0 + 1 + 2 + 3 + 0) * 8
+    assert reopened.read_events(**window(start)) == expected
+
+    # Rows appended after the repair line up with the earlier ones
+    reopened.record('a', True, result(0.7, [(9, 9, 9, 9)]), timestamp=start + 100)
+    reopened.flush()
+    events = reopened.read_events(**window(start))
+    assert events[:5] == expected
+    assert events[5]['boxes'] == [[9, 9, 9, 9]]
+    assert events[5]['scores']['visual'] == round(round(0.7 * 255) / 255, 3)
+
+
+def test_read_merges_unflushed_rows(open_log):
+    start = today()
+    log = open_log()
+    record_rows(log, 3, start)
+    log.flush()
+    record_rows(log, 3, start + 50, camera='b')
+    assert log.get_stats()['buffered'] == 3
+
+    events = log.read_events(**window(start))
+    assert [e['camera'] for e in events] == ['a'] * 3 + ['b'] * 3
+    assert [len(e['boxes']) for e in events] == [0, 1, 2, 0, 1, 2]
+    assert log.get_stats()['buffered'] == 3  # Reading does not flush
+
+    log.flush()
+    assert log.read_events(**window(start)) == events
+    assert log.read_events(limit=2, **window(start)) == events[-2:]
+
+
+def test_api_limit_is_bounded(open_log, monkeypatch):
+    log = open_log()
+    start = today()
+    record_rows(log, 3, start)
+    monkeypatch.setattr(sd, 'detector', SimpleNamespace(event_log=log))
+    client = sd.app.test_client()
+    query = f"start={start - 1}&end={start + 3600}"
+    assert len(client.get(f"/api/events?{query}&limit=2").get_json()['events']) == 2
+    for limit in ('0', '-1', str(sd.EVENT_LOG_MAX_LIMIT + 1), 'x'):
+        assert client.get(f"/api/events?{query}&limit={limit}").status_code == 400
+    assert log.read_events(start - 1, start + 3600, limit=0) == []
@@ -0,0 +1,84 @@
+"""Violation export: tar stream, resume cursor and its ordering"""
+
+import io
+import json
+import os
+import tarfile
+
+import smoking_detector_with_sh1106 as sd
+
+BASE_NS = 1_700_000_000_123_456_789  # Nanosecond mtimes a float cannot hold exactly
+
+
+def add_image(system, relname, mtime_ns):
+    """A saved violation (image + sidecar) with a given mtime"""
+    path = os.path.join(system.save_dir, *relname.split('/'))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(relname.encode() * 10)
+    with open(path[:-4] + '.json', 'w') as f:
+        json.dump({'camera': relname.split('/')[0], 'confidence': 0.9}, f)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def export(client, query=""):
+    """(image names, metadata members) of one /api/export download"""
+    response = client.get(f"/api/export{query}")
+    assert response.status_code == 200
+    archive = tarfile.open(fileobj=io.BytesIO(response.data))
+    names, metadata = [], []
+    for member in archive.getmembers():
+        if member.name.endswith('.jpg'):
+            names.append(member.name)
+        elif member.name != 'manifest.jsonl':
+            metadata.append(json.load(archive.extractfile(member)))
+    assert int(response.headers['X-Export-Count']) == len(names)
+    return names, metadata
+
+
+def test_resume_from_the_middle(system):
+    # Ties on mtime across cameras, and mtimes 1 ns apart
+    add_image(system, 'a/20240101_000001.jpg', BASE_NS)
+    add_image(system, 'b/20240101_000001.jpg', BASE_NS)
+    add_image(system, 'c/20240101_000001.jpg', BASE_NS)
+    add_image(system, 'a/20240101_000002.jpg', BASE_NS + 1)
+    add_image(system, 'b/20240101_000002.jpg', BASE_NS + 1_000)
+    add_image(system, 'a/20240101_000003.jpg', BASE_NS + 5_000_000_000)
+    client = sd.app.test_client()
+
+    names, metadata = export(client)
+    mtimes = {n: os.stat(os.path.join(system.save_dir, n)).st_mtime for n in names}
+    assert len(names) == 6
+    assert names == sorted(names, key=lambda n: (mtimes[n], n))
+    assert names[:2] == ['a/20240101_000001.jpg', 'a/20240101_000002.jpg']  # Same float mtime
+    assert [m['file'] for m in metadata] == names
+
+    for i in range(len(names)):
+        cursor = metadata[i]['resume_cursor']
+        rest, _ = export(client, f"?cursor={cursor}")
+        assert rest == names[i + 1:], f"resuming after {names[i]}"
+
+
+def test_cursor_round_trip():
+    mtime = os.stat(__file__).st_mtime
+    for relname in ('a/x.jpg', 'cam|with|bars/y.jpg'):
+        token = sd.SmokingDetectionSystem.make_export_cursor(mtime, relname)
+        assert sd.SmokingDetectionSystem.parse_export_cursor(token) == (mtime, relname)
+
+
+def test_camera_filter_and_cursor(system):
+    for i in range(4):
+        add_image(system, f'a/2024010{i}.jpg', BASE_NS + i)
+        add_image(system, f'b/2024010{i}.jpg', BASE_NS + i)
+    client = sd.app.test_client()
+    names, metadata = export(client, "?camera=b")
+    assert names == [f'b/2024010{i}.jpg' for i in range(4)]
+    rest, _ = export(client, f"?camera=b&cursor={metadata[1]['resume_cursor']}")
+    assert rest == names[2:]
+
+
+def test_garbage_cursor_is_rejected(system):
+    client = sd.app.test_client()
+    for cursor in ('not-a-cursor', '!!!', 'bm9waXBl', '%FF%FE', 'eHh8YS9iLmpwZw=='):
+        response = client.get(f"/api/export?cursor={cursor}")
+        assert response.status_code == 400, cursor
@@ -0,0 +1,84 @@
+"""Fleet aggregator HELLO validation: bad node names and intervals are refused"""
+
+import json
+import socket
+import time
+
+import pytest
+
+import event_forwarding as fwd
+import fleet_aggregator as fa
+from framing import pack_frame
+
+
+@pytest.fixture
+def ingest(tmp_path):
+    """A store and an ingest server on a free local port"""
+    store = fa.FleetStore(str(tmp_path / "fleet.db"))
+    server = fa.start_ingest(store, '127.0.0.1', 0)
+    yield store, server
+    server.shutdown()
+    server.close_connections()
+    server.server_close()
+    store.close()
+
+
+def hello(server, **fields):
+    """Send a HELLO; True if the aggregator kept the connection open"""
+    sock = socket.create_connection(server.server_address, timeout=2)
+    try:
+        payload = json.dumps(dict({'node': 'lobby-1', 'protocol': 1, 'interval': 10.0},
+                                  **fields)).encode()
+        sock.sendall(pack_frame(fa.HELLO, payload))
+        sock.settimeout(0.5)
+        try:
+            return sock.recv(1) != b''
+        except socket.timeout:
+            return True
+    finally:
+        sock.close()
+
+
+def wait_for_nodes(store, count):
+    deadline = time.time() + 2
+    while time.time() < deadline and len(store.nodes()) < count:
+        time.sleep(0.05)
+    return store.nodes()
+
+
+@pytest.mark.parametrize('fields', [
+    {'node': '<script>x</script>'},
+    {'node': 5},
+    {'node': 'x' * 65},
+    {'interval': None},
+    {'interval': '10'},
+    {'interval': True},
+    {'interval': 0},
+    {'interval': -5},
+    {'interval': fa.MAX_NODE_INTERVAL + 1},
+    {'interval': float('nan')},
+    {'interval': float('inf')},
+])
+def test_bad_hello_is_refused(ingest, fields):
+    store, server = ingest
+    assert not hello(server, **fields)
+    assert store.nodes() == []
+
+
+@pytest.mark.parametrize('interval', [0.5, 10, fa.MAX_NODE_INTERVAL])
+def test_good_hello_registers_the_node(ingest, interval):
+    store, server = ingest
+    assert hello(server, interval=interval)
+    nodes = wait_for_nodes(store, 1)
+    assert [n['node'] for n in nodes] == ['lobby-1']
+    assert nodes[0]['interval'] == interval
+
+
+def test_fleet_sink_refuses_what_the_aggregator_would():
+    forwarder = type('Forwarder', (), {'device': 'host'})()
+    assert fwd.FLEET_MAX_INTERVAL == fa.MAX_NODE_INTERVAL
+    with pytest.raises(ValueError):
+        fwd.FleetSink({'name': 'f', 'type': 'fleet', 'host': 'x', 'node': 'bad name'}, forwarder)
+    for interval in (0, -1, fwd.FLEET_MAX_INTERVAL + 1, 'nan'):
+        with pytest.raises(ValueError):
+            fwd.FleetSink({'name': 'f', 'type': 'fleet', 'host': 'x', 'interval': interval}, forwarder)
@@ -0,0 +1,69 @@
+"""framing: frames round-trip over a socket, short reads, closed peers, oversized frames"""
+
+import socket
+import threading
+
+import pytest
+
+from framing import pack_frame, read_frame, recv_exactly
+
+
+@pytest.fixture
+def pair():
+    a, b = socket.socketpair()
+    yield a, b
+    a.close()
+    b.close()
+
+
+def test_frames_round_trip(pair):
+    a, b = pair
+    a.sendall(pack_frame(1, b'hello') + pack_frame(2, b''))
+    assert read_frame(b) == (1, b'hello')
+    assert read_frame(b) == (2, b'')
+
+
+def test_split_writes_are_reassembled(pair):
+    a, b = pair
+    data = pack_frame(3, bytes(range(200)))
+
+    def trickle():
+        for i in range(0, len(data), 7):
+            a.sendall(data[i:i + 7])
+
+    writer = threading.Thread(target=trickle)
+    writer.start()
+    assert read_frame(b) == (3, bytes(range(200)))
+    writer.join()
+
+
+def test_closed_peer_raises(pair):
+    a, b = pair
+    a.sendall(pack_frame(1, b'hello')[:7])
+    a.close()
+    with pytest.raises(ConnectionError, match="closed by node"):
+        read_frame(b, peer="node")
+
+
+def test_oversized_frame_is_refused(pair):
+    a, b = pair
+    a.sendall(pack_frame(1, b'x' * 100))
+    with pytest.raises(ValueError):
+        read_frame(b, max_size=99)
+
+
+def test_timeout_raises_unless_idle(pair):
+    a, b = pair
+    b.settimeout(0.05)
+    with pytest.raises(socket.timeout):
+        recv_exactly(b, 1)
+    waits = []
+
+    def idle():
+        waits.append(1)
+        if len(waits) == 3:
+            a.sendall(b'z')
+        return True
+
+    assert recv_exactly(b, 1, idle=idle) == b'z'
+    assert len(waits) == 3